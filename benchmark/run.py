@@ -0,0 +1,273 @@
+import argparse
+import json
+import logging
+import math
+import multiprocessing
+import platform
+import queue
+import resource
+import sys
+import time
+from typing import Any, Callable, Dict, List, Optional, Sequence, cast
+
+from benchmark.server import WikiServer
+from benchmark.site import SyntheticSite
+from scraper.graph.base_objects import EntityType, Url
+from scraper.spider.async_runner import AsyncSpiderRunner
+from scraper.spider.extract import PageRecord
+from scraper.spider.fetcher import FETCHERS
+from scraper.spider.spider_runner import SpiderRunner
+from scraper.spider.stream_extract import EXTRACTORS
+
+logger = logging.getLogger('Web-Scraper')
+
+# Bumped when the layout of the report changes
+REPORT_VERSION = 1
+
+
+def percentiles(values: Sequence[float],
+                points: Sequence[int] = (50, 95, 99)) -> Dict[str, float]:
+    """
+    Nearest rank percentiles
+    Args:
+        values: The samples, in seconds
+        points: The percentiles to compute
+
+    Returns:
+        p50, p95... in milliseconds, 0 if there are no samples
+    """
+    ordered = sorted(values)
+    result = {}
+    for point in points:
+        value = 0.0
+        if ordered:
+            rank = max(0, math.ceil(point / 100 * len(ordered)) - 1)
+            value = ordered[rank]
+        result['p%d' % point] = round(value * 1000, 3)
+    return result
+
+
+def peak_rss_mb() -> float:
+    """
+    Highest resident set size of this process so far
+    """
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Bytes on macOS, kilobytes elsewhere
+    if sys.platform == 'darwin':
+        peak //= 1024
+    return round(peak / 1024, 1)
+
+
+class TimedExtractor:
+    """
+    Record how long each page takes to extract
+    """
+
+    def __init__(self, extractor: Callable[[Url, bytes], PageRecord]) -> None:
+        self.extractor = extractor
+        self.latencies: List[float] = []
+
+    def __call__(self, url: Url, content: bytes) -> PageRecord:
+        start = time.perf_counter()
+        record = self.extractor(url, content)
+        self.latencies.append(time.perf_counter() - start)
+        return record
+
+
+def crawl(base_url: str, start_url: str, concurrency: int,
+          fetcher: str = 'pooled', extractor: str = 'soup',
+          actor_limit: int = -1, movie_limit: int = -1) -> Dict[str, Any]:
+    """
+    Crawl a site once and measure it
+    Args:
+        base_url: The site
+        start_url: The movie to start from
+        concurrency: Pages in flight. 0 uses the sequential SpiderRunner
+        fetcher: Name of the fetcher, see FETCHERS
+        extractor: Name of the extractor, see EXTRACTORS
+        actor_limit: Actor limit of the spider
+        movie_limit: Movie limit of the spider
+
+    Returns:
+        The measurements of the run
+    """
+    timed_extractor = TimedExtractor(EXTRACTORS[extractor])
+    options: Dict[str, Any] = {'actor_limit': actor_limit,
+                               'movie_limit': movie_limit,
+                               'fetcher': FETCHERS[fetcher](),
+                               'base_url': base_url,
+                               'extractor': timed_extractor}
+    if concurrency > 0:
+        spider: SpiderRunner = AsyncSpiderRunner(
+            cast(Url, start_url), concurrency=concurrency,
+            per_host=concurrency, **options)
+    else:
+        spider = SpiderRunner(cast(Url, start_url), **options)
+    start = time.perf_counter()
+    spider.run()
+    elapsed = time.perf_counter() - start
+    spider.fetcher.close()
+    stats = spider.fetcher.stats
+    return {'concurrency': concurrency,
+            'seconds': round(elapsed, 3),
+            'pages': spider.pages_fetched,
+            'pages_per_sec': round(spider.pages_fetched / elapsed, 2),
+            'requests': stats.requests + stats.errors,
+            'errors': stats.errors,
+            'movies': spider.graph.num_node(EntityType.MOVIE),
+            'actors': spider.graph.num_node(EntityType.ACTOR),
+            'fetch_latency_ms': percentiles(stats.latencies),
+            'parse_latency_ms': percentiles(timed_extractor.latencies),
+            'peak_rss_mb': peak_rss_mb()}
+
+
+def _crawl_process(results: Any, *args: Any) -> None:
+    results.put(crawl(*args))
+
+
+def _wait_for_run(results: Any, process: multiprocessing.Process,
+                  timeout: float,
+                  poll_interval: float = 1.0) -> Dict[str, Any]:
+    """
+    Wait for the report of a crawl process
+    Args:
+        results: The queue the process puts its report on
+        process: The crawl process
+        timeout: Seconds before the crawl is terminated. 0 waits forever
+        poll_interval: Seconds between checks of the process
+
+    Returns:
+        The report of the run, or the error of a run that crashed or
+        timed out
+    """
+    deadline = time.perf_counter() + timeout
+    while True:
+        try:
+            return results.get(timeout=poll_interval)
+        except queue.Empty:
+            pass
+        if process.exitcode is not None:
+            try:
+                # The report may have been sent right before the exit
+                return results.get(timeout=poll_interval)
+            except queue.Empty:
+                return {'error': 'exit code %d' % process.exitcode}
+        if timeout > 0 and time.perf_counter() > deadline:
+            process.terminate()
+            return {'error': 'timed out after %ds' % timeout}
+
+
+def run_benchmark(site: SyntheticSite, concurrency: Sequence[int],
+                  latency: float = 0.0, jitter: float = 0.0,
+                  error_rate: float = 0.0, fetcher: str = 'pooled',
+                  extractor: str = 'soup', actor_limit: int = -1,
+                  movie_limit: int = -1,
+                  timeout: float = 3600.0) -> Dict[str, Any]:
+    """
+    Crawl a synthetic site at several concurrency settings.
+
+    Each crawl runs in a fresh process, so that its peak RSS is its own.
+    Args:
+        site: The site to serve
+        concurrency: The settings to run, see crawl
+        latency: Seconds the server waits before each response
+        jitter: Random variation of the latency, in seconds
+        error_rate: Fraction of the requests answered 503
+        fetcher: Name of the fetcher, see FETCHERS
+        extractor: Name of the extractor, see EXTRACTORS
+        actor_limit: Actor limit of the spider
+        movie_limit: Movie limit of the spider
+        timeout: Seconds a crawl may take before it is terminated and
+            reported as failed. 0 waits forever
+
+    Returns:
+        The report, ready to be dumped as json. A failed run only has its
+        concurrency and an error
+    """
+    runs = []
+    with WikiServer(site, latency, jitter, error_rate) as server:
+        for setting in concurrency:
+            results: Any = multiprocessing.Queue()
+            process = multiprocessing.Process(
+                target=_crawl_process,
+                args=(results, server.base_url, site.start_url, setting,
+                      fetcher, extractor, actor_limit, movie_limit))
+            requests = server.requests
+            process.start()
+            run = _wait_for_run(results, process, timeout)
+            process.join()
+            if 'error' in run:
+                logger.error('concurrency %d failed: %s'
+                             % (setting, run['error']))
+                runs.append({'concurrency': setting, 'error': run['error']})
+                continue
+            run['server_requests'] = server.requests - requests
+            runs.append(run)
+            logger.info('concurrency %d: %.1f pages/s'
+                        % (setting, run['pages_per_sec']))
+        server_options = server.describe()
+    return {'version': REPORT_VERSION,
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpus': multiprocessing.cpu_count(),
+            'site': site.describe(),
+            'server': server_options,
+            'fetcher': fetcher,
+            'extractor': extractor,
+            'runs': runs}
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser('Crawl benchmark')
+    parser.add_argument('-o', '--out', type=str,
+                        help='Path to save the json report. Printed if not '
+                             'given')
+    parser.add_argument('--movies', type=int, default=500,
+                        help='Number of movies of the site')
+    parser.add_argument('--actors', type=int, default=1000,
+                        help='Number of actors of the site')
+    parser.add_argument('--cast-size', type=int, default=12,
+                        help='Number of actors of each movie')
+    parser.add_argument('--page-size', type=int, default=60000,
+                        help='Approximate size of a page in bytes')
+    parser.add_argument('--seed', type=int, default=0,
+                        help='Seed the site is generated from')
+    parser.add_argument('-c', '--concurrency', type=int, nargs='+',
+                        default=[0, 4, 16],
+                        help='Concurrency settings to run. 0 is the '
+                             'sequential spider')
+    parser.add_argument('--latency', type=float, default=0.02,
+                        help='Seconds the server waits before a response')
+    parser.add_argument('--jitter', type=float, default=0.01,
+                        help='Random variation of the latency in seconds')
+    parser.add_argument('--error-rate', type=float, default=0.0,
+                        help='Fraction of the requests answered 503')
+    parser.add_argument('--fetcher', choices=sorted(FETCHERS),
+                        default='pooled')
+    parser.add_argument('--extractor', choices=sorted(EXTRACTORS),
+                        default='soup')
+    parser.add_argument('-a', '--actor-limit', type=int, default=-1,
+                        help='Stop after this many actors. -1 crawls the '
+                             'whole site')
+    parser.add_argument('-m', '--movie-limit', type=int, default=-1,
+                        help='Stop after this many movies')
+    parser.add_argument('--timeout', type=float, default=3600,
+                        help='Seconds before a run is given up. 0 waits '
+                             'forever')
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(format='%(asctime)s %(levelname)s %(message)s')
+    # The spider logs every url and every retry
+    logger.setLevel(logging.ERROR)
+    site = SyntheticSite(args.movies, args.actors, args.cast_size,
+                         page_size=args.page_size, seed=args.seed)
+    report = run_benchmark(site, args.concurrency, args.latency, args.jitter,
+                           args.error_rate, args.fetcher, args.extractor,
+                           args.actor_limit, args.movie_limit, args.timeout)
+    report_json = json.dumps(report, indent=2)
+    if args.out is None:
+        print(report_json)
+    else:
+        with open(args.out, 'w') as f:
+            f.write(report_json + '\n')
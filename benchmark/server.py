@@ -0,0 +1,107 @@
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, Optional, Tuple
+
+from benchmark.site import SyntheticSite
+
+
+class WikiServer:
+    """
+    Serve a SyntheticSite over http on localhost in a background thread.
+
+    Every response is delayed by latency seconds, give or take jitter, and
+    a fraction error_rate of the requests is answered 503 to exercise the
+    retry paths of the spider.
+    """
+
+    def __init__(self, site: SyntheticSite, latency: float = 0.0,
+                 jitter: float = 0.0, error_rate: float = 0.0,
+                 seed: int = 0, port: int = 0) -> None:
+        self.site = site
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.requests = 0
+        self.injected_errors = 0
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer(('127.0.0.1', port),
+                                           self._handler())
+        self._server.daemon_threads = True
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def base_url(self) -> str:
+        return 'http://127.0.0.1:%d' % self._server.server_address[1]
+
+    def _draw(self) -> Tuple[float, bool]:
+        """
+        Delay and whether to fail the next request
+        """
+        with self._lock:
+            self.requests += 1
+            delay = max(0.0, self.latency
+                        + self._rng.uniform(-self.jitter, self.jitter))
+            fail = self._rng.random() < self.error_rate
+            if fail:
+                self.injected_errors += 1
+        return delay, fail
+
+    def _handler(self) -> Any:
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def _send(self, status: int, body: bytes,
+                      headers: Dict[str, str]) -> None:
+                self.send_response(status)
+                for name, value in headers.items():
+                    self.send_header(name, value)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_GET(self) -> None:
+                delay, fail = server._draw()
+                if delay:
+                    time.sleep(delay)
+                if fail:
+                    self._send(503, b'Service Unavailable',
+                               {'Retry-After': '0'})
+                    return
+                page = server.site.page(self.path)
+                if page is None:
+                    self._send(404, b'Not Found', {})
+                    return
+                self._send(200, page,
+                           {'Content-Type': 'text/html; charset=UTF-8'})
+
+            def log_message(self, format: str, *args: Any) -> None:
+                pass
+
+        return Handler
+
+    def start(self) -> 'WikiServer':
+        self._thread = threading.Thread(target=self._server.serve_forever,
+                                        daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+        if self._thread is not None:
+            self._thread.join()
+
+    def __enter__(self) -> 'WikiServer':
+        return self.start()
+
+    def __exit__(self, *args: Any) -> None:
+        self.stop()
+
+    def describe(self) -> Dict[str, float]:
+        return {'latency': self.latency, 'jitter': self.jitter,
+                'error_rate': self.error_rate}
@@ -0,0 +1,164 @@
+import random
+from typing import Dict, List, Optional
+from urllib import parse
+
+MONTHS = ('January', 'February', 'March', 'April', 'May', 'June', 'July',
+          'August', 'September', 'October', 'November', 'December')
+
+MOVIE_TEMPLATE = '''<!DOCTYPE html>
+<html><head><title>%(title)s - Wikipedia</title></head>
+<body><div id="content">
+<h1 id="firstHeading">%(title)s</h1>
+<div id="bodyContent">
+<table class="infobox vevent"><tbody>
+<tr><th colspan="2" class="summary">%(title)s</th></tr>
+<tr><td colspan="2"><a href="/wiki/File:%(slug)s.jpg" class="image"><img \
+src="//upload.example.org/%(slug)s.jpg" width="220"/></a>\
+<div>Theatrical release poster</div></td></tr>
+<tr><th>Directed by</th><td>%(director)s</td></tr>
+<tr><th>Starring</th><td><div class="plainlist"><ul>%(starring)s</ul>\
+</div></td></tr>
+<tr><th>Release date</th><td>%(month)s %(day)d, %(year)d</td></tr>
+<tr><th>Box office</th><td>$%(gross).1f million</td></tr>
+</tbody></table>
+%(padding)s
+<h2><span class="mw-headline" id="Cast">Cast</span></h2>
+<ul>%(cast)s</ul>
+%(padding)s
+</div></div></body></html>
+'''
+
+ACTOR_TEMPLATE = '''<!DOCTYPE html>
+<html><head><title>%(title)s - Wikipedia</title></head>
+<body><div id="content">
+<h1 id="firstHeading">%(title)s</h1>
+<div id="bodyContent">
+<table class="infobox biography vcard"><tbody>
+<tr><th colspan="2">%(title)s</th></tr>
+<tr><th>Born</th><td>%(title)s<br/>%(month)s %(day)d, %(year)d \
+(age %(age)d)</td></tr>
+<tr><th>Occupation</th><td>Actor</td></tr>
+</tbody></table>
+%(padding)s
+<h2><span class="mw-headline" id="Filmography">Filmography</span></h2>
+<h3><span class="mw-headline" id="Film">Film</span></h3>
+<table class="wikitable"><tbody>
+<tr><th>Year</th><th>Title</th><th>Role</th></tr>
+%(films)s
+</tbody></table>
+%(padding)s
+</div></div></body></html>
+'''
+
+PARAGRAPH = ('<p>Lorem ipsum dolor sit amet, consectetur adipiscing elit, '
+             'sed do <a href="/wiki/Topic_%d">eiusmod tempor</a> incididunt '
+             'ut labore et dolore magna aliqua. Ut enim ad minim veniam, quis '
+             'nostrud exercitation ullamco laboris nisi ut aliquip ex ea '
+             'commodo consequat.<sup class="reference"><a href="#cite-%d">'
+             '[%d]</a></sup></p>\n')
+
+
+class SyntheticSite:
+    """
+    A generated wiki of movies and actors shaped like the Wikipedia pages
+    the parsers are written for.
+
+    Every movie casts cast_size actors drawn at random, the first starring
+    of them are also in its infobox. Every actor lists the movies they are
+    cast in. Pages are padded with paragraphs to about page_size bytes.
+    The same seed always gives the same site.
+    """
+
+    def __init__(self, num_movies: int = 500, num_actors: int = 1000,
+                 cast_size: int = 12, starring: int = 4,
+                 page_size: int = 60000, seed: int = 0) -> None:
+        self.num_movies = num_movies
+        self.num_actors = num_actors
+        self.page_size = page_size
+        self.seed = seed
+        rng = random.Random(seed)
+        cast_size = min(cast_size, num_actors)
+        self.starring = starring
+        # Actor indexes of each movie in billing order
+        self.casts: List[List[int]] = [rng.sample(range(num_actors), cast_size)
+                                       for _ in range(num_movies)]
+        self.filmographies: List[List[int]] = [[] for _ in range(num_actors)]
+        for movie, cast in enumerate(self.casts):
+            for actor in cast:
+                self.filmographies[actor].append(movie)
+
+    @staticmethod
+    def movie_url(movie: int) -> str:
+        return '/wiki/Synthetic_Film_%d' % movie
+
+    @staticmethod
+    def actor_url(actor: int) -> str:
+        return '/wiki/Synthetic_Actor_%d' % actor
+
+    @property
+    def start_url(self) -> str:
+        return self.movie_url(0)
+
+    def _padding(self, rng: random.Random, used: int) -> str:
+        # Half of the padding goes before and half after the parsed section
+        count = max(0, (self.page_size - used) // (2 * len(PARAGRAPH)))
+        return ''.join(PARAGRAPH % (rng.randrange(100000), i, i)
+                       for i in range(count))
+
+    def _movie_page(self, movie: int) -> str:
+        rng = random.Random('%d-movie-%d' % (self.seed, movie))
+        title = 'Synthetic Film %d' % movie
+        links = ['<li><a href="%s">Synthetic Actor %d</a></li>'
+                 % (self.actor_url(actor), actor)
+                 for actor in self.casts[movie]]
+        cast = ['<li><a href="%s">Synthetic Actor %d</a> as Role %d</li>'
+                % (self.actor_url(actor), actor, i)
+                for i, actor in enumerate(self.casts[movie])]
+        values = {'title': title, 'slug': title.replace(' ', '_'),
+                  'director': 'Director %d' % rng.randrange(1000),
+                  'starring': ''.join(links[:self.starring]),
+                  'cast': '\n'.join(cast),
+                  'month': rng.choice(MONTHS), 'day': rng.randint(1, 28),
+                  'year': rng.randint(1950, 2020),
+                  'gross': rng.uniform(1, 2000), 'padding': ''}
+        values['padding'] = self._padding(rng, len(MOVIE_TEMPLATE % values))
+        return MOVIE_TEMPLATE % values
+
+    def _actor_page(self, actor: int) -> str:
+        rng = random.Random('%d-actor-%d' % (self.seed, actor))
+        films = ['<tr><td>%d</td><td><i><a href="%s">Synthetic Film %d</a>'
+                 '</i></td><td>Role</td></tr>'
+                 % (rng.randint(1950, 2020), self.movie_url(movie), movie)
+                 for movie in self.filmographies[actor]]
+        values = {'title': 'Synthetic Actor %d' % actor,
+                  'month': rng.choice(MONTHS), 'day': rng.randint(1, 28),
+                  'year': rng.randint(1930, 2000),
+                  'age': rng.randint(20, 90), 'films': '\n'.join(films),
+                  'padding': ''}
+        values['padding'] = self._padding(rng, len(ACTOR_TEMPLATE % values))
+        return ACTOR_TEMPLATE % values
+
+    def page(self, path: str) -> Optional[bytes]:
+        """
+        Render a page
+        Args:
+            path: The path of the url, e.g. /wiki/Synthetic_Film_0
+
+        Returns:
+            The html, or None if there is no such page
+        """
+        name = parse.unquote(parse.urlsplit(path).path)
+        for prefix, count, render in (
+                (self.movie_url(0)[:-1], self.num_movies, self._movie_page),
+                (self.actor_url(0)[:-1], self.num_actors, self._actor_page)):
+            index = name[len(prefix):]
+            if name.startswith(prefix) and index.isdigit():
+                if int(index) < count:
+                    return render(int(index)).encode('utf-8')
+        return None
+
+    def describe(self) -> Dict[str, int]:
+        return {'movies': self.num_movies, 'actors': self.num_actors,
+                'cast_size': len(self.casts[0]) if self.casts else 0,
+                'starring': self.starring, 'page_size': self.page_size,
+                'seed': self.seed}
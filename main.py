@@ -1,14 +1,32 @@
 import argparse
+import functools
 import logging
+import os
 import sys
-from typing import cast
+from typing import Any, Callable, Dict, List, cast
 
 from tqdm import tqdm
 
 from scraper.graph.base_objects import Url
-from scraper.graph.graph import Graph
+from scraper.graph.compact import GRAPHS
+from scraper.graph.mutation_log import MutationLog, compact, replay
 from scraper.graph.shell import ShellRunner
+from scraper.graph.snapshot import SnapshotGraph, is_snapshot
+from scraper.graph.stream import load_graph, save_graph
+from scraper.spider.archive import open_source, open_writer
+from scraper.spider.async_runner import AsyncSpiderRunner
+from scraper.spider.checkpoint import Checkpointer
+from scraper.spider.dedup import make_seen_set
+from scraper.spider.fetcher import Fetcher
+from scraper.spider.frontier import FRONTIERS, Frontier, SpillingFrontier
+from scraper.spider.mediawiki import FETCHERS, MediaWikiFetcher
+from scraper.spider.metrics import CrawlMetrics, JsonDumper, MetricsServer
+from scraper.spider.page_cache import PageCache
+from scraper.spider.rate_control import RateController, ThrottledFetcher
+from scraper.spider.record_cache import RecordCache, parser_version
+from scraper.spider.sharded import run_sharded
 from scraper.spider.spider_runner import SpiderRunner
+from scraper.spider.stream_extract import EXTRACTORS
 
 COLORS = {
     'WARNING': '\033[93m',
@@ -40,30 +58,272 @@ logger.setLevel(logging.INFO)
 if __name__ == '__main__':
     parser = argparse.ArgumentParser('Movie Scraper')
     parser.add_argument('-o', '--out', type=str,
-                        help='Path to save the json file', default='out.json')
-    parser.add_argument('-f', '--file', type=str, help='Path to a json file')
+                        help='Path to save the json file. A .jsonl file is '
+                             'written one node or edge at a time, and .gz '
+                             'or .zst compress it. A .snap file is a binary '
+                             'snapshot, opened instantly with -f',
+                        default='out.json')
+    parser.add_argument('-f', '--file', type=str,
+                        help='Path to a json or .jsonl file, possibly .gz or '
+                             '.zst compressed, or to a .snap snapshot')
     parser.add_argument('-a', '--actors', type=int,
                         help='Number of actors to scrape', default=250)
     parser.add_argument('-m', '--movies', type=int,
                         help='Number of movies to scrape', default=125)
     parser.add_argument('-s', '--start', type=str, help='Starting url',
                         default='/wiki/Titanic_(1997_film)')
+    parser.add_argument('-c', '--concurrency', type=int, default=0,
+                        help='Number of pages to fetch concurrently. '
+                             '0 crawls one page at a time')
+    parser.add_argument('--per-host', type=int, default=8,
+                        help='Maximum concurrent fetches per host')
+    parser.add_argument('-p', '--parse-workers', type=int, default=0,
+                        help='Number of html parser processes used with '
+                             '--concurrency')
+    parser.add_argument('--extractor', choices=sorted(EXTRACTORS),
+                        default='soup',
+                        help='soup builds the whole page, stream only the '
+                             'parts that are parsed')
+    parser.add_argument('--frontier', choices=sorted(FRONTIERS),
+                        help='Crawl order: depth first, the default, '
+                             'shallow and top billed first, or shallow '
+                             'first with the queue spilled to disk past '
+                             '--frontier-window urls')
+    parser.add_argument('--frontier-window', type=int, default=50000,
+                        help='Queued urls the spill frontier keeps in memory')
+    parser.add_argument('--spill-dir', type=str,
+                        help='Directory of the urls the spill frontier keeps '
+                             'on disk. Defaults to a temporary directory')
+    parser.add_argument('--graph', choices=sorted(GRAPHS), default='objects',
+                        help='How the graph is stored. compact keeps it in '
+                             'arrays, several times smaller')
+    parser.add_argument('--graph-log', type=str,
+                        help='Append the changes of the crawled graph to '
+                             'this file as they happen, folded into -o when '
+                             'the crawl ends. Changes left by a crawl that '
+                             'stopped are first applied to -o rather than '
+                             'dropped. With -f, the changes are applied to '
+                             'the loaded graph')
+    parser.add_argument('--fetcher', choices=sorted(FETCHERS),
+                        default='urllib',
+                        help='How pages are downloaded. mediawiki asks the '
+                             'API of the wiki for many articles at once')
+    parser.add_argument('--timeout', type=float, default=30.0,
+                        help='Network timeout in seconds')
+    parser.add_argument('--rate', type=float, default=0.0,
+                        help='Initial requests per second per host, adapted '
+                             'to the responses. 0, the default, disables '
+                             'rate control')
+    parser.add_argument('--max-rate', type=float, default=50.0,
+                        help='Highest requests per second per host')
+    parser.add_argument('--base-url', type=str,
+                        default=SpiderRunner._URL_PREFIX,
+                        help='Site to resolve relative urls against')
+    parser.add_argument('--source', type=str,
+                        help='Build the graph offline from a WARC file or a '
+                             'mirror directory instead of the network')
+    parser.add_argument('--record', type=str,
+                        help='Record fetched pages into a .warc(.gz) file or '
+                             'a mirror directory')
+    parser.add_argument('--cache-dir', type=str,
+                        help='Directory of the persistent page cache')
+    parser.add_argument('--cache-size', type=int, default=1024,
+                        help='Page cache size bound in MB')
+    parser.add_argument('--cache-ttl', type=float, default=168,
+                        help='Hours before a cached page is revalidated')
+    parser.add_argument('--record-cache', type=str,
+                        help='Sqlite file caching the records extracted '
+                             'from pages, so unchanged pages are not parsed '
+                             'again')
+    parser.add_argument('--checkpoint', type=str,
+                        help='Directory to save crawl checkpoints in')
+    parser.add_argument('--checkpoint-interval', type=int, default=100,
+                        help='Number of pages between checkpoints')
+    parser.add_argument('--resume', action='store_true',
+                        help='Continue from the last checkpoint')
+    parser.add_argument('--bloom', type=int,
+                        help='Track seen urls in a Bloom filter sized for '
+                             'this many pages instead of an exact set')
+    parser.add_argument('-w', '--workers', type=int, default=0,
+                        help='Number of worker processes crawling shards of '
+                             'a shared frontier. 0 crawls in this process')
+    parser.add_argument('--shard-dir', type=str, default='shards',
+                        help='Directory for the shared frontier and the '
+                             'partial graphs of --workers')
+    parser.add_argument('--metrics-port', type=int,
+                        help='Serve crawl metrics to Prometheus on this port')
+    parser.add_argument('--metrics-file', type=str,
+                        help='Periodically dump crawl metrics to this json '
+                             'file')
+    parser.add_argument('--metrics-interval', type=float, default=10.0,
+                        help='Seconds between dumps of --metrics-file')
     if len(sys.argv) == 1:
         parser.print_help()
         exit()
     args = parser.parse_args()
 
-    if args.file is not None:
-        graph = Graph()
-        with open(args.file, 'r') as f:
-            if not graph.deserialize(f.read()):
-                logger.error('Invalid json file')
+    start_url = cast(Url, '/wiki/Titanic_(1997_film)')
+    extractor = EXTRACTORS[args.extractor]
+    if args.record_cache is not None:
+        # Records of older parsers are never used again
+        record_cache = RecordCache(args.record_cache)
+        record_cache.prune(parser_version(extractor))
+        record_cache.close()
+    if args.file is not None and is_snapshot(args.file):
+        if args.graph_log is not None:
+            parser.error('--graph-log can not be applied to a snapshot')
+        graph = SnapshotGraph(args.file)
+    elif args.file is not None:
+        graph = GRAPHS[args.graph]()
+        if not load_graph(graph, args.file):
+            logger.error('Invalid json file')
+        elif args.graph_log is not None and os.path.exists(args.graph_log):
+            if not replay(graph, args.graph_log):
+                logger.error('%s does not apply to %s'
+                             % (args.graph_log, args.file))
+    elif args.workers > 0:
+        # Options of a crawl in one process the workers do not support
+        unsupported = {'--concurrency': args.concurrency > 0,
+                       '--checkpoint': args.checkpoint is not None,
+                       '--resume': args.resume,
+                       '--graph-log': args.graph_log is not None,
+                       '--graph': args.graph != 'objects',
+                       '--frontier': args.frontier is not None,
+                       '--bloom': args.bloom is not None,
+                       '--rate': args.rate > 0,
+                       '--record': args.record is not None,
+                       '--metrics-port': args.metrics_port is not None,
+                       '--metrics-file': args.metrics_file is not None}
+        for option, given in unsupported.items():
+            if given:
+                parser.error('--workers can not be combined with %s'
+                             % option)
+        fetcher_factory: Callable[[], Fetcher] = functools.partial(
+            FETCHERS[args.fetcher], timeout=args.timeout)
+        cache_factory = None
+        if args.source is not None:
+            fetcher_factory = functools.partial(open_source, args.source)
+        elif args.cache_dir is not None:
+            cache_factory = functools.partial(
+                PageCache, args.cache_dir,
+                max_bytes=args.cache_size * 1024 * 1024,
+                ttl=args.cache_ttl * 3600)
+        graph = run_sharded(
+            start_url, args.shard_dir, args.workers,
+            actor_limit=args.actors, movie_limit=args.movies,
+            fetcher_factory=fetcher_factory,
+            cache_factory=cache_factory, base_url=args.base_url,
+            record_cache_factory=(
+                functools.partial(RecordCache, args.record_cache)
+                if args.record_cache is not None else None),
+            extractor=extractor)
+        save_graph(graph, args.out)
     else:
-        spider = SpiderRunner(cast(Url, '/wiki/Titanic_(1997_film)'),
-                              actor_limit=args.actors, movie_limit=args.movies)
-        spider.run()
+        fetcher = FETCHERS[args.fetcher](timeout=args.timeout)
+        cache = None
+        if args.source is not None:
+            fetcher = open_source(args.source)
+        elif args.cache_dir is not None:
+            cache = PageCache(args.cache_dir,
+                              max_bytes=args.cache_size * 1024 * 1024,
+                              ttl=args.cache_ttl * 3600)
+        rate_controller = None
+        if args.rate > 0 and args.source is None:
+            rate_controller = RateController(rate=args.rate,
+                                             max_rate=args.max_rate)
+            if isinstance(fetcher, MediaWikiFetcher):
+                # Pace the API queries rather than the pages they carry
+                fetcher.transport = ThrottledFetcher(fetcher.transport,
+                                                     rate_controller)
+                rate_controller = None
+        if args.frontier == 'spill':
+            if args.checkpoint is not None:
+                # Entries read back from disk are new tuples, which the
+                # checkpoint can not match with the entries it numbered
+                parser.error('--frontier spill can not be combined with '
+                             '--checkpoint')
+            frontier: Frontier = SpillingFrontier(
+                args.spill_dir, window=args.frontier_window)
+        else:
+            frontier = FRONTIERS[args.frontier or 'lifo']()
+        graph = GRAPHS[args.graph]()
+        if args.graph_log is not None:
+            if args.checkpoint is not None:
+                # Restoring a checkpoint replaces the graph
+                parser.error('--graph-log can not be combined with '
+                             '--checkpoint')
+            if (os.path.exists(args.graph_log)
+                    and os.path.getsize(args.graph_log)):
+                # A crawl stopped before its final save, keep its pages
+                if is_snapshot(args.out):
+                    parser.error('--graph-log can not resume into a '
+                                 'snapshot')
+                if ((os.path.exists(args.out)
+                        and not load_graph(graph, args.out))
+                        or not replay(graph, args.graph_log)):
+                    parser.error('%s does not apply to %s'
+                                 % (args.graph_log, args.out))
+                logger.info('Resumed %d nodes from %s'
+                            % (len(graph.nodes), args.graph_log))
+            # The saved graph and the log describe the crawl at any time
+            graph.log = MutationLog(args.graph_log)
+            compact(graph, args.out)
+        checkpointer = None
+        if args.checkpoint is not None:
+            checkpointer = Checkpointer(args.checkpoint,
+                                        args.checkpoint_interval)
+        elif args.resume:
+            parser.error('--resume needs --checkpoint')
+        metrics = CrawlMetrics()
+        exporters: List[Any] = []
+        if args.metrics_port is not None:
+            exporters.append(MetricsServer(metrics.registry,
+                                           args.metrics_port).start())
+        if args.metrics_file is not None:
+            exporters.append(JsonDumper(metrics.registry, args.metrics_file,
+                                        args.metrics_interval).start())
+        options: Dict[str, Any] = {'actor_limit': args.actors,
+                                   'movie_limit': args.movies,
+                                   'fetcher': fetcher,
+                                   'base_url': args.base_url,
+                                   'cache': cache,
+                                   'archive': (open_writer(args.record)
+                                               if args.record is not None
+                                               else None),
+                                   'extractor': extractor,
+                                   'checkpointer': checkpointer,
+                                   'seen': make_seen_set(args.bloom),
+                                   'frontier': frontier,
+                                   'rate_controller': rate_controller,
+                                   'metrics': metrics,
+                                   'graph': graph,
+                                   'record_cache': (
+                                       RecordCache(args.record_cache)
+                                       if args.record_cache is not None
+                                       else None)}
+        if args.concurrency > 0:
+            spider: SpiderRunner = AsyncSpiderRunner(
+                start_url, concurrency=args.concurrency,
+                per_host=args.per_host, parse_workers=args.parse_workers,
+                **options)
+        else:
+            spider = SpiderRunner(start_url, **options)
+        if args.resume and checkpointer is not None:
+            if not checkpointer.restore(spider):
+                logger.warning('No checkpoint found, starting a new crawl')
+        try:
+            spider.run()
+        finally:
+            for exporter in exporters:
+                exporter.stop()
         spider.save(args.out)
+        spider.fetcher.close()
+        if spider.record_cache is not None:
+            spider.record_cache.close()
         graph = spider.graph
+        if graph.log is not None:
+            graph.log.close()
+            graph.log = None
 
     shell = ShellRunner(graph)
     shell.start()
@@ -1,4 +1,5 @@
 from dataclasses import dataclass, field
+from typing import Optional
 
 from scraper.graph.base_objects import EntityType, NodeBase
 from scraper.graph.movie import Movie
@@ -14,14 +15,19 @@ class Actor(NodeBase):
     def __post_init__(self) -> None:
         super().__post_init__()
         self.type = EntityType.ACTOR
+        # Kept up to date by the graph once tracked
+        self._grossing_: Optional[float] = None
 
     @property
     def grossing(self) -> float:
         """
-        Get the total grossing for the actor
+        Get the total grossing for the actor, summed over its edges unless
+        the graph keeps it
         Returns:
             the grossing
         """
+        if self._grossing_ is not None:
+            return self._grossing_
         total = 0.0
         for edge in self.get_edges():
             for node in edge.ends:
@@ -29,5 +35,15 @@ class Actor(NodeBase):
                     total += node.total_grossing * edge.weight
         return total
 
+    def track_grossing(self) -> None:
+        """
+        Compute the grossing once, then only update it with add_grossing
+        """
+        self._grossing_ = None
+        self._grossing_ = self.grossing
+
+    def add_grossing(self, amount: float) -> None:
+        self._grossing_ = self.grossing + amount
+
     def __eq__(self, other: object) -> bool:
         return super().__eq__(other)
@@ -0,0 +1,155 @@
+from typing import Any, List, Tuple
+
+import numpy as np
+
+from scraper.graph.actor import Actor
+from scraper.graph.base_objects import EntityType
+from scraper.graph.compact import CompactGraph
+from scraper.graph.graph import Graph
+from scraper.graph.movie import Movie
+from scraper.graph.snapshot import SnapshotGraph
+
+# Codes of the kinds column, as in CompactGraph
+KIND_CODES = {EntityType.MOVIE: 0, EntityType.ACTOR: 1}
+
+
+def _column(graph: CompactGraph, column: Any, dtype: Any) -> np.ndarray:
+    """
+    A column of a graph as a numpy array
+    """
+    values = np.frombuffer(column, dtype=dtype)
+    if isinstance(graph, SnapshotGraph):
+        return values
+    # An array read by numpy can not grow
+    return values.copy()
+
+
+class GraphAnalytics:
+    """
+    Whole graph aggregates computed with numpy rather than by walking the
+    edges of each node.
+
+    The graph is exported once into attribute vectors indexed by node id
+    and a sparse symmetric matrix of edge weights in coordinate form, each
+    edge in both directions. The columns of a snapshot are read in place,
+    those of a CompactGraph are copied in one go. The analytics describe
+    the graph as it was when they were created.
+    """
+
+    def __init__(self, graph: Graph) -> None:
+        """
+        Export a graph
+        Args:
+            graph: The graph, of movies and actors
+        """
+        if isinstance(graph, CompactGraph):
+            self.kinds = _column(graph, graph.kinds, np.int8)
+            self.years = _column(graph, graph.years, np.intc)
+            self.grossing = _column(graph, graph.grossing, np.float64)
+            self.ages = _column(graph, graph.ages, np.intc)
+            sources = _column(graph, graph.sources, np.intc)
+            targets = _column(graph, graph.targets, np.intc)
+            weights = _column(graph, graph.weights, np.float64)
+        else:
+            nodes = list(graph.iter_nodes())
+            self.kinds = np.array(
+                [KIND_CODES[EntityType.MOVIE] if isinstance(node, Movie)
+                 else KIND_CODES[EntityType.ACTOR]
+                 if isinstance(node, Actor) else -1 for node in nodes],
+                dtype=np.int8)
+            self.years = np.array([getattr(node, 'year', 0)
+                                   for node in nodes], dtype=np.intc)
+            self.grossing = np.array([getattr(node, 'total_grossing', 0.0)
+                                      for node in nodes], dtype=np.float64)
+            self.ages = np.array([getattr(node, 'age', 0) for node in nodes],
+                                 dtype=np.intc)
+            edges = [(edge.ends[0].node_id, edge.ends[1].node_id,
+                      edge.weight) for edge in graph.iter_edges()]
+            sources = np.array([edge[0] for edge in edges], dtype=np.intc)
+            targets = np.array([edge[1] for edge in edges], dtype=np.intc)
+            weights = np.array([edge[2] for edge in edges],
+                               dtype=np.float64)
+        self.num_nodes = len(self.kinds)
+        self.rows = np.concatenate((sources, targets))
+        self.cols = np.concatenate((targets, sources))
+        self.data = np.concatenate((weights, weights))
+
+    def is_type(self, entity_type: EntityType) -> np.ndarray:
+        """
+        Mask of the nodes of a type
+        """
+        return self.kinds == KIND_CODES[entity_type]
+
+    def matvec(self, vector: np.ndarray) -> np.ndarray:
+        """
+        Product of the weight matrix with a vector indexed by node id
+        """
+        return np.bincount(self.rows, weights=self.data * vector[self.cols],
+                           minlength=self.num_nodes)
+
+    def to_scipy(self) -> Any:
+        """
+        The weight matrix as a scipy CSR matrix, with the optional scipy
+        package
+        """
+        try:
+            from scipy import sparse
+        except ImportError:
+            raise ValueError('The weight matrix needs the scipy package')
+        return sparse.csr_matrix((self.data, (self.rows, self.cols)),
+                                 shape=(self.num_nodes, self.num_nodes))
+
+    def actor_grossing(self) -> np.ndarray:
+        """
+        The grossing of every actor, as Actor.grossing
+        Returns:
+            The grossing by node id, 0 for nodes other than actors
+        """
+        movie_grossing = np.where(self.is_type(EntityType.MOVIE),
+                                  self.grossing, 0.0)
+        return np.where(self.is_type(EntityType.ACTOR),
+                        self.matvec(movie_grossing), 0.0)
+
+    def top_actors(self, k: int) -> List[Tuple[int, float]]:
+        """
+        The k actors of highest grossing
+        Returns:
+            Their (node id, grossing), highest first, ties in id order
+        """
+        actor_ids = np.flatnonzero(self.is_type(EntityType.ACTOR))
+        grossing = self.actor_grossing()[actor_ids]
+        order = np.lexsort((actor_ids, -grossing))[:k]
+        return [(int(actor_ids[i]), float(grossing[i])) for i in order]
+
+    def year_totals(self) -> List[Tuple[int, int, float]]:
+        """
+        Roll movies up by year
+        Returns:
+            The (year, number of movies, total grossing) of each year with
+            movies, by year
+        """
+        movies = self.is_type(EntityType.MOVIE)
+        years, inverse = np.unique(self.years[movies], return_inverse=True)
+        counts = np.bincount(inverse, minlength=len(years))
+        totals = np.bincount(inverse, weights=self.grossing[movies],
+                             minlength=len(years))
+        return [(int(year), int(count), float(total))
+                for year, count, total in zip(years, counts, totals)]
+
+    def degrees(self) -> np.ndarray:
+        """
+        Number of edges of each node, by node id
+        """
+        return np.bincount(self.rows, minlength=self.num_nodes)
+
+    def degree_distribution(self, entity_type: EntityType
+                            ) -> List[Tuple[int, int]]:
+        """
+        How many nodes of a type have each number of edges
+        Returns:
+            The (degree, number of nodes), by degree
+        """
+        degrees, counts = np.unique(self.degrees()[self.is_type(entity_type)],
+                                    return_counts=True)
+        return [(int(degree), int(count))
+                for degree, count in zip(degrees, counts)]
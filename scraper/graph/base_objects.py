@@ -1,18 +1,71 @@
 from dataclasses import dataclass, field
-from typing import Any, Dict, List, NewType, Tuple, cast
+from typing import (TYPE_CHECKING, Any, Dict, Generic, List, NewType,
+                    Optional, Tuple, TypeVar, cast, overload)
 
 from scraper.graph.entity_type import EntityType
 
+if TYPE_CHECKING:
+    from scraper.graph.graph import Graph
+
 Url = NewType('Url', str)
 
+T = TypeVar('T')
+
+
+class GraphAttribute(Generic[T]):
+    """
+    Dataclass field of a node or an edge which the graph holding the object
+    derives data from. Setting it calls graph.<hook>(object, old value).
+    """
+
+    def __init__(self, hook: str, default: Optional[T] = None) -> None:
+        """
+        Args:
+            hook: Name of the method of the graph called on a change
+            default: Default of the field, None for no default
+        """
+        self.hook = hook
+        self.default = default
+
+    def __set_name__(self, owner: type, name: str) -> None:
+        self.name = name
+
+    @overload
+    def __get__(self, obj: None, owner: type) -> 'GraphAttribute[T]':
+        ...
+
+    @overload
+    def __get__(self, obj: object, owner: type) -> T:
+        ...
+
+    def __get__(self, obj: Any, owner: Any = None) -> Any:
+        if obj is None:
+            # The default of the dataclass field
+            if self.default is None:
+                raise AttributeError(self.name)
+            return self.default
+        return obj.__dict__[self.name]
+
+    def __set__(self, obj: Any, value: T) -> None:
+        # Kept in the instance dict, which NodeBase.to_dict reads
+        old = obj.__dict__.get(self.name, value)
+        obj.__dict__[self.name] = value
+        graph = obj.__dict__.get('_owner_')
+        if graph is not None:
+            getattr(graph, self.hook)(obj, old)
+
 
 @dataclass
 class Edge:
     """
     Edge
     """
-    weight: float
     ends: Tuple['NodeBase', 'NodeBase']
+    weight: GraphAttribute[float] = GraphAttribute('_weight_changed', 0.0)
+
+    def __post_init__(self) -> None:
+        # The graph holding the edge
+        self._owner_: Optional['Graph'] = None
 
     def __contains__(self, node: 'NodeBase') -> bool:
         return node in self.ends
@@ -35,6 +88,8 @@ class NodeBase:
 
     def __post_init__(self):
         self._connections_: List[Edge] = []
+        # The graph holding the node
+        self._owner_: Optional['Graph'] = None
 
     def add_edge(self, edge: Edge) -> None:
         self._connections_.append(edge)
@@ -0,0 +1,599 @@
+import json
+from array import array
+from dataclasses import fields
+from typing import (TYPE_CHECKING, Any, Dict, Iterable, Iterator, List,
+                    Optional, Sequence, Tuple, Type, cast)
+
+from scraper.graph.actor import Actor
+from scraper.graph.base_objects import Edge, EntityType, NodeBase, Url
+from scraper.graph.graph import EdgeTuple, Graph, check_edges, order_nodes
+from scraper.graph.movie import Movie
+from scraper.graph.ranked import RankedIndex
+
+if TYPE_CHECKING:
+    from scraper.graph.mutation_log import MutationLog
+
+
+class HashIndex:
+    """
+    Multimap from the hashes of values to node ids, with open addressing
+    in arrays. Only the low 32 bits of the hashes are kept, and not the
+    values, so callers check the values of the ids found.
+    """
+
+    def __init__(self) -> None:
+        self._ids = array('i', (-1,)) * 8
+        self._hashes = array('I', (0,)) * 8
+        self._size = 0
+
+    def _insert(self, key: int, node_id: int) -> None:
+        mask = len(self._ids) - 1
+        slot = key & mask
+        while self._ids[slot] != -1:
+            slot = (slot + 1) & mask
+        self._ids[slot] = node_id
+        self._hashes[slot] = key & 0xffffffff
+
+    def add(self, key: int, node_id: int) -> None:
+        # At most three quarters full
+        if 4 * (self._size + 1) > 3 * len(self._ids):
+            ids, hashes = self._ids, self._hashes
+            self._ids = array('i', (-1,)) * (2 * len(ids))
+            self._hashes = array('I', (0,)) * (2 * len(ids))
+            for old_id, old_key in zip(ids, hashes):
+                if old_id != -1:
+                    self._insert(old_key, old_id)
+        self._insert(key, node_id)
+        self._size += 1
+
+    def find(self, key: int) -> List[int]:
+        """
+        The ids added with a hash, in id order
+        """
+        mask = len(self._ids) - 1
+        slot = key & mask
+        low = key & 0xffffffff
+        result = []
+        while self._ids[slot] != -1:
+            if self._hashes[slot] == low:
+                result.append(self._ids[slot])
+            slot = (slot + 1) & mask
+        return sorted(result)
+
+
+class StringTable:
+    """
+    Strings packed one after the other as utf-8 in a single buffer, of
+    up to 4 GB
+    """
+
+    def __init__(self) -> None:
+        self._data: Any = bytearray()
+        self._offsets: Any = array('I', (0,))
+
+    @classmethod
+    def wrap(cls, data: Any, offsets: Any) -> 'StringTable':
+        """
+        A table over existing buffers, like those of a mapped file
+        Args:
+            data: The packed strings
+            offsets: Where each string starts, then the size of data
+        """
+        table = cls.__new__(cls)
+        table._data = data
+        table._offsets = offsets
+        return table
+
+    def buffers(self) -> Tuple[Any, Any]:
+        """
+        The packed strings and the offsets of the table
+        """
+        return self._data, self._offsets
+
+    def add(self, value: str) -> int:
+        """
+        Store a string
+        Returns:
+            Its index in the table
+        """
+        self._data += value.encode('utf-8')
+        self._offsets.append(len(self._data))
+        return len(self._offsets) - 2
+
+    def __getitem__(self, index: int) -> str:
+        return str(self._data[self._offsets[index]:
+                              self._offsets[index + 1]], 'utf-8')
+
+    def __len__(self) -> int:
+        return len(self._offsets) - 1
+
+
+def build_csr(num_nodes: int, sources: Sequence[int],
+              targets: Sequence[int]) -> Tuple['array[int]', 'array[int]',
+                                               'array[int]']:
+    """
+    The adjacency of edges in CSR form, by a counting sort
+    Args:
+        num_nodes: Number of nodes
+        sources: First end of each edge
+        targets: Second end of each edge
+
+    Returns:
+        The offsets, neighbors and edge ids: the edges of node i are at
+        offsets[i]:offsets[i + 1] of the neighbors and edge ids, in
+        edge order
+    """
+    offsets = array('q', bytes(8 * (num_nodes + 1)))
+    for source, target in zip(sources, targets):
+        offsets[source + 1] += 1
+        if target != source:
+            offsets[target + 1] += 1
+    for i in range(num_nodes):
+        offsets[i + 1] += offsets[i]
+    positions = array('q', offsets)
+    size = offsets[num_nodes]
+    neighbors = array('i', bytes(4 * size))
+    edge_ids = array('i', bytes(4 * size))
+    for edge_id, (source, target) in enumerate(zip(sources, targets)):
+        position = positions[source]
+        neighbors[position] = target
+        edge_ids[position] = edge_id
+        positions[source] += 1
+        if target == source:
+            continue
+        position = positions[target]
+        neighbors[position] = source
+        edge_ids[position] = edge_id
+        positions[target] += 1
+    return offsets, neighbors, edge_ids
+
+
+class _NodeView:
+    """
+    Mixin turning a node into a view of a row of a CompactGraph
+    """
+
+    _graph_: 'CompactGraph'
+    _index_: int
+
+    @property
+    def node_id(self) -> int:
+        return self._index_
+
+    @node_id.setter
+    def node_id(self, value: int) -> None:
+        raise AttributeError('Ids of CompactGraph nodes are their position')
+
+    @property
+    def name(self) -> str:
+        graph = self._graph_
+        return graph.strings[graph.names[self._index_]]
+
+    @name.setter
+    def name(self, value: str) -> None:
+        graph = self._graph_
+        graph.names[self._index_] = graph.strings.add(value)
+
+    @property
+    def url(self) -> Url:
+        graph = self._graph_
+        return cast(Url, graph.strings[graph.urls[self._index_]])
+
+    @url.setter
+    def url(self, value: Url) -> None:
+        graph = self._graph_
+        graph.urls[self._index_] = graph.strings.add(value)
+
+    def add_edge(self, edge: Edge) -> None:
+        raise TypeError('Edges of a CompactGraph are added by the graph')
+
+    def get_edges(self) -> Tuple[Edge, ...]:
+        graph = self._graph_
+        return tuple(graph.edge(edge_id)
+                     for _, edge_id in graph.adjacency(self._index_))
+
+    def has_peer(self, node: NodeBase) -> bool:
+        return self._graph_.has_edge(self._index_, node.node_id)
+
+    def to_dict(self) -> Dict[str, Any]:
+        # Same layout as the node it stands for, so files are interchangeable
+        base = type(self).__bases__[1]
+        result = {'class_name': base.__name__,
+                  'module_name': base.__module__}
+        for f in fields(base):
+            result[f.name] = getattr(self, f.name)
+        return result
+
+
+class MovieView(_NodeView, Movie):
+    """
+    A movie stored in a CompactGraph
+    """
+
+    @property  # type: ignore[override]
+    def type(self) -> EntityType:
+        return EntityType.MOVIE
+
+    @type.setter
+    def type(self, value: EntityType) -> None:
+        raise AttributeError('The type of a node can not change')
+
+    @property  # type: ignore[override]
+    def year(self) -> int:
+        return self._graph_.years[self._index_]
+
+    @year.setter
+    def year(self, value: int) -> None:
+        self._graph_.years[self._index_] = value
+
+    @property  # type: ignore[override]
+    def total_grossing(self) -> float:
+        return self._graph_.grossing[self._index_]
+
+    @total_grossing.setter
+    def total_grossing(self, value: float) -> None:
+        graph = self._graph_
+        old = graph.grossing[self._index_]
+        graph.grossing[self._index_] = value
+        graph._total_grossing_changed(self, old)
+
+
+class ActorView(_NodeView, Actor):
+    """
+    An actor stored in a CompactGraph
+    """
+
+    @property  # type: ignore[override]
+    def type(self) -> EntityType:
+        return EntityType.ACTOR
+
+    @type.setter
+    def type(self, value: EntityType) -> None:
+        raise AttributeError('The type of a node can not change')
+
+    @property  # type: ignore[override]
+    def age(self) -> int:
+        return self._graph_.ages[self._index_]
+
+    @age.setter
+    def age(self, value: int) -> None:
+        self._graph_.ages[self._index_] = value
+
+    @property
+    def grossing(self) -> float:
+        return self._graph_.actor_grossing[self._index_]
+
+
+class EdgeView(Edge):
+    """
+    An edge stored in a CompactGraph
+    """
+
+    _graph_: 'CompactGraph'
+    _index_: int
+
+    @property  # type: ignore[override]
+    def weight(self) -> float:
+        return self._graph_.weights[self._index_]
+
+    @weight.setter
+    def weight(self, value: float) -> None:
+        graph = self._graph_
+        old = graph.weights[self._index_]
+        graph.weights[self._index_] = value
+        graph._weight_changed(self, old)
+
+    @property  # type: ignore[override]
+    def ends(self) -> Tuple[NodeBase, NodeBase]:
+        graph = self._graph_
+        return (graph.node(graph.sources[self._index_]),
+                graph.node(graph.targets[self._index_]))
+
+    @ends.setter
+    def ends(self, value: Tuple[NodeBase, NodeBase]) -> None:
+        raise AttributeError('The ends of an edge can not change')
+
+
+# Node kinds, by their code in the kinds column
+_VIEWS: Tuple[Type[NodeBase], ...] = (MovieView, ActorView)
+_KINDS: Dict[type, int] = {Movie: 0, Actor: 1, MovieView: 0, ActorView: 1}
+
+
+class CompactGraph(Graph):
+    """
+    Graph keeping its nodes and edges in typed arrays.
+
+    Node attributes are columns, one array per attribute with the node id
+    as index, and names and urls are packed in a string table. Edges are
+    columns of ends and weights, and the adjacency is kept in CSR form:
+    the edges of node i are at offsets[i]:offsets[i + 1] of the neighbor
+    and edge id arrays. Edges added since the CSR arrays were last built
+    are chained in linked lists, also arrays, and merged once they are a
+    fraction of all edges.
+
+    Movies and actors are views over a row of the columns, created on
+    access. A node added to the graph becomes such a view, so the objects
+    held by the caller stay valid while their own attributes are freed.
+    Urls and names are indexed by hash in HashIndex tables, so lookups
+    check the values of their candidates.
+
+    Only movies and actors can be stored. The API is the one of Graph.
+    """
+
+    # Edges are kept aside until they are this fraction of all edges
+    _PENDING_FRACTION = 2
+    _MIN_PENDING = 1024
+
+    def __init__(self) -> None:
+        # Graph.__init__ is not called, none of its containers are used
+        self.strings = StringTable()
+        self.kinds = array('b')
+        self.names = array('i')
+        self.urls = array('i')
+        self.years = array('i')
+        self.grossing = array('d')
+        self.ages = array('i')
+        self.actor_grossing = array('d')
+        self.sources = array('i')
+        self.targets = array('i')
+        self.weights = array('d')
+        self._offsets = array('q', (0,))
+        self._neighbors = array('i')
+        self._edge_ids = array('i')
+        # Edges from _built on are not in the CSR arrays but in linked
+        # lists, newest first: the last slot of each node, and for slot
+        # 2 * (edge - _built) + side the previous slot of the same node
+        self._built = 0
+        self._heads = array('i')
+        self._next = array('i')
+        self._url_index = HashIndex()
+        self._name_index = HashIndex()
+        # Few distinct values, so the ids of each are kept
+        self._value_indexes: Dict[str, Dict[Any, 'array[int]']] = {
+            'type': {}, 'year': {}}
+        self._ranked = {attr: RankedIndex() for attr in self._RANKED_ATTRS}
+        self.log: Optional['MutationLog'] = None
+
+    def node(self, node_id: int) -> NodeBase:
+        """
+        The view of a node, the id must be valid
+        """
+        view = cast(_NodeView, object.__new__(_VIEWS[self.kinds[node_id]]))
+        view._graph_ = self
+        view._index_ = node_id
+        return cast(NodeBase, view)
+
+    def edge(self, edge_id: int) -> Edge:
+        """
+        The view of an edge, the id must be valid
+        """
+        view = object.__new__(EdgeView)
+        view._graph_ = self
+        view._index_ = edge_id
+        return view
+
+    def adjacency(self, node_id: int) -> Iterator[Tuple[int, int]]:
+        """
+        The (neighbor id, edge id) of the edges of a node, in the order
+        they were added
+        """
+        if node_id + 1 < len(self._offsets):
+            start = self._offsets[node_id]
+            end = self._offsets[node_id + 1]
+            yield from zip(self._neighbors[start:end],
+                           self._edge_ids[start:end])
+        pending = []
+        slot = self._heads[node_id]
+        while slot != -1:
+            edge_id = self._built + slot // 2
+            pending.append(((self.sources[edge_id] if slot % 2
+                             else self.targets[edge_id]), edge_id))
+            slot = self._next[slot]
+        yield from reversed(pending)
+
+    def has_edge(self, node_id_1: int, node_id_2: int) -> bool:
+        return any(neighbor == node_id_2
+                   for neighbor, _ in self.adjacency(node_id_1))
+
+    def _link(self, node_id: int, slot: int) -> None:
+        """
+        Push a slot on the linked list of a node
+        """
+        self._next[slot] = self._heads[node_id]
+        self._heads[node_id] = slot
+
+    def _build_csr(self) -> None:
+        """
+        Rebuild the CSR arrays from the edge columns
+        """
+        self._offsets, self._neighbors, self._edge_ids = build_csr(
+            len(self.kinds), self.sources, self.targets)
+        self._built = len(self.weights)
+        self._heads = array('i', (-1,)) * len(self.kinds)
+        self._next = array('i')
+
+    def num_node(self, node_type: EntityType) -> int:
+        return len(self._value_indexes['type'].get(node_type, ()))
+
+    @property
+    def nodes(self) -> Tuple[NodeBase, ...]:
+        return self.nodes_from(0)
+
+    @property
+    def edges(self) -> Tuple[Edge, ...]:
+        return self.edges_from(0)
+
+    def nodes_from(self, start: int) -> Tuple[NodeBase, ...]:
+        return tuple(self.node(node_id)
+                     for node_id in range(start, len(self.kinds)))
+
+    def edges_from(self, start: int) -> Tuple[Edge, ...]:
+        return tuple(self.edge(edge_id)
+                     for edge_id in range(start, len(self.weights)))
+
+    def iter_nodes(self) -> Iterator[NodeBase]:
+        return (self.node(node_id) for node_id in range(len(self.kinds)))
+
+    def iter_edges(self) -> Iterator[Edge]:
+        return (self.edge(edge_id) for edge_id in range(len(self.weights)))
+
+    def _find_url(self, url: Url) -> Optional[int]:
+        for node_id in self._url_index.find(hash(url)):
+            if self.strings[self.urls[node_id]] == url:
+                return node_id
+        return None
+
+    def check_node_exist(self, url: Url) -> bool:
+        return self._find_url(url) is not None
+
+    def get_node(self, url: Url) -> Optional[NodeBase]:
+        node_id = self._find_url(url)
+        return self.node(node_id) if node_id is not None else None
+
+    def get_node_by_id(self, node_id: int) -> Optional[NodeBase]:
+        if 0 <= node_id < len(self.kinds):
+            return self.node(node_id)
+        return None
+
+    def add_node(self, node: NodeBase, set_id: bool = True) -> bool:
+        """
+        Add a node to the graph. True if successful, false otherwise.
+
+        The node becomes a view of the graph. Ids are always positions, a
+        node added with set_id False must come with the next id.
+        """
+        kind = _KINDS.get(type(node))
+        if kind is None:
+            raise TypeError('A CompactGraph only stores movies and actors')
+        url = node.url
+        if self.check_node_exist(url):
+            return False
+        node_id = len(self.kinds)
+        if not set_id and node.node_id != node_id:
+            raise ValueError('Node %d added at position %d'
+                             % (node.node_id, node_id))
+        self.kinds.append(kind)
+        self.names.append(self.strings.add(node.name))
+        self.urls.append(self.strings.add(url))
+        self.years.append(getattr(node, 'year', 0))
+        self.grossing.append(getattr(node, 'total_grossing', 0.0))
+        self.ages.append(getattr(node, 'age', 0))
+        self.actor_grossing.append(0.0)
+        self._heads.append(-1)
+        self._url_index.add(hash(url), node_id)
+        self._name_index.add(hash(node.name), node_id)
+        for attr, index in self._value_indexes.items():
+            if hasattr(node, attr):
+                index.setdefault(getattr(node, attr),
+                                 array('i')).append(node_id)
+        # Drop the attributes of the object, it reads the columns from now
+        node.__dict__.clear()
+        node.__class__ = _VIEWS[kind]
+        view = cast(_NodeView, node)
+        view._graph_ = self
+        view._index_ = node_id
+        self._rank_node(node)
+        if self.log is not None:
+            self.log.node_added(node)
+        return True
+
+    def add_relationship(self, node_id_1: int,
+                         node_id_2: int) -> Optional[Edge]:
+        num_nodes = len(self.kinds)
+        if (not 0 <= node_id_1 < num_nodes or not 0 <= node_id_2 < num_nodes
+                or self.has_edge(node_id_1, node_id_2)):
+            return None
+        edge_id = len(self.weights)
+        self.sources.append(node_id_1)
+        self.targets.append(node_id_2)
+        self.weights.append(0.0)
+        slot = 2 * (edge_id - self._built)
+        self._next.extend((-1, -1))
+        self._link(node_id_1, slot)
+        if node_id_2 != node_id_1:
+            self._link(node_id_2, slot + 1)
+        if edge_id - self._built >= max(self._MIN_PENDING,
+                                        edge_id // self._PENDING_FRACTION):
+            self._build_csr()
+        if self.log is not None:
+            self.log.relationship_added(node_id_1, node_id_2)
+        return self.edge(edge_id)
+
+    def _credit(self, actor: Actor, amount: float) -> None:
+        node_id = actor.node_id
+        ranked = self._ranked['grossing']
+        ranked.remove(self.actor_grossing[node_id], node_id)
+        self.actor_grossing[node_id] += amount
+        ranked.add(self.actor_grossing[node_id], node_id)
+
+    def get_edge(self, node_id_1: int, node_id_2: int) -> Optional[Edge]:
+        if not 0 <= node_id_1 < len(self.kinds):
+            return None
+        for neighbor, edge_id in self.adjacency(node_id_1):
+            if neighbor == node_id_2:
+                return self.edge(edge_id)
+        return None
+
+    def _bucket(self, attr: str, value: Any) -> Optional[Sequence[int]]:
+        """
+        The ids of the nodes which may have a value, None if the attribute
+        is not indexed
+        """
+        if attr == 'name':
+            return self._name_index.find(hash(value))
+        if attr in self._value_indexes:
+            return self._value_indexes[attr].get(value, ())
+        return None
+
+    def query_nodes(self, constraints: Dict[str, Any]) -> List[NodeBase]:
+        # Only scan the smallest index bucket matching a constraint
+        candidates: Sequence[int] = range(len(self.kinds))
+        for attr, value in constraints.items():
+            bucket = self._bucket(attr, value)
+            if bucket is not None and len(bucket) < len(candidates):
+                candidates = bucket
+        result = []
+        for node_id in candidates:
+            node = self.node(node_id)
+            for attr, value in constraints.items():
+                if not hasattr(node, attr) or getattr(node, attr) != value:
+                    break
+            else:
+                result.append(node)
+        return result
+
+    def serialize(self) -> str:
+        return json.dumps(
+            {'nodes': [node.to_dict() for node in self.nodes],
+             'edges': [edge.to_dict() for edge in self.edges]})
+
+    def bulk_load(self, nodes: Iterable[NodeBase],
+                  edges: Iterable[EdgeTuple]) -> bool:
+        if len(self.kinds):
+            raise ValueError('bulk_load needs an empty graph')
+        ordered = order_nodes(nodes)
+        if ordered is None or any(type(node) not in _KINDS
+                                  for node in ordered):
+            return False
+        edge_tuples = check_edges(edges, len(ordered))
+        if edge_tuples is None:
+            return False
+        for node in ordered:
+            self.add_node(node, set_id=False)
+        movie, actor = _KINDS[Movie], _KINDS[Actor]
+        for node_id_1, node_id_2, weight in edge_tuples:
+            self.sources.append(node_id_1)
+            self.targets.append(node_id_2)
+            self.weights.append(weight)
+            for node_id, peer_id in ((node_id_1, node_id_2),
+                                     (node_id_2, node_id_1)):
+                if (self.kinds[node_id] == actor
+                        and self.kinds[peer_id] == movie):
+                    self.actor_grossing[node_id] += (self.grossing[peer_id]
+                                                     * weight)
+        self._build_csr()
+        self._rebuild_ranked()
+        return True
+
+
+GRAPHS: Dict[str, Type[Graph]] = {'objects': Graph, 'compact': CompactGraph}
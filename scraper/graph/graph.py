@@ -1,19 +1,151 @@
 import importlib
 import json
-from typing import Any, Dict, List, Optional, Tuple
+from typing import (TYPE_CHECKING, Any, Dict, Iterable, Iterator, List,
+                    Optional, Sequence, Set, Tuple, Type, cast)
 
+from scraper.graph.actor import Actor
 from scraper.graph.base_objects import Edge, EntityType, NodeBase, Url
+from scraper.graph.movie import Movie
+from scraper.graph.ranked import RankedIndex
+
+if TYPE_CHECKING:
+    from scraper.graph.mutation_log import MutationLog
+
+# (node id 1, node id 2, weight)
+EdgeTuple = Tuple[int, int, float]
+
+# Node classes by (module name, class name) as found in serialized graphs
+_NODE_CLASSES: Dict[Tuple[str, str], Type[NodeBase]] = {}
+
+
+def node_class(module_name: str, class_name: str) -> Type[NodeBase]:
+    """
+    Find the class of a serialized node, importing its module only the
+    first time it is seen
+    Args:
+        module_name: The module of the class
+        class_name: The name of the class
+
+    Returns:
+        The class
+    """
+    key = (module_name, class_name)
+    cls = _NODE_CLASSES.get(key)
+    if cls is None:
+        cls = getattr(importlib.import_module(module_name), class_name)
+        _NODE_CLASSES[key] = cls
+    return cls
+
+
+def edge_key(node_id_1: int, node_id_2: int) -> Tuple[int, int]:
+    """
+    The same key for both directions of an edge
+    """
+    if node_id_1 > node_id_2:
+        return node_id_2, node_id_1
+    return node_id_1, node_id_2
+
+
+def order_nodes(nodes: Iterable[NodeBase]) -> Optional[List[NodeBase]]:
+    """
+    Check the ids of the nodes of a graph, in one pass
+    Args:
+        nodes: The nodes, in any order
+
+    Returns:
+        The nodes by id, None if the ids are not 0 to n - 1 or two nodes
+        share a url
+    """
+    node_list = list(nodes)
+    slots: List[Optional[NodeBase]] = [None] * len(node_list)
+    for node in node_list:
+        node_id = node.node_id
+        if not 0 <= node_id < len(slots) or slots[node_id] is not None:
+            return None
+        slots[node_id] = node
+    if len({node.url for node in node_list}) != len(node_list):
+        return None
+    # Every slot is filled once ids are distinct and in range
+    return cast(List[NodeBase], slots)
+
+
+def check_edges(edges: Iterable[EdgeTuple],
+                num_nodes: int) -> Optional[List[EdgeTuple]]:
+    """
+    Check the edges of a graph, finding repeated ones with a set of their
+    ends
+    Args:
+        edges: The edges, as (node id 1, node id 2, weight)
+        num_nodes: Number of nodes of the graph
+
+    Returns:
+        The edges, None if one is repeated or points at no node
+    """
+    seen: Set[Tuple[int, int]] = set()
+    edge_list = []
+    for edge in edges:
+        key = edge_key(edge[0], edge[1])
+        if key in seen or key[0] < 0 or key[1] >= num_nodes:
+            return None
+        seen.add(key)
+        edge_list.append(edge)
+    return edge_list
 
 
 class Graph:
     """
     The Graph structure
+
+    Nodes are indexed by type, name and year. Indexed attributes must not
+    change once a node has been added.
+
+    Actors are also ranked by age and grossing and movies by year and
+    grossing, for top_nodes, bottom_nodes and nodes_between.
+
+    The grossing of actors is kept up to date as the weights of the edges
+    and the grossing of the movies of the graph are set.
+
+    When log is set, added nodes and relationships, and the weights and
+    grossing set on the edges and movies of the graph are written to it,
+    see MutationLog.
     """
 
+    _INDEXED_ATTRS = ('type', 'name', 'year')
+    _RANKED_ATTRS = ('age', 'grossing', 'year', 'total_grossing')
+
     def __init__(self):
         self._nodes: List[NodeBase] = []
         self._edges: List[Edge] = []
         self._url_to_node: Dict[Url, NodeBase] = {}
+        # attr -> value -> nodes with that value, in id order
+        self._indexes: Dict[str, Dict[Any, List[NodeBase]]] = {
+            attr: {} for attr in self._INDEXED_ATTRS}
+        self._ranked = {attr: RankedIndex() for attr in self._RANKED_ATTRS}
+        self.log: Optional['MutationLog'] = None
+
+    def _index_node(self, node: NodeBase) -> None:
+        for attr, index in self._indexes.items():
+            if hasattr(node, attr):
+                index.setdefault(getattr(node, attr), []).append(node)
+
+    def _rebuild_indexes(self) -> None:
+        for index in self._indexes.values():
+            index.clear()
+        for node in self._nodes:
+            self._index_node(node)
+        self._rebuild_ranked()
+
+    def _rank_node(self, node: NodeBase) -> None:
+        for attr, ranked in self._ranked.items():
+            if hasattr(node, attr):
+                ranked.add(getattr(node, attr), node.node_id)
+
+    def _rebuild_ranked(self) -> None:
+        self._ranked = {
+            attr: RankedIndex((getattr(node, attr), node.node_id)
+                              for node in self.iter_nodes()
+                              if hasattr(node, attr))
+            for attr in self._RANKED_ATTRS}
 
     def num_node(self, node_type: EntityType) -> int:
         """
@@ -24,8 +156,7 @@ class Graph:
         Returns:
             The count
         """
-        return sum(
-            map(lambda node: 1 if node.type == node_type else 0, self._nodes))
+        return len(self._indexes['type'].get(node_type, ()))
 
     @property
     def nodes(self) -> Tuple[NodeBase, ...]:
@@ -45,6 +176,40 @@ class Graph:
         """
         return tuple(self._edges)
 
+    def nodes_from(self, start: int) -> Tuple[NodeBase, ...]:
+        """
+        Get the nodes added after the first ones
+        Args:
+            start: Number of nodes to skip
+
+        Returns:
+            A tuple of the nodes with id >= start
+        """
+        return tuple(self._nodes[start:])
+
+    def edges_from(self, start: int) -> Tuple[Edge, ...]:
+        """
+        Get the edges added after the first ones
+        Args:
+            start: Number of edges to skip
+
+        Returns:
+            A tuple of the edges in insertion order
+        """
+        return tuple(self._edges[start:])
+
+    def iter_nodes(self) -> Iterator[NodeBase]:
+        """
+        Go through the nodes in id order without copying them
+        """
+        return iter(self._nodes)
+
+    def iter_edges(self) -> Iterator[Edge]:
+        """
+        Go through the edges in insertion order without copying them
+        """
+        return iter(self._edges)
+
     def check_node_exist(self, url: Url) -> bool:
         """
         Check whether a node is already there
@@ -56,6 +221,30 @@ class Graph:
         """
         return url in self._url_to_node
 
+    def get_node(self, url: Url) -> Optional[NodeBase]:
+        """
+        Find a node by url
+        Args:
+            url: The url of the node
+
+        Returns:
+            The node or None
+        """
+        return self._url_to_node.get(url)
+
+    def get_node_by_id(self, node_id: int) -> Optional[NodeBase]:
+        """
+        Find a node by id
+        Args:
+            node_id: The id of the node
+
+        Returns:
+            The node or None
+        """
+        if 0 <= node_id < len(self._nodes):
+            return self._nodes[node_id]
+        return None
+
     def add_node(self, node: NodeBase, set_id: bool = True) -> bool:
         """
         Add a node to the graph. True if successful, false otherwise.
@@ -67,6 +256,13 @@ class Graph:
             node.node_id = len(self._nodes)
         self._nodes.append(node)
         self._url_to_node[url] = node
+        node._owner_ = self
+        self._index_node(node)
+        if isinstance(node, Actor):
+            node.track_grossing()
+        self._rank_node(node)
+        if self.log is not None:
+            self.log.node_added(node)
         return True
 
     def add_relationship(self, node_id_1: int,
@@ -86,12 +282,121 @@ class Graph:
             node_2 = self._nodes[node_id_2]
             if not node_1.has_peer(node_2):
                 edge = Edge(ends=(node_1, node_2), weight=0.0)
+                edge._owner_ = self
                 node_1.add_edge(edge)
                 node_2.add_edge(edge)
                 self._edges.append(edge)
+                # Edges start with no weight, no actor earns from them yet
+                if self.log is not None:
+                    self.log.relationship_added(node_id_1, node_id_2)
+                return edge
+        return None
+
+    def get_edge(self, node_id_1: int, node_id_2: int) -> Optional[Edge]:
+        """
+        Find the edge between two nodes
+        Args:
+            node_id_1: Node 1
+            node_id_2: Node 2
+
+        Returns:
+            The edge or None
+        """
+        node_1 = self.get_node_by_id(node_id_1)
+        node_2 = self.get_node_by_id(node_id_2)
+        if node_1 is None or node_2 is None:
+            return None
+        for edge in node_1.get_edges():
+            if node_2 in edge:
                 return edge
         return None
 
+    def _credit(self, actor: Actor, amount: float) -> None:
+        """
+        Add to the grossing kept for an actor
+        """
+        ranked = self._ranked['grossing']
+        ranked.remove(actor.grossing, actor.node_id)
+        actor.add_grossing(amount)
+        ranked.add(actor.grossing, actor.node_id)
+
+    def _credit_edge(self, edge: Edge, weight: float) -> None:
+        """
+        Add what the movie of an edge earns its actor for a weight
+        """
+        node_1, node_2 = edge.ends
+        for actor, movie in ((node_1, node_2), (node_2, node_1)):
+            if isinstance(actor, Actor) and isinstance(movie, Movie):
+                self._credit(actor, movie.total_grossing * weight)
+
+    def _weight_changed(self, edge: Edge, old: float) -> None:
+        """
+        Called when the weight of an edge of the graph is set
+        """
+        self._credit_edge(edge, edge.weight - old)
+        if self.log is not None:
+            self.log.weight_set(edge.ends[0].node_id, edge.ends[1].node_id,
+                                edge.weight)
+
+    def _total_grossing_changed(self, movie: Movie, old: float) -> None:
+        """
+        Called when the grossing of a movie of the graph is set
+        """
+        change = movie.total_grossing - old
+        for edge in movie.get_edges():
+            for actor in edge.ends:
+                if isinstance(actor, Actor):
+                    self._credit(actor, change * edge.weight)
+        ranked = self._ranked['total_grossing']
+        ranked.remove(old, movie.node_id)
+        ranked.add(movie.total_grossing, movie.node_id)
+        if self.log is not None:
+            self.log.grossing_set(movie.node_id, movie.total_grossing)
+
+    def _nodes_of(self, node_ids: List[int]) -> List[NodeBase]:
+        return [cast(NodeBase, self.get_node_by_id(node_id))
+                for node_id in node_ids]
+
+    def top_nodes(self, attr: str, k: int) -> List[NodeBase]:
+        """
+        Find the nodes with the highest values of a ranked attribute
+        Args:
+            attr: age or grossing of actors, year or total_grossing of
+                movies
+            k: Number of nodes
+
+        Returns:
+            Up to k nodes, highest value first
+        """
+        return self._nodes_of(self._ranked[attr].largest(k))
+
+    def bottom_nodes(self, attr: str, k: int) -> List[NodeBase]:
+        """
+        Find the nodes with the lowest values of a ranked attribute
+        Args:
+            attr: age or grossing of actors, year or total_grossing of
+                movies
+            k: Number of nodes
+
+        Returns:
+            Up to k nodes, lowest value first
+        """
+        return self._nodes_of(self._ranked[attr].smallest(k))
+
+    def nodes_between(self, attr: str, low: Any, high: Any) -> List[NodeBase]:
+        """
+        Find the nodes with a value of a ranked attribute in a range
+        Args:
+            attr: age or grossing of actors, year or total_grossing of
+                movies
+            low: Lowest value
+            high: Highest value, included
+
+        Returns:
+            The nodes, lowest value first
+        """
+        return self._nodes_of(self._ranked[attr].between(low, high))
+
     def query_nodes(self, constraints: Dict[str, Any]) -> List[NodeBase]:
         """
         Query nodes with constraints
@@ -101,8 +406,15 @@ class Graph:
         Returns:
             A list of found node
         """
+        # Only scan the smallest index bucket matching a constraint
+        candidates: Sequence[NodeBase] = self._nodes
+        for attr, value in constraints.items():
+            if attr in self._indexes:
+                bucket = self._indexes[attr].get(value, [])
+                if len(bucket) < len(candidates):
+                    candidates = bucket
         result = []
-        for node in self._nodes:
+        for node in candidates:
             for attr, value in constraints.items():
                 if not hasattr(node, attr) or getattr(node, attr) != value:
                     break
@@ -123,40 +435,72 @@ class Graph:
         return json.dumps(
             {'nodes': serialized_nodes, 'edges': serialized_edges})
 
+    def bulk_load(self, nodes: Iterable[NodeBase],
+                  edges: Iterable[EdgeTuple]) -> bool:
+        """
+        Fill an empty graph at once, in time linear in its size.
+
+        Node ids are checked once, see order_nodes, duplicate edges are
+        found with a set of their ends rather than by scanning the edges
+        of each node, and adjacency lists are built in one pass.
+        Args:
+            nodes: The nodes, with their ids set
+            edges: The edges, as (node id 1, node id 2, weight)
+
+        Returns:
+            False if an id is missing or repeated, two nodes share a url,
+            an edge is repeated or points at no node. The graph is left
+            empty then.
+        """
+        if self._nodes:
+            raise ValueError('bulk_load needs an empty graph')
+        ordered = order_nodes(nodes)
+        if ordered is None:
+            return False
+        edge_tuples = check_edges(edges, len(ordered))
+        if edge_tuples is None:
+            return False
+        edge_list = []
+        for node_id_1, node_id_2, weight in edge_tuples:
+            node_1 = ordered[node_id_1]
+            node_2 = ordered[node_id_2]
+            edge = Edge(weight=weight, ends=(node_1, node_2))
+            edge._owner_ = self
+            node_1.add_edge(edge)
+            node_2.add_edge(edge)
+            edge_list.append(edge)
+        self._nodes = ordered
+        self._edges = edge_list
+        self._url_to_node = {node.url: node for node in ordered}
+        for node in ordered:
+            node._owner_ = self
+            if isinstance(node, Actor):
+                node.track_grossing()
+        self._rebuild_indexes()
+        return True
+
     def deserialize(self, json_str: str) -> bool:
         """
         Construct from json
         Args:
-            json_str:
+            json_str: A graph written by serialize
 
         Returns:
-
+            False if the json does not describe a valid graph
         """
         json_dict = json.loads(json_str)
         serialized_nodes: List[Dict[str, Any]] = json_dict['nodes']
         serialized_edges: List[Dict[str, Any]] = json_dict['edges']
 
-        # Deserialize nodes
+        nodes = []
         for node_dict in serialized_nodes:
-            cls_name = node_dict.pop('class_name')
-            module_name = node_dict.pop('module_name')
-            cls = getattr(importlib.import_module(module_name), cls_name)
-            node: NodeBase = cls()
+            cls = node_class(node_dict.pop('module_name'),
+                             node_dict.pop('class_name'))
+            node = cls()
             if not node.from_dict(node_dict):
                 return False
-            self.add_node(node, set_id=False)
-
-        self._nodes.sort(key=lambda n: n.node_id)
-
-        if self._nodes and self._nodes[-1].node_id != len(self._nodes) - 1:
-            return False
-
-        # Deserialize edge
-        for edge_dict in serialized_edges:
-            ends = edge_dict['ends']
-            edge = self.add_relationship(*ends)
-            if edge is None:
-                return False
-            edge.weight = edge_dict.get('weight', 0)
-
-        return True
+            nodes.append(node)
+        return self.bulk_load(
+            nodes, ((edge_dict['ends'][0], edge_dict['ends'][1],
+                     edge_dict.get('weight', 0))
+                    for edge_dict in serialized_edges))
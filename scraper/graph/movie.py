@@ -1,6 +1,6 @@
 from dataclasses import dataclass, field
 
-from scraper.graph.base_objects import EntityType, NodeBase
+from scraper.graph.base_objects import EntityType, GraphAttribute, NodeBase
 
 
 @dataclass
@@ -9,7 +9,8 @@ class Movie(NodeBase):
     The movie node
     """
     year: int = field(default=0)
-    total_grossing: float = field(default=0)  # in million
+    total_grossing: GraphAttribute[float] = GraphAttribute(
+        '_total_grossing_changed', 0)  # in million
 
     def __post_init__(self):
         super().__post_init__()
@@ -0,0 +1,136 @@
+import json
+import os
+from typing import Any, List
+
+from scraper.graph.base_objects import NodeBase
+from scraper.graph.graph import Graph, node_class
+from scraper.graph.movie import Movie
+from scraper.graph.stream import save_graph
+
+
+class MutationLog:
+    """
+    Append-only log of the changes made to a graph, so saving progress
+    costs the size of the changes rather than of the graph.
+
+    A graph with a log writes a json array per change, as it happens:
+    ["node", node dict] when a node is added, ["edge", node id 1, node id 2]
+    when a relationship is added, ["weight", node id 1, node id 2, weight]
+    when the weight of an edge is set, and ["grossing", node id, grossing]
+    when the grossing of a movie is. A saved graph and the log of the
+    changes made since describe the current graph, see replay, and compact
+    folds the log into a new save.
+
+    Replaying changes the save already holds leaves it as it is, so a
+    crash between the save and the truncation of the log by compact loses
+    nothing.
+    """
+
+    def __init__(self, path: str) -> None:
+        """
+        Open a log, appending to what it already holds
+        Args:
+            path: The log file
+        """
+        self.path = path
+        self._file = open(path, 'a', encoding='utf-8')
+
+    def _write(self, entry: List[Any]) -> None:
+        self._file.write(json.dumps(entry) + '\n')
+
+    def node_added(self, node: NodeBase) -> None:
+        self._write(['node', node.to_dict()])
+
+    def relationship_added(self, node_id_1: int, node_id_2: int) -> None:
+        self._write(['edge', node_id_1, node_id_2])
+
+    def weight_set(self, node_id_1: int, node_id_2: int,
+                   weight: float) -> None:
+        self._write(['weight', node_id_1, node_id_2, weight])
+
+    def grossing_set(self, node_id: int, total_grossing: float) -> None:
+        self._write(['grossing', node_id, total_grossing])
+
+    def flush(self) -> None:
+        """
+        Make the changes logged so far durable
+        """
+        self._file.flush()
+        os.fsync(self._file.fileno())
+
+    def truncate(self) -> None:
+        """
+        Drop the logged changes, once they are saved elsewhere
+        """
+        self._file.flush()
+        self._file.truncate(0)
+
+    def close(self) -> None:
+        self._file.close()
+
+
+def replay(graph: Graph, path: str) -> bool:
+    """
+    Apply the changes of a log to a graph, the graph it was written from
+    as it was when the log was last compacted. Nodes and relationships the
+    graph already has are skipped, and weights and grossing are set to the
+    last value logged, so replaying a log twice, or onto a save which holds
+    its changes, has no further effect. The graph must not have a log of
+    its own.
+    Args:
+        graph: The graph
+        path: The log file
+
+    Returns:
+        False if a change does not apply to the graph
+    """
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            if not line.endswith('\n'):
+                # Partly written when the crawl stopped
+                break
+            entry = json.loads(line)
+            if entry[0] == 'node':
+                node_dict = entry[1]
+                node = node_class(node_dict.pop('module_name'),
+                                  node_dict.pop('class_name'))()
+                if not node.from_dict(node_dict):
+                    return False
+                existing = graph.get_node(node.url)
+                if existing is not None:
+                    if existing.node_id != node_dict['node_id']:
+                        return False
+                elif (not graph.add_node(node)
+                        or node.node_id != node_dict['node_id']):
+                    return False
+            elif entry[0] == 'edge':
+                if (graph.add_relationship(entry[1], entry[2]) is None
+                        and graph.get_edge(entry[1], entry[2]) is None):
+                    return False
+            elif entry[0] == 'weight':
+                edge = graph.get_edge(entry[1], entry[2])
+                if edge is None:
+                    return False
+                edge.weight = entry[3]
+            elif entry[0] == 'grossing':
+                movie = graph.get_node_by_id(entry[1])
+                if not isinstance(movie, Movie):
+                    return False
+                movie.total_grossing = entry[2]
+            else:
+                return False
+    return True
+
+
+def compact(graph: Graph, path: str) -> None:
+    """
+    Save a graph and empty its log, the save now holding the changes. The
+    save replaces the previous one atomically and the log is emptied
+    after, see MutationLog.
+    Args:
+        graph: The graph, with a log
+        path: Where to save it, see save_graph
+    """
+    save_graph(graph, path)
+    if graph.log is not None:
+        graph.log.truncate()
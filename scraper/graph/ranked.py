@@ -0,0 +1,132 @@
+import bisect
+import itertools
+from typing import Any, Iterable, List, Tuple
+
+# (value, node id)
+RankEntry = Tuple[Any, int]
+
+
+class RankedIndex:
+    """
+    Node ids sorted by a value, for top-k, bottom-k and range queries.
+
+    Entries are (value, node id), so ties are in id order, and are kept in
+    a list of sorted lists of up to twice _LOAD entries, with the largest
+    entry of each. An update bisects the largest entries then moves the
+    entries of a single list, and a query reads k entries from the lists
+    where the values start.
+    """
+
+    _LOAD = 512
+
+    def __init__(self, entries: Iterable[RankEntry] = ()) -> None:
+        """
+        Create an index
+        Args:
+            entries: The (value, node id) to start with, in any order
+        """
+        items = sorted(entries)
+        self._lists = [items[i:i + self._LOAD]
+                       for i in range(0, len(items), self._LOAD)]
+        self._maxes = [values[-1] for values in self._lists]
+        self._size = len(items)
+
+    def __len__(self) -> int:
+        return self._size
+
+    def add(self, value: Any, node_id: int) -> None:
+        entry = (value, node_id)
+        if not self._lists:
+            self._lists.append([entry])
+            self._maxes.append(entry)
+            self._size += 1
+            return
+        i = min(bisect.bisect_left(self._maxes, entry), len(self._maxes) - 1)
+        values = self._lists[i]
+        bisect.insort(values, entry)
+        self._maxes[i] = values[-1]
+        if len(values) > 2 * self._LOAD:
+            self._lists[i:i + 1] = [values[:self._LOAD],
+                                    values[self._LOAD:]]
+            self._maxes[i:i + 1] = [values[self._LOAD - 1], values[-1]]
+        self._size += 1
+
+    def remove(self, value: Any, node_id: int) -> None:
+        """
+        Remove an entry, which must be in the index
+        """
+        entry = (value, node_id)
+        i = bisect.bisect_left(self._maxes, entry)
+        if i == len(self._maxes):
+            raise KeyError(entry)
+        values = self._lists[i]
+        j = bisect.bisect_left(values, entry)
+        if values[j] != entry:
+            raise KeyError(entry)
+        del values[j]
+        if values:
+            self._maxes[i] = values[-1]
+        else:
+            del self._lists[i]
+            del self._maxes[i]
+        self._size -= 1
+
+    def smallest(self, k: int) -> List[int]:
+        """
+        The ids of the k smallest values, smallest first
+        """
+        result: List[int] = []
+        for values in self._lists:
+            if len(result) >= k:
+                break
+            result.extend(node_id for _, node_id in values[:k - len(result)])
+        return result
+
+    def largest(self, k: int) -> List[int]:
+        """
+        The ids of the k largest values, largest first, and ties in id
+        order
+        """
+        if k <= 0 or not self._lists:
+            return []
+        # The k largest entries, largest first
+        tail: List[RankEntry] = []
+        for values in reversed(self._lists):
+            tail.extend(reversed(values[-(k - len(tail)):]))
+            if len(tail) >= k:
+                break
+        # The values above the boundary are all in the tail, while ties on
+        # it are taken in id order from the start of its run
+        boundary = tail[-1][0]
+        result: List[int] = []
+        for value, entries in itertools.groupby(tail, key=lambda e: e[0]):
+            if value == boundary:
+                break
+            result.extend(reversed([node_id for _, node_id in entries]))
+        i = bisect.bisect_left(self._maxes, (boundary,))
+        j = bisect.bisect_left(self._lists[i], (boundary,))
+        for values in self._lists[i:]:
+            for value, node_id in values[j:j + k - len(result)]:
+                if value != boundary:
+                    return result
+                result.append(node_id)
+            if len(result) >= k:
+                break
+            j = 0
+        return result
+
+    def between(self, low: Any, high: Any) -> List[int]:
+        """
+        The ids of the values from low to high included, smallest first
+        """
+        result: List[int] = []
+        i = bisect.bisect_left(self._maxes, (low,))
+        for values in self._lists[i:]:
+            if values[0][0] > high:
+                break
+            start = bisect.bisect_left(values, (low,))
+            for value, node_id in values[start:]:
+                if value > high:
+                    return result
+                result.append(node_id)
+        return result
@@ -2,6 +2,7 @@ import logging
 from typing import List, Optional, cast
 
 from scraper.graph.actor import Actor
+from scraper.graph.analytics import GraphAnalytics
 from scraper.graph.base_objects import EntityType
 from scraper.graph.graph import Graph
 from scraper.graph.movie import Movie
@@ -27,7 +28,11 @@ class ShellRunner:
                          'top_actor_grossing_value': 1,
                          'oldest_actors': 1,
                          'get_movie_of_year': 1,
-                         'get_actor_of_year': 1}
+                         'get_actor_of_year': 1,
+                         'year_totals': 0,
+                         'degree_distribution': 1}
+        # Built on the first report, the graph does not change in the shell
+        self._analytics: Optional[GraphAnalytics] = None
 
     def start(self) -> None:
         """
@@ -100,26 +105,17 @@ class ShellRunner:
 
     def top_actor_grossing_value(self, n: str) -> None:
         if n.isdigit():
-            number = int(n)
             actors = cast(List[Actor],
-                          self.graph.query_nodes({'type': EntityType.ACTOR}))
-            sorted_actors = sorted(actors, key=lambda actor: actor.grossing,
-                                   reverse=True)
-            for i in range(min(len(sorted_actors), number)):
-                actor = cast(Actor, sorted_actors[i])
+                          self.graph.top_nodes('grossing', int(n)))
+            for actor in actors:
                 print('%s has value of %.02f' % (actor.name, actor.grossing))
         else:
             print('Input a valid number')
 
     def oldest_actors(self, n: str) -> None:
         if n.isdigit():
-            number = int(n)
-            actors = cast(List[Actor],
-                          self.graph.query_nodes({'type': EntityType.ACTOR}))
-            sorted_actors = sorted(actors, key=lambda actor: actor.age,
-                                   reverse=True)
-            for i in range(min(len(sorted_actors), number)):
-                actor = cast(Actor, sorted_actors[i])
+            actors = cast(List[Actor], self.graph.top_nodes('age', int(n)))
+            for actor in actors:
                 print('%s is %d years old' % (actor.name, actor.age))
         else:
             print('Input a valid number')
@@ -147,3 +143,23 @@ class ShellRunner:
                             print(peer.name)
         else:
             print('Input a valid number')
+
+    def _get_analytics(self) -> GraphAnalytics:
+        if self._analytics is None:
+            self._analytics = GraphAnalytics(self.graph)
+        return self._analytics
+
+    def year_totals(self) -> None:
+        for year, count, total in self._get_analytics().year_totals():
+            print('%d: %d movies, total grossing of %.02f'
+                  % (year, count, total))
+
+    def degree_distribution(self, node_type: str) -> None:
+        try:
+            entity_type = EntityType[node_type]
+        except KeyError:
+            print('Invalid node type: %s' % node_type)
+            return
+        analytics = self._get_analytics()
+        for degree, count in analytics.degree_distribution(entity_type):
+            print('%d with %d edges' % (count, degree))
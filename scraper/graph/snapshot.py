@@ -0,0 +1,326 @@
+import bisect
+import mmap
+import os
+import struct
+import sys
+import tempfile
+from array import array
+from typing import (Any, Callable, Dict, Iterable, Iterator, List, Optional,
+                    Sequence, Tuple)
+
+from scraper.graph.actor import Actor
+from scraper.graph.base_objects import Edge, EntityType, NodeBase
+from scraper.graph.compact import CompactGraph, StringTable, build_csr
+from scraper.graph.graph import EdgeTuple, Graph
+from scraper.graph.movie import Movie
+from scraper.graph.ranked import RankedIndex
+
+SNAPSHOT_SUFFIX = '.snap'
+SNAPSHOT_MAGIC = b'MVGRAPH\0'
+SNAPSHOT_VERSION = 4
+
+# The arrays of a snapshot, in file order, with their typecode
+_SECTIONS = (('kinds', 'b'), ('names', 'i'), ('urls', 'i'), ('years', 'i'),
+             ('grossing', 'd'), ('ages', 'i'), ('actor_grossing', 'd'),
+             ('sources', 'i'), ('targets', 'i'), ('weights', 'd'),
+             ('offsets', 'q'), ('neighbors', 'i'), ('edge_ids', 'i'),
+             ('strings', 'B'), ('string_offsets', 'I'), ('url_order', 'i'),
+             ('name_order', 'i'), ('type_order', 'i'), ('year_order', 'i'),
+             ('age_order', 'i'), ('actor_grossing_order', 'i'),
+             ('total_grossing_order', 'i'))
+# Magic, version, byte order of the arrays, number of sections
+_HEADER = struct.Struct('<8sIII')
+# Offset in bytes and number of items of a section
+_SECTION = struct.Struct('<QQ')
+# Codes of the kinds column, as in CompactGraph
+_KIND_CODES = {EntityType.MOVIE: 0, EntityType.ACTOR: 1}
+# Codes of sys.byteorder in the header
+_BYTE_ORDERS = {'little': 0, 'big': 1}
+
+
+def is_snapshot(path: str) -> bool:
+    return path.endswith(SNAPSHOT_SUFFIX)
+
+
+def write_snapshot(graph: Graph, path: str) -> None:
+    """
+    Save a graph of movies and actors as a binary snapshot, opened with
+    SnapshotGraph. The file is replaced atomically, so a snapshot being
+    read is never overwritten.
+
+    The snapshot holds fixed width columns of node attributes and of the
+    grossing of actors, a string table of names and urls, the edges with
+    the CSR form of their adjacency, and node ids sorted by url, name,
+    type, year, age and grossing for the lookups and rankings. Arrays are
+    in the byte order of the machine, which the header records.
+    Args:
+        graph: The graph
+        path: The file
+    """
+    columns: Dict[str, Any] = {name: array(code) for name, code in _SECTIONS}
+    strings = StringTable()
+    for node in graph.iter_nodes():
+        if isinstance(node, Movie):
+            columns['kinds'].append(_KIND_CODES[EntityType.MOVIE])
+            columns['years'].append(node.year)
+            columns['grossing'].append(node.total_grossing)
+            columns['ages'].append(0)
+            columns['actor_grossing'].append(0.0)
+        elif isinstance(node, Actor):
+            columns['kinds'].append(_KIND_CODES[EntityType.ACTOR])
+            columns['years'].append(0)
+            columns['grossing'].append(0.0)
+            columns['ages'].append(node.age)
+            columns['actor_grossing'].append(node.grossing)
+        else:
+            raise TypeError('Snapshots only store movies and actors')
+        columns['names'].append(strings.add(node.name))
+        columns['urls'].append(strings.add(node.url))
+    for edge in graph.iter_edges():
+        columns['sources'].append(edge.ends[0].node_id)
+        columns['targets'].append(edge.ends[1].node_id)
+        columns['weights'].append(edge.weight)
+    num_nodes = len(columns['kinds'])
+    (columns['offsets'], columns['neighbors'],
+     columns['edge_ids']) = build_csr(num_nodes, columns['sources'],
+                                      columns['targets'])
+    columns['strings'], columns['string_offsets'] = strings.buffers()
+
+    def order(key: Callable[[int], Any],
+              node_ids: Iterable[int] = range(num_nodes)) -> 'array[int]':
+        # Sorting is stable, ids of equal keys stay in id order
+        return array('i', sorted(node_ids, key=key))
+
+    movie_ids = [i for i in range(num_nodes)
+                 if columns['kinds'][i] == _KIND_CODES[EntityType.MOVIE]]
+    actor_ids = [i for i in range(num_nodes)
+                 if columns['kinds'][i] == _KIND_CODES[EntityType.ACTOR]]
+    columns['url_order'] = order(lambda i: strings[columns['urls'][i]])
+    columns['name_order'] = order(lambda i: strings[columns['names'][i]])
+    columns['type_order'] = order(lambda i: columns['kinds'][i])
+    columns['year_order'] = order(lambda i: columns['years'][i], movie_ids)
+    columns['age_order'] = order(lambda i: columns['ages'][i], actor_ids)
+    columns['actor_grossing_order'] = order(
+        lambda i: columns['actor_grossing'][i], actor_ids)
+    columns['total_grossing_order'] = order(
+        lambda i: columns['grossing'][i], movie_ids)
+
+    position = _HEADER.size + len(_SECTIONS) * _SECTION.size
+    table = []
+    for name, _ in _SECTIONS:
+        # Sections start on 8 bytes so they can be cast in place
+        position += -position % 8
+        table.append((position, len(columns[name])))
+        position += memoryview(columns[name]).nbytes
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(path)))
+    with os.fdopen(fd, 'wb') as f:
+        f.write(_HEADER.pack(SNAPSHOT_MAGIC, SNAPSHOT_VERSION,
+                             _BYTE_ORDERS[sys.byteorder], len(_SECTIONS)))
+        for offset, length in table:
+            f.write(_SECTION.pack(offset, length))
+        for (name, _), (offset, _) in zip(_SECTIONS, table):
+            f.write(bytes(offset - f.tell()))
+            f.write(columns[name])
+    os.replace(tmp_path, path)
+
+
+class _Keys:
+    """
+    The keys of sorted ids, for bisect, which only takes a key function
+    from Python 3.10
+    """
+
+    def __init__(self, order: Sequence[int], key: Callable[[int], Any]) -> None:
+        self._order = order
+        self._key = key
+
+    def __getitem__(self, index: int) -> Any:
+        return self._key(self._order[index])
+
+    def __len__(self) -> int:
+        return len(self._order)
+
+
+class _SortedIds(RankedIndex):
+    """
+    Ranking of the ids of a snapshot sorted by a column, read in place
+    """
+
+    def __init__(self, order: Sequence[int], column: Sequence[Any]) -> None:
+        # RankedIndex.__init__ is not called, the ids are already sorted
+        self._order = order
+        self._column = column
+
+    def __len__(self) -> int:
+        return len(self._order)
+
+    def add(self, value: Any, node_id: int) -> None:
+        raise TypeError('A SnapshotGraph is read only')
+
+    def remove(self, value: Any, node_id: int) -> None:
+        raise TypeError('A SnapshotGraph is read only')
+
+    def smallest(self, k: int) -> List[int]:
+        return list(self._order[:k])
+
+    def largest(self, k: int) -> List[int]:
+        # Ties are in id order, each run of equal values is read from its
+        # start
+        keys = _Keys(self._order, self._column.__getitem__)
+        result: List[int] = []
+        end = len(self._order)
+        while end > 0 and len(result) < k:
+            start = bisect.bisect_left(keys, keys[end - 1], hi=end)
+            result.extend(self._order[start:min(end,
+                                                start + k - len(result))])
+            end = start
+        return result
+
+    def between(self, low: Any, high: Any) -> List[int]:
+        keys = _Keys(self._order, self._column.__getitem__)
+        start = bisect.bisect_left(keys, low)
+        end = bisect.bisect_right(keys, high, lo=start)
+        return list(self._order[start:end])
+
+
+class SnapshotGraph(CompactGraph):
+    """
+    Read only graph mapped from a snapshot written by write_snapshot.
+
+    Opening a snapshot only reads its header: the columns are memoryviews
+    of the mapped file, read in place, and nodes and edges are views
+    created on access as in a CompactGraph. Urls and names are found by
+    binary search in the ids sorted by them, types and years likewise,
+    and rankings read the ids sorted by their value.
+    """
+
+    def __init__(self, path: str) -> None:
+        """
+        Map a snapshot
+        Args:
+            path: The file
+
+        Raises:
+            ValueError: If the file is not a snapshot of this version, or
+                was written on a machine of another byte order
+        """
+        # CompactGraph.__init__ is not called, the arrays come from the file
+        self.path = path
+        with open(path, 'rb') as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        buffer = memoryview(self._mmap)
+        self._buffers: List[memoryview] = [buffer]
+        if len(buffer) < _HEADER.size:
+            self.close()
+            raise ValueError('%s is not a graph snapshot' % path)
+        magic, version, byte_order, num_sections = _HEADER.unpack_from(
+            buffer)
+        if magic != SNAPSHOT_MAGIC:
+            self.close()
+            raise ValueError('%s is not a graph snapshot' % path)
+        if version != SNAPSHOT_VERSION or num_sections != len(_SECTIONS):
+            self.close()
+            raise ValueError('%s is a snapshot of version %d, not %d'
+                             % (path, version, SNAPSHOT_VERSION))
+        if byte_order != _BYTE_ORDERS[sys.byteorder]:
+            self.close()
+            raise ValueError('%s was written on a machine of another byte '
+                             'order' % path)
+        sections: Dict[str, Any] = {}
+        for i, (name, code) in enumerate(_SECTIONS):
+            offset, length = _SECTION.unpack_from(
+                buffer, _HEADER.size + i * _SECTION.size)
+            size = length * array(code).itemsize
+            section = buffer[offset:offset + size]
+            sections[name] = section.cast(code)  # type: ignore
+            self._buffers += [section, sections[name]]
+        self.kinds = sections['kinds']
+        self.names = sections['names']
+        self.urls = sections['urls']
+        self.years = sections['years']
+        self.grossing = sections['grossing']
+        self.ages = sections['ages']
+        self.actor_grossing = sections['actor_grossing']
+        self.sources = sections['sources']
+        self.targets = sections['targets']
+        self.weights = sections['weights']
+        self.strings = StringTable.wrap(sections['strings'],
+                                        sections['string_offsets'])
+        self._offsets = sections['offsets']
+        self._neighbors = sections['neighbors']
+        self._edge_ids = sections['edge_ids']
+        self._built = len(self.weights)
+        self._orders = {'url': sections['url_order'],
+                        'name': sections['name_order'],
+                        'type': sections['type_order'],
+                        'year': sections['year_order']}
+        self._ranked = {
+            'age': _SortedIds(sections['age_order'], self.ages),
+            'grossing': _SortedIds(sections['actor_grossing_order'],
+                                   self.actor_grossing),
+            'year': _SortedIds(sections['year_order'], self.years),
+            'total_grossing': _SortedIds(sections['total_grossing_order'],
+                                         self.grossing)}
+        self.log = None
+
+    def close(self) -> None:
+        """
+        Unmap the file, nodes and edges of the graph can not be read after
+        """
+        for buffer in reversed(self._buffers):
+            buffer.release()
+        self._buffers = []
+        self._mmap.close()
+
+    def _range(self, attr: str, key: Callable[[int], Any],
+               value: Any) -> Sequence[int]:
+        """
+        The ids of the nodes with a value, from the ids sorted by it
+        """
+        order = self._orders[attr]
+        keys = _Keys(order, key)
+        start = bisect.bisect_left(keys, value)
+        end = bisect.bisect_right(keys, value, lo=start)
+        return order[start:end]
+
+    def _bucket(self, attr: str, value: Any) -> Optional[Sequence[int]]:
+        strings = self.strings
+        if attr in ('url', 'name'):
+            if not isinstance(value, str):
+                return ()
+            column = self.urls if attr == 'url' else self.names
+            return self._range(attr, lambda i: strings[column[i]], value)
+        if attr == 'type':
+            if value not in _KIND_CODES:
+                return ()
+            return self._range(attr, lambda i: self.kinds[i],
+                               _KIND_CODES[value])
+        if attr == 'year':
+            if not isinstance(value, int):
+                return ()
+            return self._range(attr, lambda i: self.years[i], value)
+        return None
+
+    def adjacency(self, node_id: int) -> Iterator[Tuple[int, int]]:
+        start = self._offsets[node_id]
+        end = self._offsets[node_id + 1]
+        return zip(self._neighbors[start:end], self._edge_ids[start:end])
+
+    def num_node(self, node_type: EntityType) -> int:
+        bucket = self._bucket('type', node_type)
+        return len(bucket) if bucket is not None else 0
+
+    def _find_url(self, url: str) -> Optional[int]:
+        bucket = self._bucket('url', url)
+        return bucket[0] if bucket else None
+
+    def add_node(self, node: NodeBase, set_id: bool = True) -> bool:
+        raise TypeError('A SnapshotGraph is read only')
+
+    def add_relationship(self, node_id_1: int,
+                         node_id_2: int) -> Optional[Edge]:
+        raise TypeError('A SnapshotGraph is read only')
+
+    def bulk_load(self, nodes: Iterable[NodeBase],
+                  edges: Iterable[EdgeTuple]) -> bool:
+        raise TypeError('A SnapshotGraph is read only')
@@ -0,0 +1,148 @@
+import gzip
+import io
+import json
+import os
+import tempfile
+from typing import IO, Iterator, List, Optional
+
+from scraper.graph.base_objects import NodeBase
+from scraper.graph.graph import EdgeTuple, Graph, node_class
+from scraper.graph.snapshot import is_snapshot, write_snapshot
+
+# First line of a graph in JSON Lines
+JSONL_FORMAT = 'movie-graph'
+JSONL_VERSION = 1
+
+
+def open_text(path: str, mode: str = 'r') -> IO[str]:
+    """
+    Open a text file, compressed with gzip if its name ends with .gz or
+    with zstd if it ends with .zst
+    Args:
+        path: The file
+        mode: 'r' or 'w'
+
+    Returns:
+        The file, decompressing or compressing on the fly
+    """
+    if path.endswith('.gz'):
+        return io.TextIOWrapper(gzip.GzipFile(path, mode + 'b'),
+                                encoding='utf-8')
+    if path.endswith('.zst'):
+        try:
+            import zstandard
+        except ImportError:
+            raise ValueError('%s needs the zstandard package' % path)
+        if mode == 'r':
+            stream = zstandard.ZstdDecompressor().stream_reader(
+                open(path, 'rb'), closefd=True)
+        else:
+            stream = zstandard.ZstdCompressor().stream_writer(
+                open(path, 'wb'), closefd=True)
+        return io.TextIOWrapper(stream, encoding='utf-8')
+    return open(path, mode, encoding='utf-8')
+
+
+def is_jsonl(path: str) -> bool:
+    """
+    Whether a file holds a graph in JSON Lines, whatever its compression
+    """
+    for suffix in ('.gz', '.zst'):
+        if path.endswith(suffix):
+            path = path[:-len(suffix)]
+    return path.endswith('.jsonl')
+
+
+def dump_jsonl(graph: Graph, f: IO[str]) -> None:
+    """
+    Write a graph one line at a time: a header, then a json object per
+    node in id order, then a [node id 1, node id 2, weight] array per edge
+    Args:
+        graph: The graph
+        f: The text file to write to
+    """
+    f.write(json.dumps({'format': JSONL_FORMAT,
+                        'version': JSONL_VERSION}) + '\n')
+    for node in graph.iter_nodes():
+        f.write(json.dumps(node.to_dict()) + '\n')
+    for edge in graph.iter_edges():
+        f.write(json.dumps([edge.ends[0].node_id, edge.ends[1].node_id,
+                            edge.weight]) + '\n')
+
+
+def load_jsonl(graph: Graph, f: IO[str]) -> bool:
+    """
+    Read a graph written by dump_jsonl into an empty graph, one line at
+    a time
+    Args:
+        graph: The graph to fill
+        f: The text file to read from
+
+    Returns:
+        False if the file does not hold a valid graph
+    """
+    header = json.loads(f.readline() or 'null')
+    if (not isinstance(header, dict)
+            or header.get('format') != JSONL_FORMAT
+            or header.get('version') != JSONL_VERSION):
+        return False
+    nodes: List[NodeBase] = []
+    first_edge: Optional[List[float]] = None
+    for line in f:
+        item = json.loads(line)
+        if isinstance(item, list):
+            first_edge = item
+            break
+        node = node_class(item.pop('module_name'), item.pop('class_name'))()
+        if not node.from_dict(item):
+            return False
+        nodes.append(node)
+
+    def edges() -> Iterator[EdgeTuple]:
+        if first_edge is None:
+            return
+        node_id_1, node_id_2, weight = first_edge
+        yield int(node_id_1), int(node_id_2), weight
+        for line in f:
+            node_id_1, node_id_2, weight = json.loads(line)
+            yield node_id_1, node_id_2, weight
+
+    return graph.bulk_load(nodes, edges())
+
+
+def save_graph(graph: Graph, path: str) -> None:
+    """
+    Save a graph, as a binary snapshot if the name ends with .snap,
+    streamed as JSON Lines if it ends with .jsonl (.gz or .zst), in one
+    json document otherwise. The file is replaced atomically, so a crash
+    leaves either the previous save or the new one.
+    """
+    if is_snapshot(path):
+        write_snapshot(graph, path)
+        return
+    # Same suffix, which tells open_text the compression
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(path)),
+                                    suffix=os.path.basename(path))
+    os.close(fd)
+    with open_text(tmp_path, 'w') as f:
+        if is_jsonl(path):
+            dump_jsonl(graph, f)
+        else:
+            f.write(graph.serialize())
+    os.replace(tmp_path, path)
+
+
+def load_graph(graph: Graph, path: str) -> bool:
+    """
+    Load a graph saved by save_graph into an empty graph. Snapshots are
+    not loaded but mapped, by SnapshotGraph.
+    Returns:
+        False if the file does not hold a valid graph
+    """
+    if is_snapshot(path):
+        raise ValueError('%s is a snapshot, open it with SnapshotGraph'
+                         % path)
+    with open_text(path, 'r') as f:
+        if is_jsonl(path):
+            return load_jsonl(graph, f)
+        return graph.deserialize(f.read())
@@ -1,6 +1,6 @@
 import logging
 import re
-from typing import Dict, List
+from typing import Dict, List, Optional, cast
 from urllib import parse
 
 from bs4.element import Tag
@@ -61,7 +61,6 @@ class ActorParser:
         Returns:
             List of urls
         """
-        urls = []
         filmography_sections = html.find_all('span', id='Filmography')
         if len(filmography_sections) != 1:
             logger.log(logging.WARN,
@@ -84,6 +83,18 @@ class ActorParser:
                             break
                     if found:
                         break
+        return self.parse_filmography_table(cast(Optional[Tag], table))
+
+    def parse_filmography_table(self, table: Optional[Tag]) -> List[Url]:
+        """
+        Parse the movies out of the film table of the filmography
+        Args:
+            table: The table element, None if there isn't one
+
+        Returns:
+            List of urls
+        """
+        urls = []
         if table:
             for tr in filter(lambda tr: hasattr(tr, 'contents'), table.tbody):
                 for td in filter(lambda td: hasattr(td, 'find_all'),
@@ -0,0 +1,400 @@
+import gzip
+import mmap
+import os
+import tempfile
+import threading
+import time
+import uuid
+import zlib
+from abc import ABC, abstractmethod
+from email.utils import formatdate
+from http.client import responses
+from typing import BinaryIO, Dict, Optional, Tuple
+from urllib import parse
+
+from scraper.spider.fetcher import (REDIRECT_STATUSES, FetchError,
+                                    FetchResult, Fetcher)
+from scraper.spider.page_cache import canonical_cache_key
+
+_CHUNK_SIZE = 64 * 1024
+
+# Headers describing the transfer, not the decoded body that is stored
+_TRANSFER_HEADERS = ('content-encoding', 'transfer-encoding',
+                     'content-length', 'connection', 'keep-alive')
+
+
+def _parse_headers(lines: bytes) -> Tuple[str, Dict[str, str]]:
+    """
+    Split a header block into its first line and lower cased headers
+    """
+    first, *rest = lines.decode('iso-8859-1').split('\r\n')
+    headers = {}
+    for line in rest:
+        name, _, value = line.partition(':')
+        headers[name.strip().lower()] = value.strip()
+    return first, headers
+
+
+def _dechunk(body: bytes) -> bytes:
+    chunks = []
+    position = 0
+    while True:
+        line_end = body.find(b'\r\n', position)
+        if line_end < 0:
+            break
+        size = int(body[position:line_end].split(b';')[0] or b'0', 16)
+        if size == 0:
+            break
+        chunks.append(body[line_end + 2:line_end + 2 + size])
+        position = line_end + 4 + size
+    return b''.join(chunks)
+
+
+def parse_http_response(block: bytes) -> Tuple[int, Dict[str, str], bytes]:
+    """
+    Parse an archived http response
+    Args:
+        block: Status line, headers and body as sent by the server
+
+    Returns:
+        The status, the lower cased headers and the decoded body
+    """
+    head_end = block.find(b'\r\n\r\n')
+    if head_end < 0:
+        raise ValueError('Invalid http response')
+    status_line, headers = _parse_headers(block[:head_end])
+    body = block[head_end + 4:]
+    if 'chunked' in headers.get('transfer-encoding', '').lower():
+        body = _dechunk(body)
+    encoding = headers.get('content-encoding', '').lower()
+    if encoding in ('gzip', 'x-gzip'):
+        body = zlib.decompress(body, 16 + zlib.MAX_WBITS)
+    elif encoding == 'deflate':
+        body = zlib.decompress(body)
+    return int(status_line.split()[1]), headers, body
+
+
+def _parse_warc_record(record: bytes) -> Tuple[Dict[str, str], bytes]:
+    """
+    Split a WARC record into its headers and content block
+    """
+    head_end = record.find(b'\r\n\r\n')
+    version, headers = _parse_headers(record[:head_end])
+    if not version.startswith('WARC/'):
+        raise ValueError('Invalid WARC record')
+    length = int(headers['content-length'])
+    return headers, record[head_end + 4:head_end + 4 + length]
+
+
+class ArchiveSource(Fetcher):
+    """
+    Serve pages from an archive instead of the network.
+
+    Redirects stored in the archive are followed, pages missing from it
+    raise a 404 FetchError.
+    """
+
+    def __init__(self, max_redirects: int = 5) -> None:
+        super().__init__()
+        self.max_redirects = max_redirects
+
+    @abstractmethod
+    def _read(self, url: str) -> Optional[Tuple[int, Dict[str, str], bytes]]:
+        """
+        Look up a page
+        Returns:
+            The status, headers and body, or None if it is not archived
+        """
+
+    def fetch(self, url: str,
+              headers: Optional[Dict[str, str]] = None) -> FetchResult:
+        start = time.perf_counter()
+        current_url = url
+        for _ in range(self.max_redirects + 1):
+            page = self._read(current_url)
+            if page is None:
+                self.stats.record_error()
+                raise FetchError(url, 404, 'Not archived')
+            status, response_headers, body = page
+            location = response_headers.get('location')
+            if status in REDIRECT_STATUSES and location:
+                current_url = parse.urljoin(current_url, location)
+                continue
+            break
+        if not 200 <= status < 300:
+            self.stats.record_error()
+            raise FetchError(url, status, 'Archived error',
+                             response_headers)
+        result = FetchResult(url=current_url, status=status, body=body,
+                             headers=response_headers,
+                             elapsed=time.perf_counter() - start,
+                             wire_bytes=len(body))
+        self.stats.record(result)
+        return result
+
+
+class WarcSource(ArchiveSource):
+    """
+    Pages of a WARC file, plain or with one gzip member per record.
+
+    The file is memory mapped and indexed once by target url. Reading a
+    page then only touches, and for .warc.gz decompresses, its own record.
+    """
+
+    def __init__(self, path: str, max_redirects: int = 5) -> None:
+        super().__init__(max_redirects)
+        self.path = path
+        self._file = open(path, 'rb')
+        size = os.fstat(self._file.fileno()).st_size
+        self._map: Optional[mmap.mmap] = None
+        if size:
+            self._map = mmap.mmap(self._file.fileno(), 0,
+                                  access=mmap.ACCESS_READ)
+        self._compressed = path.endswith('.gz')
+        # canonical url -> (offset, length) of its record
+        self._index: Dict[str, Tuple[int, int]] = {}
+        if self._map is not None:
+            if self._compressed:
+                self._index_members()
+            else:
+                self._index_records()
+
+    def _add(self, headers: Dict[str, str], offset: int, length: int) -> None:
+        if (headers.get('warc-type') == 'response'
+                and 'warc-target-uri' in headers):
+            url = headers['warc-target-uri'].strip('<>')
+            self._index[canonical_cache_key(url)] = (offset, length)
+
+    def _index_records(self) -> None:
+        assert self._map is not None
+        data = self._map
+        offset = 0
+        while offset < len(data):
+            head_end = data.find(b'\r\n\r\n', offset)
+            if head_end < 0:
+                break
+            version, headers = _parse_headers(data[offset:head_end])
+            if not version.startswith('WARC/'):
+                raise ValueError('Invalid WARC record at %d in %s'
+                                 % (offset, self.path))
+            end = head_end + 4 + int(headers['content-length'])
+            self._add(headers, offset, end - offset)
+            # Records are followed by an empty line
+            offset = end + 4
+
+    def _index_members(self) -> None:
+        """
+        Find the gzip member of each record, decompressing in chunks
+        """
+        assert self._map is not None
+        data = self._map
+        offset = 0
+        while offset < len(data):
+            decoder = zlib.decompressobj(16 + zlib.MAX_WBITS)
+            record = b''
+            position = offset
+            while not decoder.eof and position < len(data):
+                chunk = data[position:position + _CHUNK_SIZE]
+                position += len(chunk)
+                decoded = decoder.decompress(chunk)
+                # Only the WARC headers are needed
+                if b'\r\n\r\n' not in record:
+                    record += decoded
+            end = position - len(decoder.unused_data)
+            headers, _ = _parse_warc_record(record)
+            self._add(headers, offset, end - offset)
+            offset = end
+
+    def _read(self, url: str) -> Optional[Tuple[int, Dict[str, str], bytes]]:
+        location = self._index.get(canonical_cache_key(url))
+        if location is None or self._map is None:
+            return None
+        offset, length = location
+        record = self._map[offset:offset + length]
+        if self._compressed:
+            record = gzip.decompress(record)
+        _, block = _parse_warc_record(record)
+        return parse_http_response(block)
+
+    def __len__(self) -> int:
+        return len(self._index)
+
+    def close(self) -> None:
+        if self._map is not None:
+            self._map.close()
+        self._file.close()
+
+
+def url_to_path(directory: str, url: str) -> str:
+    """
+    Where a mirrored page is stored: directory/host/path. Path segments
+    are decoded, except for slashes within a segment such as the one of
+    /wiki/Face%2FOff.
+    Args:
+        directory: The mirror directory
+        url: The full url
+
+    Returns:
+        The file path
+    """
+    parts = parse.urlsplit(canonical_cache_key(url))
+    relative = '/'.join(parse.unquote(segment).replace('/', '%2F')
+                        for segment in parts.path.split('/'))
+    relative = relative.lstrip('/') or 'index.html'
+    if parts.query:
+        relative += '?' + parts.query
+    path = os.path.normpath(os.path.join(directory, parts.netloc, relative))
+    if not path.startswith(os.path.normpath(directory) + os.sep):
+        raise ValueError('Url outside of the mirror: %s' % url)
+    return path
+
+
+class DirectorySource(ArchiveSource):
+    """
+    Pages of a mirror directory laid out as host/path, e.g. by wget
+    """
+
+    def __init__(self, directory: str, max_redirects: int = 5) -> None:
+        super().__init__(max_redirects)
+        self.directory = directory
+
+    def _read(self, url: str) -> Optional[Tuple[int, Dict[str, str], bytes]]:
+        try:
+            path = url_to_path(self.directory, url)
+        except ValueError:
+            return None
+        for candidate in (path, path + '.html'):
+            if os.path.isfile(candidate):
+                with open(candidate, 'rb') as f:
+                    return 200, {}, f.read()
+        return None
+
+
+class ArchiveWriter(ABC):
+    """
+    Base class of the archive formats live responses are recorded into
+    """
+
+    @abstractmethod
+    def write(self, url: str, result: FetchResult) -> None:
+        """
+        Store the response to a request
+        Args:
+            url: The requested url
+            result: The response, possibly for a redirected url
+        """
+
+    def close(self) -> None:
+        pass
+
+
+class WarcWriter(ArchiveWriter):
+    """
+    Append response records to a WARC file, gzip compressed per record
+    if the path ends with .gz. Redirects are stored as 301 responses.
+    """
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self._compressed = path.endswith('.gz')
+        self._lock = threading.Lock()
+        self._file: BinaryIO = open(path, 'ab')
+
+    @staticmethod
+    def _http_block(status: int, headers: Dict[str, str],
+                    body: bytes) -> bytes:
+        lines = ['HTTP/1.1 %d %s' % (status, responses.get(status, ''))]
+        for name, value in headers.items():
+            if name.lower() not in _TRANSFER_HEADERS:
+                lines.append('%s: %s' % (name, value))
+        lines.append('Content-Length: %d' % len(body))
+        return ('\r\n'.join(lines) + '\r\n\r\n').encode('iso-8859-1') + body
+
+    def _record(self, url: str, block: bytes) -> bytes:
+        headers = ['WARC/1.0',
+                   'WARC-Type: response',
+                   'WARC-Record-ID: <urn:uuid:%s>' % uuid.uuid4(),
+                   'WARC-Date: %s' % time.strftime('%Y-%m-%dT%H:%M:%SZ',
+                                                   time.gmtime()),
+                   'WARC-Target-URI: %s' % url,
+                   'Content-Type: application/http;msgtype=response',
+                   'Content-Length: %d' % len(block)]
+        record = (('\r\n'.join(headers) + '\r\n\r\n').encode('utf-8')
+                  + block + b'\r\n\r\n')
+        return gzip.compress(record) if self._compressed else record
+
+    def write(self, url: str, result: FetchResult) -> None:
+        records = []
+        if result.url != url:
+            records.append(self._record(url, self._http_block(
+                301, {'Location': result.url, 'Date': formatdate()}, b'')))
+        records.append(self._record(result.url, self._http_block(
+            result.status, result.headers, result.body)))
+        with self._lock:
+            self._file.write(b''.join(records))
+            self._file.flush()
+
+    def close(self) -> None:
+        with self._lock:
+            self._file.close()
+
+
+class DirectoryWriter(ArchiveWriter):
+    """
+    Mirror pages into a directory laid out as host/path. A redirected page
+    is stored under both the requested and the final url.
+    """
+
+    def __init__(self, directory: str) -> None:
+        self.directory = directory
+
+    def write(self, url: str, result: FetchResult) -> None:
+        for page_url in {url, result.url}:
+            path = url_to_path(self.directory, page_url)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path))
+            with os.fdopen(fd, 'wb') as f:
+                f.write(result.body)
+            os.replace(tmp_path, path)
+
+
+class RecordingFetcher(Fetcher):
+    """
+    Record every page downloaded by another fetcher into an archive
+    """
+
+    def __init__(self, fetcher: Fetcher, writer: ArchiveWriter) -> None:
+        super().__init__(fetcher.timeout)
+        self.fetcher = fetcher
+        self.writer = writer
+        self.stats = fetcher.stats
+
+    def fetch(self, url: str,
+              headers: Optional[Dict[str, str]] = None) -> FetchResult:
+        result = self.fetcher.fetch(url, headers)
+        if 200 <= result.status < 300:
+            self.writer.write(url, result)
+        return result
+
+    def close(self) -> None:
+        self.fetcher.close()
+        self.writer.close()
+
+
+def open_source(path: str) -> ArchiveSource:
+    """
+    Read pages from a WARC file or a mirror directory
+    """
+    if os.path.isdir(path):
+        return DirectorySource(path)
+    return WarcSource(path)
+
+
+def open_writer(path: str) -> ArchiveWriter:
+    """
+    Record pages into a WARC file if the path ends with .warc or
+    .warc.gz, into a mirror directory otherwise
+    """
+    if path.endswith(('.warc', '.warc.gz')):
+        return WarcWriter(path)
+    return DirectoryWriter(path)
@@ -0,0 +1,153 @@
+import asyncio
+import logging
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Any, Dict, Optional, Set, Tuple
+from urllib import parse
+
+from tqdm import tqdm
+
+from scraper.graph.base_objects import Url
+from scraper.spider.extract import PageRecord
+from scraper.spider.fetcher import FetchError
+from scraper.spider.frontier import QueueEntry
+from scraper.spider.spider_runner import PROGRESS_BAR_FORMAT, SpiderRunner
+
+logger = logging.getLogger('Web-Scraper')
+
+# (requested url, extracted page or None if duplicate or failed, error)
+Download = Tuple[Url, Optional[PageRecord], Optional[FetchError]]
+
+
+class AsyncSpiderRunner(SpiderRunner):
+    """
+    Spider runner that keeps several page fetches in flight.
+
+    Fetching happens on a thread pool driven by an asyncio event loop. Html
+    parsing runs on the same threads, or on a pool of parser processes when
+    parse_workers is set, which only send back compact PageRecords. The
+    loop itself is the only writer of the graph: finished pages are merged
+    one at a time in the order they complete.
+    """
+
+    def __init__(self, init_url: Url, concurrency: int = 16,
+                 per_host: int = 8, parse_workers: int = 0,
+                 **kwargs: Any) -> None:
+        """
+        Create an async spider runner.
+        Args:
+            init_url: Has to be a url to a movie.
+            concurrency: Maximum number of pages in flight
+            per_host: Maximum number of pages in flight for a single host
+            parse_workers: Number of parser processes. 0 parses on the
+                fetching threads
+            **kwargs: Passed on to SpiderRunner
+        """
+        super().__init__(init_url, **kwargs)
+        self.concurrency = max(1, concurrency)
+        self.per_host = max(1, per_host)
+        self.parse_workers = parse_workers
+        self._host_semaphores: Dict[str, asyncio.Semaphore] = {}
+        self._in_flight_entries: Dict[Url, QueueEntry] = {}
+
+    def _host_semaphore(self, url: Url) -> asyncio.Semaphore:
+        host = parse.urlparse(self.get_full_url(url, self.base_url)).netloc
+        if host not in self._host_semaphores:
+            self._host_semaphores[host] = asyncio.Semaphore(self.per_host)
+        return self._host_semaphores[host]
+
+    async def _download(self, fetch_pool: Executor, parse_pool: Executor,
+                        url: Url) -> Download:
+        loop = asyncio.get_event_loop()
+        async with self._host_semaphore(url):
+            try:
+                result = await loop.run_in_executor(fetch_pool, self._fetch,
+                                                    url)
+            except FetchError as e:
+                return url, None, e
+        self.pages_fetched += 1
+        final_url = self._resolve(url, result)
+        if final_url is None:
+            return url, None, None
+        if final_url != url and final_url in self._in_flight_entries:
+            self.metrics.skipped.inc(reason='in_flight')
+            return url, None, None
+        key, record = await loop.run_in_executor(
+            fetch_pool, self._cached_record, final_url, result.body)
+        if record is None:
+            record = await loop.run_in_executor(parse_pool, self.extractor,
+                                                final_url, result.body)
+            await loop.run_in_executor(fetch_pool, self._cache_record, key,
+                                       record)
+        return url, record, None
+
+    async def _crawl(self, progress_bar: tqdm) -> None:
+        previous_percent = 0.0
+        in_flight: Set[asyncio.Future] = set()
+        fetch_pool = ThreadPoolExecutor(max_workers=self.concurrency)
+        parse_pool: Executor = fetch_pool
+        if self.parse_workers > 0:
+            parse_pool = ProcessPoolExecutor(max_workers=self.parse_workers)
+        try:
+            self._apply_budget()
+            while True:
+                while (len(in_flight) < self.concurrency
+                       and not self.frontier.empty()
+                       and not self._limits_reached()):
+                    entry = self.frontier.get()
+                    url, predecessor, weight, _ = entry
+                    url = self.canonicalizer.canonicalize(url)
+                    if url in self.seen or url in self._in_flight_entries:
+                        logger.debug('skip %s' % url)
+                        self.metrics.skipped.inc(
+                            reason='seen' if url in self.seen
+                            else 'in_flight')
+                        self._entry_done(entry)
+                        continue
+                    logger.info(url)
+                    logger.debug('%s %s %s' % (url, predecessor, weight))
+                    self._in_flight_entries[url] = entry
+                    in_flight.add(asyncio.ensure_future(
+                        self._download(fetch_pool, parse_pool, url)))
+                self.metrics.queue_depth.set(len(self.frontier))
+                self.metrics.in_flight.set(len(in_flight))
+                if not in_flight or self._limits_reached():
+                    break
+                done, in_flight = await asyncio.wait(
+                    in_flight, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    url, record, error = task.result()
+                    entry = self._in_flight_entries.pop(url)
+                    _, predecessor, weight, depth = entry
+                    if error is not None:
+                        self._fetch_failed(entry, error)
+                    if record is not None:
+                        self._mark_seen(url)
+                        if record.url != url:
+                            self._mark_seen(record.url)
+                        self._merge(record, predecessor, weight, depth)
+                    self._entry_done(entry)
+                    previous_percent = self._update_progress(
+                        progress_bar, previous_percent)
+                    if self.checkpointer:
+                        self.checkpointer.tick(self)
+        finally:
+            for task in in_flight:
+                task.cancel()
+            if in_flight:
+                await asyncio.wait(in_flight)
+            fetch_pool.shutdown(wait=False)
+            if parse_pool is not fetch_pool:
+                parse_pool.shutdown()
+
+    def run(self):
+        loop = asyncio.new_event_loop()
+        try:
+            with tqdm(total=100, bar_format=PROGRESS_BAR_FORMAT) as bar:
+                loop.run_until_complete(self._crawl(bar))
+        except KeyboardInterrupt:
+            logger.info('Terminated due to keyboard interrupt')
+        finally:
+            loop.close()
+        if self.checkpointer:
+            self.checkpointer.save(self)
+        logger.info(self.fetcher.stats.summary())
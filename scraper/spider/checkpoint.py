@@ -0,0 +1,250 @@
+import json
+import logging
+import os
+from typing import TYPE_CHECKING, Any, Dict, List, Optional, Tuple, cast
+
+from scraper.graph.base_objects import Url
+from scraper.graph.movie import Movie
+from scraper.spider.frontier import QueueEntry, expected_page_type
+from scraper.spider.utils import PageType
+
+if TYPE_CHECKING:
+    from scraper.spider.spider_runner import SpiderRunner
+
+logger = logging.getLogger('Web-Scraper')
+
+
+class Checkpointer:
+    """
+    Periodic, crash consistent snapshots of a crawl.
+
+    The graph, the seen urls and the frontier are kept in append-only
+    logs. Each checkpoint only appends what changed since the previous one:
+    new nodes, new edges, newly seen urls, and for the frontier the
+    entries queued, numbered, and the numbers of the entries done with. The
+    runner reports both as they happen, see record_put and record_done, so
+    a checkpoint costs as much as the pages crawled since the previous one
+    whatever the length of the frontier. An entry is done once its page is
+    merged, skipped or queued again, so entries being fetched stay in the
+    checkpoint, or once its type of page is closed. The checkpoint is
+    committed by atomically replacing state.json, which records how many
+    bytes of each log belong to it, so a crash in the middle of a
+    checkpoint leaves the previous one intact.
+    """
+
+    _LOGS = ('nodes', 'edges', 'seen', 'frontier')
+    _VERSION = 3
+
+    def __init__(self, directory: str, interval: int = 100) -> None:
+        """
+        Create a checkpointer
+        Args:
+            directory: Where the checkpoint files are kept
+            interval: Number of pages between two checkpoints
+        """
+        self.directory = directory
+        self.interval = interval
+        os.makedirs(directory, exist_ok=True)
+        self._offsets: Optional[Dict[str, int]] = None
+        self._node_count = 0
+        self._edge_count = 0
+        self._new_seen: List[Url] = []
+        # Numbers of the entries queued and not done, by id of the entry.
+        # Entries are the same tuples from put to get, and are kept here so
+        # that their id is not reused by another entry meanwhile
+        self._entry_numbers: Dict[int, Tuple[int, QueueEntry]] = {}
+        self._next_entry = 0
+        # Entries queued and numbers of those done since the last checkpoint
+        self._new_entries: Dict[int, QueueEntry] = {}
+        self._new_done: List[int] = []
+        self._pages_since = 0
+
+    def _path(self, name: str) -> str:
+        return os.path.join(self.directory, name)
+
+    def _log_path(self, log: str) -> str:
+        return self._path(log + '.jsonl')
+
+    def _read_state(self) -> Optional[Dict[str, Any]]:
+        try:
+            with open(self._path('state.json'), 'r') as f:
+                state = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if state.get('version') != self._VERSION:
+            return None
+        return state
+
+    def _read_log(self, log: str) -> List[Any]:
+        """
+        Read the committed part of a log
+        """
+        assert self._offsets is not None
+        with open(self._log_path(log), 'rb') as f:
+            data = f.read(self._offsets[log])
+        return [json.loads(line) for line in data.splitlines() if line]
+
+    def _truncate_logs(self) -> None:
+        """
+        Drop anything written after the last committed checkpoint
+        """
+        assert self._offsets is not None
+        for log in self._LOGS:
+            with open(self._log_path(log), 'ab') as f:
+                f.truncate(self._offsets[log])
+
+    def record_seen(self, url: Url) -> None:
+        self._new_seen.append(url)
+
+    def record_put(self, entry: QueueEntry) -> None:
+        """
+        Called by the runner with each entry it queues
+        """
+        self._entry_numbers[id(entry)] = (self._next_entry, entry)
+        self._new_entries[self._next_entry] = entry
+        self._next_entry += 1
+
+    def record_done(self, entry: QueueEntry) -> None:
+        """
+        Called by the runner with each entry taken out of the frontier, once
+        its page is merged, skipped or queued again
+        """
+        numbered = self._entry_numbers.pop(id(entry), None)
+        if numbered is None:
+            return
+        number = numbered[0]
+        # Done before it was ever saved
+        if self._new_entries.pop(number, None) is None:
+            self._new_done.append(number)
+
+    def record_closed(self, page_type: PageType) -> None:
+        """
+        Called by the runner when it closes a type of page, whose entries
+        the frontier dropped
+        """
+        for _, entry in list(self._entry_numbers.values()):
+            if expected_page_type(entry) == page_type:
+                self.record_done(entry)
+
+    def restore(self, runner: 'SpiderRunner') -> bool:
+        """
+        Load the last checkpoint into a runner
+        Args:
+            runner: The runner to resume
+
+        Returns:
+            True if a checkpoint was found and loaded
+        """
+        state = self._read_state()
+        if state is None:
+            return False
+        self._offsets = state['offsets']
+        graph = type(runner.graph)()
+        if not graph.deserialize(json.dumps(
+                {'nodes': self._read_log('nodes'),
+                 'edges': self._read_log('edges')})):
+            logger.error('Corrupted checkpoint in %s' % self.directory)
+            self._offsets = None
+            return False
+        seen = self._read_log('seen')
+        # Entries not done, in the order they were queued
+        frontier: Dict[int, List[Any]] = {}
+        for delta in self._read_log('frontier'):
+            for number, *entry in delta['put']:
+                frontier[number] = entry
+            for number in delta['done']:
+                del frontier[number]
+        self._truncate_logs()
+
+        nodes = graph.nodes
+        runner.graph = graph
+        for urls in seen:
+            runner.seen.update(urls)
+        runner.pages_fetched = state['pages_fetched']
+        runner.frontier.clear()
+        self._entry_numbers = {}
+        for number, (url, predecessor_id, weight, depth) in frontier.items():
+            predecessor = None
+            if predecessor_id is not None:
+                predecessor = cast(Movie, nodes[predecessor_id])
+            entry = (url, predecessor, weight, depth)
+            runner.frontier.put(entry)
+            self._entry_numbers[id(entry)] = (number, entry)
+        self._next_entry = state['next_entry']
+        self._node_count = len(nodes)
+        self._edge_count = len(graph.edges)
+        self._new_seen = []
+        self._new_entries = {}
+        self._new_done = []
+        logger.info('Resumed from checkpoint: %d nodes, %d queued urls' % (
+            len(nodes), len(frontier)))
+        return True
+
+    def tick(self, runner: 'SpiderRunner') -> None:
+        """
+        Count a processed page and checkpoint once the interval is reached
+        """
+        self._pages_since += 1
+        if self._pages_since >= self.interval:
+            self.save(runner)
+
+    @staticmethod
+    def _append(path: str, lines: List[str]) -> int:
+        with open(path, 'ab') as f:
+            if lines:
+                f.write(''.join(line + '\n' for line in lines).encode())
+                f.flush()
+                os.fsync(f.fileno())
+            return f.tell()
+
+    def save(self, runner: 'SpiderRunner') -> None:
+        """
+        Write a checkpoint of the runner
+        """
+        if self._offsets is None:
+            # Fresh crawl, discard whatever was in the directory
+            self._offsets = {log: 0 for log in self._LOGS}
+            self._truncate_logs()
+        graph = runner.graph
+        new_nodes = graph.nodes_from(self._node_count)
+        new_edges = graph.edges_from(self._edge_count)
+
+        offsets = {
+            'nodes': self._append(
+                self._log_path('nodes'),
+                [json.dumps(node.to_dict()) for node in new_nodes]),
+            'edges': self._append(
+                self._log_path('edges'),
+                [json.dumps(edge.to_dict()) for edge in new_edges]),
+            'seen': self._append(
+                self._log_path('seen'),
+                [json.dumps(self._new_seen)] if self._new_seen else []),
+            'frontier': self._append(
+                self._log_path('frontier'),
+                [json.dumps({'put': [
+                    (number, url,
+                     predecessor.node_id if predecessor else None, weight,
+                     depth)
+                    for number, (url, predecessor, weight, depth)
+                    in self._new_entries.items()],
+                    'done': self._new_done})])}
+        state = {'version': self._VERSION,
+                 'offsets': offsets,
+                 'pages_fetched': runner.pages_fetched,
+                 'num_nodes': self._node_count + len(new_nodes),
+                 'num_edges': self._edge_count + len(new_edges),
+                 'next_entry': self._next_entry}
+        tmp_path = self._path('state.json.tmp')
+        with open(tmp_path, 'w') as f:
+            json.dump(state, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self._path('state.json'))
+
+        self._offsets = offsets
+        self._node_count += len(new_nodes)
+        self._edge_count += len(new_edges)
+        self._new_seen = []
+        self._new_entries = {}
+        self._new_done = []
+        self._pages_since = 0
@@ -0,0 +1,143 @@
+import hashlib
+import math
+from typing import Dict, Iterable, Optional, Set, cast
+from urllib import parse
+
+from scraper.graph.base_objects import Url
+
+# Characters MediaWiki leaves unescaped in article paths
+_SAFE_PATH_CHARS = "/:@!$'()*,;~-._"
+
+
+class UrlCanonicalizer:
+    """
+    Maps the different spellings of an article url to a single one.
+
+    Urls on the crawled site are reduced to their path, fragments are
+    dropped, percent-encoding is normalized and spaces become underscores.
+    Redirects seen while fetching are remembered, so later links to the
+    redirect page resolve to the page it points at.
+    """
+
+    def __init__(self, base_url: str) -> None:
+        self.base_url = base_url
+        self._host = parse.urlsplit(base_url).netloc.lower()
+        self.aliases: Dict[Url, Url] = {}
+
+    def _normalize(self, url: str) -> Url:
+        parts = parse.urlsplit(url)
+        if parts.netloc and parts.netloc.lower() != self._host:
+            # Another site, only drop the fragment
+            return cast(Url, parse.urlunsplit(parts._replace(fragment='')))
+        path = parse.unquote(parts.path)
+        if path.startswith('/wiki/'):
+            path = path.replace(' ', '_')
+        path = parse.quote(path, safe=_SAFE_PATH_CHARS)
+        if parts.query:
+            path += '?' + parts.query
+        return cast(Url, path)
+
+    def canonicalize(self, url: str) -> Url:
+        """
+        Get the canonical form of a url
+        Args:
+            url: A relative or absolute url
+
+        Returns:
+            The canonical url, relative to the site
+        """
+        normalized = self._normalize(url)
+        return self.aliases.get(normalized, normalized)
+
+    def learn_redirect(self, url: str, final_url: str) -> Url:
+        """
+        Remember where a url ended up after redirects
+        Args:
+            url: The requested url
+            final_url: The url of the response
+
+        Returns:
+            The canonical form of the final url
+        """
+        source = self._normalize(url)
+        target = self.canonicalize(final_url)
+        if source != target:
+            self.aliases[source] = target
+        return target
+
+
+class SeenSet:
+    """
+    Exact set of urls already crawled
+    """
+
+    def __init__(self) -> None:
+        self._urls: Set[Url] = set()
+
+    def add(self, url: Url) -> None:
+        self._urls.add(url)
+
+    def update(self, urls: Iterable[Url]) -> None:
+        for url in urls:
+            self.add(url)
+
+    def __contains__(self, url: object) -> bool:
+        return url in self._urls
+
+    def __len__(self) -> int:
+        return len(self._urls)
+
+
+class BloomSeenSet(SeenSet):
+    """
+    Fixed memory seen set for very large crawls.
+
+    A url that was never added is reported as seen with probability about
+    error_rate once capacity urls have been added, so a few pages may be
+    skipped. Urls that were added are always reported as seen.
+    """
+
+    def __init__(self, capacity: int,
+                 error_rate: float = 1e-4) -> None:
+        capacity = max(1, capacity)
+        self.num_bits = max(8, int(math.ceil(
+            -capacity * math.log(error_rate) / (math.log(2) ** 2))))
+        self.num_hashes = max(1, int(round(
+            self.num_bits / capacity * math.log(2))))
+        self._bits = bytearray((self.num_bits + 7) // 8)
+        self._count = 0
+
+    def _positions(self, url: str) -> Iterable[int]:
+        digest = hashlib.blake2b(url.encode('utf-8'), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], 'little')
+        h2 = int.from_bytes(digest[8:], 'little') | 1
+        for i in range(self.num_hashes):
+            yield (h1 + i * h2) % self.num_bits
+
+    def add(self, url: Url) -> None:
+        new = False
+        for position in self._positions(url):
+            mask = 1 << (position & 7)
+            if not self._bits[position >> 3] & mask:
+                self._bits[position >> 3] |= mask
+                new = True
+        if new:
+            self._count += 1
+
+    def __contains__(self, url: object) -> bool:
+        if not isinstance(url, str):
+            return False
+        return all(self._bits[position >> 3] & (1 << (position & 7))
+                   for position in self._positions(url))
+
+    def __len__(self) -> int:
+        return self._count
+
+
+def make_seen_set(bloom_capacity: Optional[int] = None) -> SeenSet:
+    """
+    Create an exact seen set, or a Bloom filter sized for the capacity
+    """
+    if bloom_capacity:
+        return BloomSeenSet(bloom_capacity)
+    return SeenSet()
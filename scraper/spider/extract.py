@@ -0,0 +1,120 @@
+import time
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, cast
+
+from bs4 import BeautifulSoup
+from bs4.element import Tag
+
+from scraper.graph.actor import Actor
+from scraper.graph.base_objects import NodeBase, Url
+from scraper.graph.movie import Movie
+from scraper.spider.actor_parser import ActorParser
+from scraper.spider.movie_parser import MovieParser
+from scraper.spider.utils import PageType, parse_page_type_get_infobox
+
+
+@dataclass
+class PageRecord:
+    """
+    Everything the spider needs from a page, small enough to pickle
+    """
+    url: Url
+    page_type: PageType
+    # Constructor arguments of the node
+    attributes: Dict[str, Any] = field(default_factory=dict)
+    # Actors of a movie in billing order, or movies of an actor
+    related: List[Url] = field(default_factory=list)
+    # Seconds spent parsing the html and extracting the infobox and links
+    timings: Dict[str, float] = field(default_factory=dict, compare=False)
+
+    def to_node(self) -> Optional[NodeBase]:
+        """
+        Build the graph node described by the record
+        Returns:
+            A movie, an actor or None for other pages
+        """
+        if self.page_type == PageType.MOVIE:
+            return Movie(**self.attributes)
+        if self.page_type == PageType.ACTOR:
+            return Actor(**self.attributes)
+        return None
+
+
+def movie_record(parser: MovieParser, infobox: Dict[str, Tag],
+                 casts: List[Url]) -> PageRecord:
+    """
+    Build the record of a movie page
+    Args:
+        parser: The parser of the page
+        infobox: The infobox dict
+        casts: The actors of the Cast section
+
+    Returns:
+        The record, with starring actors first
+    """
+    movie = parser.parse_movie_object(infobox)
+    total_actors = parser.parse_staring(infobox)
+    actors_added = set(total_actors)
+    for actor in casts:
+        if actor not in actors_added:
+            total_actors.append(actor)
+            actors_added.add(actor)
+    return PageRecord(url=parser.url, page_type=PageType.MOVIE,
+                      attributes={'name': movie.name, 'url': movie.url,
+                                  'year': movie.year,
+                                  'total_grossing': movie.total_grossing},
+                      related=total_actors)
+
+
+def actor_record(parser: ActorParser, infobox: Dict[str, Tag],
+                 movies: List[Url]) -> PageRecord:
+    """
+    Build the record of an actor page
+    Args:
+        parser: The parser of the page
+        infobox: The infobox dict
+        movies: The movies of the filmography
+
+    Returns:
+        The record
+    """
+    actor = parser.parse_actor_object(infobox)
+    return PageRecord(url=parser.url, page_type=PageType.ACTOR,
+                      attributes={'name': actor.name, 'url': actor.url,
+                                  'age': actor.age},
+                      related=movies)
+
+
+def extract_page(url: Url, content: bytes) -> PageRecord:
+    """
+    Parse a raw page into a record. Safe to run in a worker process.
+    Args:
+        url: The url of the page
+        content: The raw html
+
+    Returns:
+        The extracted record
+    """
+    start = time.perf_counter()
+    soup = BeautifulSoup(content, features="lxml")
+    parsed = time.perf_counter()
+    record = _extract_soup(url, soup)
+    record.timings = {'html': parsed - start,
+                      'infobox': time.perf_counter() - parsed}
+    return record
+
+
+def _extract_soup(url: Url, soup: BeautifulSoup) -> PageRecord:
+    html = cast(Tag, soup.html)
+    if html is None:
+        return PageRecord(url=url, page_type=PageType.OTHER)
+    page_type, infobox = parse_page_type_get_infobox(html)
+    if page_type == PageType.MOVIE:
+        movie_parser = MovieParser(url)
+        return movie_record(movie_parser, cast(Dict[str, Tag], infobox),
+                            movie_parser.parse_cast(html))
+    if page_type == PageType.ACTOR:
+        actor_parser = ActorParser(url)
+        return actor_record(actor_parser, cast(Dict[str, Tag], infobox),
+                            actor_parser.parse_related_movies(html))
+    return PageRecord(url=url, page_type=PageType.OTHER)
@@ -0,0 +1,300 @@
+import http.client
+import logging
+import socket
+import threading
+import time
+import zlib
+from abc import ABC, abstractmethod
+from collections import defaultdict
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Tuple, Type
+from urllib import error, parse, request
+
+logger = logging.getLogger('Web-Scraper')
+
+REDIRECT_STATUSES = (301, 302, 303, 307, 308)
+
+# Statuses worth retrying later, as the page itself may be fine
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+_CHUNK_SIZE = 64 * 1024
+
+
+class FetchError(IOError):
+    """
+    Raised when a page can not be downloaded
+    """
+
+    def __init__(self, url: str, status: Optional[int] = None,
+                 reason: str = '', headers: Optional[Dict[str, str]] = None):
+        super().__init__('%s: %s %s' % (url, status, reason))
+        self.url = url
+        self.status = status
+        self.reason = reason
+        self.headers = headers or {}
+
+    @property
+    def retryable(self) -> bool:
+        """
+        Whether the error is transient: a network failure, a timeout or an
+        overloaded server
+        """
+        return self.status is None or self.status in RETRY_STATUSES
+
+
+@dataclass
+class FetchResult:
+    """
+    A downloaded page
+    """
+    url: str  # Final url after redirects
+    status: int
+    body: bytes
+    headers: Dict[str, str] = field(default_factory=dict)
+    elapsed: float = 0.0  # in seconds
+    wire_bytes: int = 0  # Bytes received before decompression
+
+
+class FetchStats:
+    """
+    Thread safe per request byte and latency counters
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.errors = 0
+        self.wire_bytes = 0
+        self.body_bytes = 0
+        self.cache_hits = 0
+        self.revalidations = 0
+        self.retries = 0
+        self.latencies: List[float] = []
+
+    def record(self, result: FetchResult) -> None:
+        with self._lock:
+            self.requests += 1
+            self.wire_bytes += result.wire_bytes
+            self.body_bytes += len(result.body)
+            self.latencies.append(result.elapsed)
+
+    def record_error(self) -> None:
+        with self._lock:
+            self.errors += 1
+
+    def record_cache_hit(self) -> None:
+        with self._lock:
+            self.cache_hits += 1
+
+    def record_revalidation(self) -> None:
+        with self._lock:
+            self.revalidations += 1
+
+    def record_retry(self) -> None:
+        with self._lock:
+            self.retries += 1
+
+    @property
+    def total_latency(self) -> float:
+        return sum(self.latencies)
+
+    def summary(self) -> str:
+        mean = self.total_latency / self.requests if self.requests else 0.0
+        return ('%d requests, %d errors, %d bytes on the wire, '
+                '%d bytes decoded, %.03fs mean latency, %d cache hits, '
+                '%d revalidated, %d retries' % (
+                    self.requests, self.errors, self.wire_bytes,
+                    self.body_bytes, mean, self.cache_hits,
+                    self.revalidations, self.retries))
+
+
+class Fetcher(ABC):
+    """
+    Base class of the page download strategies used by the spider
+    """
+
+    def __init__(self, timeout: float = 30.0) -> None:
+        self.timeout = timeout
+        self.stats = FetchStats()
+
+    @abstractmethod
+    def fetch(self, url: str,
+              headers: Optional[Dict[str, str]] = None) -> FetchResult:
+        """
+        Download a page. Statuses other than 2xx and 304 raise FetchError.
+        Args:
+            url: The full url
+            headers: Extra request headers
+
+        Returns:
+            The downloaded page
+        """
+
+    def close(self) -> None:
+        pass
+
+
+class UrllibFetcher(Fetcher):
+    """
+    One urlopen call per page, no connection reuse
+    """
+
+    def fetch(self, url: str,
+              headers: Optional[Dict[str, str]] = None) -> FetchResult:
+        start = time.perf_counter()
+        req = request.Request(url, headers=headers or {})
+        try:
+            with request.urlopen(req, timeout=self.timeout) as response:
+                body = response.read()
+                result = FetchResult(url=response.geturl(),
+                                     status=response.status, body=body,
+                                     headers=dict(response.headers.items()),
+                                     wire_bytes=len(body))
+        except error.HTTPError as e:
+            if e.code != 304:
+                self.stats.record_error()
+                raise FetchError(url, e.code, str(e.reason),
+                                 dict(e.headers.items())) from e
+            result = FetchResult(url=url, status=304, body=b'',
+                                 headers=dict(e.headers.items()))
+        except (error.URLError, socket.timeout, OSError) as e:
+            self.stats.record_error()
+            raise FetchError(url, reason=str(e)) from e
+        result.elapsed = time.perf_counter() - start
+        self.stats.record(result)
+        return result
+
+
+class PooledFetcher(Fetcher):
+    """
+    Keep-alive connections pooled per host, with compressed transfer
+    """
+
+    def __init__(self, timeout: float = 30.0,
+                 max_per_host: int = 8, max_redirects: int = 5) -> None:
+        super().__init__(timeout)
+        self.max_per_host = max_per_host
+        self.max_redirects = max_redirects
+        self._lock = threading.Lock()
+        self._idle: Dict[Tuple[str, str], List[http.client.HTTPConnection]]
+        self._idle = defaultdict(list)
+
+    def _acquire(self, scheme: str,
+                 netloc: str) -> Tuple[http.client.HTTPConnection, bool]:
+        """
+        Get a connection to the host, reusing an idle one if possible
+        Returns:
+            The connection and whether it has been used before
+        """
+        with self._lock:
+            idle = self._idle[(scheme, netloc)]
+            if idle:
+                return idle.pop(), True
+        if scheme == 'https':
+            return http.client.HTTPSConnection(
+                netloc, timeout=self.timeout), False
+        return http.client.HTTPConnection(netloc, timeout=self.timeout), False
+
+    def _release(self, scheme: str, netloc: str,
+                 connection: http.client.HTTPConnection) -> None:
+        with self._lock:
+            idle = self._idle[(scheme, netloc)]
+            if len(idle) < self.max_per_host:
+                idle.append(connection)
+                return
+        connection.close()
+
+    @staticmethod
+    def _read_body(response: http.client.HTTPResponse) -> Tuple[bytes, int]:
+        """
+        Read and incrementally decode the response body
+        Returns:
+            The decoded body and the number of bytes read from the socket
+        """
+        encoding = (response.getheader('Content-Encoding') or '').lower()
+        decoder = None
+        if encoding in ('gzip', 'x-gzip'):
+            decoder = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        elif encoding == 'deflate':
+            decoder = zlib.decompressobj()
+        chunks = []
+        wire_bytes = 0
+        while True:
+            chunk = response.read(_CHUNK_SIZE)
+            if not chunk:
+                break
+            wire_bytes += len(chunk)
+            chunks.append(decoder.decompress(chunk) if decoder else chunk)
+        if decoder:
+            chunks.append(decoder.flush())
+        return b''.join(chunks), wire_bytes
+
+    def _request_once(self, url: str, headers: Dict[str, str]
+                      ) -> Tuple[http.client.HTTPResponse, bytes, int]:
+        parsed = parse.urlsplit(url)
+        path = parsed.path or '/'
+        if parsed.query:
+            path += '?' + parsed.query
+        while True:
+            connection, reused = self._acquire(parsed.scheme, parsed.netloc)
+            try:
+                connection.request('GET', path, headers=headers)
+                response = connection.getresponse()
+                body, wire_bytes = self._read_body(response)
+            except (http.client.HTTPException, OSError, zlib.error) as e:
+                # The rest of the response is unread, or cut short
+                connection.close()
+                if reused and not isinstance(e, zlib.error):
+                    # The server dropped an idle keep-alive connection
+                    continue
+                raise
+            if response.will_close:
+                connection.close()
+            else:
+                self._release(parsed.scheme, parsed.netloc, connection)
+            return response, body, wire_bytes
+
+    def fetch(self, url: str,
+              headers: Optional[Dict[str, str]] = None) -> FetchResult:
+        start = time.perf_counter()
+        request_headers = {'Accept-Encoding': 'gzip, deflate',
+                           'Connection': 'keep-alive',
+                           'User-Agent': 'Web-Scraper'}
+        request_headers.update(headers or {})
+        current_url = url
+        wire_bytes = 0
+        try:
+            for _ in range(self.max_redirects + 1):
+                response, body, received = self._request_once(
+                    current_url, request_headers)
+                wire_bytes += received
+                location = response.getheader('Location')
+                if response.status in REDIRECT_STATUSES and location:
+                    current_url = parse.urljoin(current_url, location)
+                    continue
+                break
+        except (http.client.HTTPException, OSError, zlib.error) as e:
+            self.stats.record_error()
+            raise FetchError(url, reason=str(e)) from e
+        response_headers = dict(response.getheaders())
+        if not (200 <= response.status < 300 or response.status == 304):
+            self.stats.record_error()
+            raise FetchError(url, response.status, response.reason,
+                             response_headers)
+        result = FetchResult(url=current_url, status=response.status,
+                             body=body, headers=response_headers,
+                             elapsed=time.perf_counter() - start,
+                             wire_bytes=wire_bytes)
+        self.stats.record(result)
+        return result
+
+    def close(self) -> None:
+        with self._lock:
+            for connections in self._idle.values():
+                for connection in connections:
+                    connection.close()
+            self._idle.clear()
+
+
+FETCHERS: Dict[str, Type[Fetcher]] = {'urllib': UrllibFetcher,
+                                      'pooled': PooledFetcher}
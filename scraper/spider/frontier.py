@@ -0,0 +1,449 @@
+import heapq
+import json
+import math
+import os
+import tempfile
+from abc import ABC, abstractmethod
+from collections import deque
+from queue import LifoQueue, PriorityQueue, Queue
+from typing import (IO, Callable, Deque, Dict, List, Optional, Set, Tuple,
+                    Type, Union, cast)
+
+from scraper.graph.base_objects import NodeBase, Url
+from scraper.graph.movie import Movie
+from scraper.spider.utils import PageType
+
+# (url, predecessor, weight, depth) as stored in the frontier
+QueueEntry = Tuple[Url, Optional[Movie], float, int]
+
+
+def expected_page_type(entry: QueueEntry) -> PageType:
+    """
+    The type of page an entry most likely points at. Links with a
+    predecessor come from a cast list, all others from a filmography or
+    the start url.
+    """
+    return PageType.ACTOR if entry[1] is not None else PageType.MOVIE
+
+
+class Frontier(ABC):
+    """
+    Urls waiting to be crawled.
+
+    Types of pages can be closed once their budget is spent, which drops
+    the queued entries of that type and refuses new ones.
+    """
+
+    def __init__(self) -> None:
+        self.closed: Set[PageType] = set()
+
+    def bind(self, node_of: Callable[[int], Optional[NodeBase]]) -> None:
+        """
+        Called by the runner with the lookup of its graph nodes by id, for
+        frontiers that keep predecessors by id
+        """
+
+    def put(self, entry: QueueEntry) -> bool:
+        """
+        Queue an entry
+        Args:
+            entry: The entry to queue
+
+        Returns:
+            False if the entry was refused because its type is closed
+        """
+        if expected_page_type(entry) in self.closed:
+            return False
+        self._put(entry)
+        return True
+
+    def requeue(self, entry: QueueEntry) -> bool:
+        """
+        Queue again an entry whose fetch failed. It goes behind the entries
+        of the same priority, so that it is not retried right away.
+        Args:
+            entry: The entry to queue
+
+        Returns:
+            False if the entry was refused because its type is closed
+        """
+        if expected_page_type(entry) in self.closed:
+            return False
+        self._requeue(entry)
+        return True
+
+    @abstractmethod
+    def _put(self, entry: QueueEntry) -> None:
+        pass
+
+    def _requeue(self, entry: QueueEntry) -> None:
+        self._put(entry)
+
+    @abstractmethod
+    def get(self) -> QueueEntry:
+        """
+        Take the next entry to crawl. The frontier must not be empty
+        """
+
+    @abstractmethod
+    def entries(self) -> List[QueueEntry]:
+        """
+        The queued entries, oldest first
+        """
+
+    @abstractmethod
+    def _drop_closed(self) -> None:
+        """
+        Drop the queued entries of the closed types
+        """
+
+    @abstractmethod
+    def clear(self) -> None:
+        pass
+
+    def close(self, page_type: PageType) -> None:
+        """
+        Stop crawling a type of page
+        """
+        if page_type not in self.closed:
+            self.closed.add(page_type)
+            self._drop_closed()
+
+    @abstractmethod
+    def __len__(self) -> int:
+        pass
+
+    def empty(self) -> bool:
+        return len(self) == 0
+
+
+class QueueFrontier(Frontier):
+    """
+    Frontier over a queue.Queue, crawling in the order of the queue, such
+    as the LifoQueue of the runners before frontiers
+    """
+
+    def __init__(self, queue: 'Queue[QueueEntry]') -> None:
+        super().__init__()
+        self.queue = queue
+
+    def _put(self, entry: QueueEntry) -> None:
+        self.queue.put(entry)
+
+    def _requeue(self, entry: QueueEntry) -> None:
+        if not isinstance(self.queue, LifoQueue):
+            self.queue.put(entry)
+            return
+        # At the bottom of the stack
+        with self.queue.mutex:
+            self.queue.queue.insert(0, entry)
+            self.queue.unfinished_tasks += 1
+
+    def get(self) -> QueueEntry:
+        return self.queue.get_nowait()
+
+    def entries(self) -> List[QueueEntry]:
+        """
+        The queued entries, in the order the queue keeps them
+        """
+        with self.queue.mutex:
+            return list(self.queue.queue)
+
+    def _drop_closed(self) -> None:
+        with self.queue.mutex:
+            kept = [entry for entry in self.queue.queue
+                    if expected_page_type(entry) not in self.closed]
+            self.queue.queue.clear()
+            self.queue.queue.extend(kept)
+            if isinstance(self.queue, PriorityQueue):
+                heapq.heapify(self.queue.queue)
+
+    def clear(self) -> None:
+        with self.queue.mutex:
+            self.queue.queue.clear()
+
+    def __len__(self) -> int:
+        return self.queue.qsize()
+
+
+class StackFrontier(Frontier):
+    """
+    Last in first out frontier, a depth first crawl
+    """
+
+    def __init__(self) -> None:
+        super().__init__()
+        self._stack: List[QueueEntry] = []
+
+    def _put(self, entry: QueueEntry) -> None:
+        self._stack.append(entry)
+
+    def _requeue(self, entry: QueueEntry) -> None:
+        self._stack.insert(0, entry)
+
+    def get(self) -> QueueEntry:
+        return self._stack.pop()
+
+    def entries(self) -> List[QueueEntry]:
+        return list(self._stack)
+
+    def _drop_closed(self) -> None:
+        self._stack = [entry for entry in self._stack
+                       if expected_page_type(entry) not in self.closed]
+
+    def clear(self) -> None:
+        self._stack = []
+
+    def __len__(self) -> int:
+        return len(self._stack)
+
+
+class PriorityFrontier(Frontier):
+    """
+    Frontier ordered by depth, then by edge weight.
+
+    Pages closer to the start url are crawled first, and among pages at
+    the same depth the ones with the heaviest edge, i.e. the top billed
+    actors, go first. Ties are broken by insertion order. Entries queued
+    again after a failed fetch go after every other entry of their depth.
+    """
+
+    def __init__(self) -> None:
+        super().__init__()
+        self._heap: List[Tuple[int, float, int]] = []
+        # Queued entries by insertion number, oldest first
+        self._entries: Dict[int, QueueEntry] = {}
+        self._count = 0
+
+    def _put(self, entry: QueueEntry) -> None:
+        self._push(entry, -entry[2])
+
+    def _requeue(self, entry: QueueEntry) -> None:
+        self._push(entry, math.inf)
+
+    def _push(self, entry: QueueEntry, rank: float) -> None:
+        """
+        Queue an entry, ordered by rank among the entries of its depth
+        """
+        self._count += 1
+        self._entries[self._count] = entry
+        heapq.heappush(self._heap, (entry[3], rank, self._count))
+
+    def get(self) -> QueueEntry:
+        _, _, index = heapq.heappop(self._heap)
+        return self._entries.pop(index)
+
+    def entries(self) -> List[QueueEntry]:
+        return list(self._entries.values())
+
+    def _drop_closed(self) -> None:
+        self._entries = {index: entry
+                         for index, entry in self._entries.items()
+                         if expected_page_type(entry) not in self.closed}
+        self._heap = [key for key in self._heap if key[2] in self._entries]
+        heapq.heapify(self._heap)
+
+    def clear(self) -> None:
+        self._heap = []
+        self._entries = {}
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+class SpillingFrontier(PriorityFrontier):
+    """
+    Priority frontier with a bounded memory footprint.
+
+    Up to window entries are kept in memory, ordered like a
+    PriorityFrontier. Once the window is full, further entries are appended
+    to segment files on disk, with the node id of their predecessor rather
+    than the movie itself, and read back in the order they were spilled
+    whenever the window runs empty. Entries queued while some are spilled
+    go behind them, so the crawl order is by depth only approximately;
+    links found later are mostly deeper anyway.
+
+    Segments are deleted once read. entries() reads every spilled entry
+    back, so it costs as much as the queue is long.
+
+    The class can be passed as the queue of a runner, which spills to a
+    temporary directory with the default window, or an instance as its
+    frontier.
+    """
+
+    def __init__(self, directory: Optional[str] = None, window: int = 50000,
+                 segment_size: int = 50000) -> None:
+        """
+        Create a spilling frontier
+        Args:
+            directory: Where the segment files are kept. Defaults to a
+                temporary directory removed with the frontier
+            window: Number of entries kept in memory
+            segment_size: Number of entries per segment file
+        """
+        super().__init__()
+        self._tmp_dir: Optional['tempfile.TemporaryDirectory[str]'] = None
+        if directory is None:
+            self._tmp_dir = tempfile.TemporaryDirectory(prefix='frontier-')
+            directory = self._tmp_dir.name
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.window = window
+        self.segment_size = segment_size
+        self._node_of: Optional[Callable[[int], Optional[NodeBase]]] = None
+        # Numbers of the segments not read to the end, oldest first
+        self._segments: Deque[int] = deque()
+        self._next_segment = 0
+        self._writer: Optional[IO[str]] = None
+        self._written = 0
+        self._reader: Optional[IO[str]] = None
+        # Spilled entries not read back yet, by expected page type
+        self._spilled: Dict[PageType, int] = {PageType.MOVIE: 0,
+                                              PageType.ACTOR: 0}
+
+    def bind(self, node_of: Callable[[int], Optional[NodeBase]]) -> None:
+        self._node_of = node_of
+
+    def _segment_path(self, segment: int) -> str:
+        return os.path.join(self.directory, 'frontier-%06d.jsonl' % segment)
+
+    def _put(self, entry: QueueEntry) -> None:
+        if not self._segments and super().__len__() < self.window:
+            super()._put(entry)
+            return
+        if self._writer is None or self._written >= self.segment_size:
+            if self._writer is not None:
+                self._writer.close()
+            self._segments.append(self._next_segment)
+            self._writer = open(self._segment_path(self._next_segment), 'a')
+            self._next_segment += 1
+            self._written = 0
+        url, predecessor, weight, depth = entry
+        self._writer.write(json.dumps(
+            [url, predecessor.node_id if predecessor else None, weight,
+             depth]) + '\n')
+        self._written += 1
+        self._spilled[expected_page_type(entry)] += 1
+
+    def _requeue(self, entry: QueueEntry) -> None:
+        if not self._segments and super().__len__() < self.window:
+            super()._requeue(entry)
+        else:
+            # Behind the spilled entries anyway
+            self._put(entry)
+
+    def _decode(self, line: str) -> QueueEntry:
+        url, predecessor_id, weight, depth = json.loads(line)
+        predecessor = None
+        if predecessor_id is not None:
+            if self._node_of is None:
+                raise RuntimeError('Spilled entries need a bound graph')
+            predecessor = cast(Movie, self._node_of(predecessor_id))
+        return url, predecessor, weight, depth
+
+    def _read_segment(self) -> Optional[str]:
+        """
+        Next spilled line, deleting the segments read to the end
+        """
+        while self._segments:
+            segment = self._segments[0]
+            last = len(self._segments) == 1
+            if last and self._writer is not None:
+                self._writer.flush()
+            if self._reader is None:
+                self._reader = open(self._segment_path(segment), 'r')
+            line = self._reader.readline()
+            if line:
+                return line
+            if last and self._writer is not None:
+                # Caught up with the writer
+                self._writer.close()
+                self._writer = None
+            self._reader.close()
+            self._reader = None
+            os.remove(self._segment_path(segment))
+            self._segments.popleft()
+        return None
+
+    def _refill(self) -> None:
+        """
+        Move the oldest spilled entries back into the window
+        """
+        while super().__len__() < self.window:
+            line = self._read_segment()
+            if line is None:
+                break
+            entry = self._decode(line)
+            page_type = expected_page_type(entry)
+            if page_type in self.closed:
+                continue
+            self._spilled[page_type] -= 1
+            super()._put(entry)
+
+    def get(self) -> QueueEntry:
+        if not super().__len__():
+            self._refill()
+        entry = super().get()
+        if not any(self._spilled.values()) and self._segments:
+            # Whatever is left on disk was read back or dropped
+            self._remove_segments()
+        return entry
+
+    def entries(self) -> List[QueueEntry]:
+        entries = super().entries()
+        for segment in self._segments:
+            if self._writer is not None:
+                self._writer.flush()
+            with open(self._segment_path(segment), 'r') as f:
+                if self._reader is not None and segment == self._segments[0]:
+                    f.seek(self._reader.tell())
+                for line in f:
+                    entry = self._decode(line)
+                    if expected_page_type(entry) not in self.closed:
+                        entries.append(entry)
+        return entries
+
+    def _drop_closed(self) -> None:
+        super()._drop_closed()
+        # Spilled entries of closed types are skipped when read back
+        for page_type in self.closed:
+            self._spilled[page_type] = 0
+
+    def _remove_segments(self) -> None:
+        for handle in (self._reader, self._writer):
+            if handle is not None:
+                handle.close()
+        self._reader = self._writer = None
+        for segment in self._segments:
+            os.remove(self._segment_path(segment))
+        self._segments.clear()
+
+    def clear(self) -> None:
+        super().clear()
+        self._remove_segments()
+        self._spilled = dict.fromkeys(self._spilled, 0)
+
+    def __len__(self) -> int:
+        return super().__len__() + sum(self._spilled.values())
+
+
+FRONTIERS = {'priority': PriorityFrontier, 'lifo': StackFrontier,
+             'spill': SpillingFrontier}
+
+# What the queue parameter of the runners takes
+QueueType = Union[Type['Queue[QueueEntry]'], Type[Frontier]]
+
+
+def make_frontier(queue: QueueType) -> Frontier:
+    """
+    Create the frontier of a queue class
+    Args:
+        queue: A Frontier class, or a queue.Queue class to wrap in a
+            QueueFrontier
+
+    Returns:
+        An empty frontier
+    """
+    if issubclass(queue, Frontier):
+        return queue()
+    return QueueFrontier(queue())
@@ -0,0 +1,592 @@
+import calendar
+import datetime
+import html
+import json
+import logging
+import re
+import threading
+from collections import deque
+from concurrent.futures import Future
+from typing import Deque, Dict, List, Optional, Tuple, Type
+from urllib import parse
+
+from scraper.spider import fetcher
+from scraper.spider.fetcher import (FetchError, FetchResult, Fetcher,
+                                    PooledFetcher)
+
+logger = logging.getLogger('Web-Scraper')
+
+# Most titles the API returns content for in one query
+MAX_BATCH = 50
+
+_URL_SAFE = '/:@!$&\'()*+,;=-._~'
+
+_HEADING = re.compile(r'^(={2,6})\s*(.*?)\s*\1\s*$', re.MULTILINE)
+_REF = re.compile(r'<ref[^>]*/>|<ref[^>]*>.*?</ref>|<!--.*?-->', re.DOTALL)
+_LINK = re.compile(r'\[\[([^\[\]|]*)(?:\|([^\[\]]*))?\]\]')
+_EXTERNAL_LINK = re.compile(r'\[(?:https?:)?//[^\s\]]+\s*([^\]]*)\]')
+_TAG = re.compile(r'<[^>]+>')
+
+# Infobox parameters the parsers read, with the label Wikipedia renders
+INFOBOX_LABELS = {'starring': 'Starring', 'released': 'Release date',
+                  'gross': 'Box office', 'birth_date': 'Born',
+                  'death_date': 'Died', 'occupation': 'Occupation'}
+
+_LIST_TEMPLATES = ('plainlist', 'plain list', 'flatlist', 'ubl',
+                   'unbulleted list', 'hlist', 'bulleted list',
+                   'collapsible list')
+
+# Link prefixes that do not point to articles
+_NAMESPACES = ('file', 'image', 'category', 'template', 'wikipedia', 'help',
+               'portal', 'special', 'talk', 'user', 'wikt', 'wiktionary',
+               'commons', 's', 'q', 'd')
+
+Key = Tuple[str, str]
+
+
+def normalize_title(title: str) -> str:
+    """
+    The title MediaWiki stores a page under, e.g. for jay_Baruchel
+    """
+    title = parse.unquote(title).replace('_', ' ').strip()
+    return title[:1].upper() + title[1:]
+
+
+def title_url(title: str) -> str:
+    return '/wiki/' + parse.quote(normalize_title(title).replace(' ', '_'),
+                                  safe=_URL_SAFE)
+
+
+def _split_top_level(text: str) -> List[str]:
+    """
+    Split template parameters on the pipes outside of nested templates
+    and links
+    """
+    parts = []
+    depth = 0
+    start = 0
+    i = 0
+    while i < len(text):
+        pair = text[i:i + 2]
+        if pair in ('{{', '[['):
+            depth += 1
+            i += 2
+        elif pair in ('}}', ']]'):
+            depth = max(0, depth - 1)
+            i += 2
+        elif text[i] == '|' and depth == 0:
+            parts.append(text[start:i])
+            start = i = i + 1
+        else:
+            i += 1
+    parts.append(text[start:])
+    return parts
+
+
+def _template_end(text: str, start: int) -> int:
+    """
+    Index just past the template opening at start, or -1 if unbalanced
+    """
+    depth = 0
+    i = start
+    while i < len(text) - 1:
+        pair = text[i:i + 2]
+        if pair == '{{':
+            depth += 1
+            i += 2
+        elif pair == '}}':
+            depth -= 1
+            i += 2
+            if depth == 0:
+                return i
+        else:
+            i += 1
+    return -1
+
+
+def parse_template(body: str) -> Tuple[str, List[str], Dict[str, str]]:
+    """
+    Parse the inside of a template
+    Args:
+        body: The text between {{ and }}
+
+    Returns:
+        The lower cased name, the positional and the named parameters
+    """
+    name, *params = _split_top_level(body)
+    positional = []
+    named = {}
+    for param in params:
+        key, equals, value = param.partition('=')
+        if equals and '{{' not in key and '[[' not in key:
+            named[key.strip().lower().replace(' ', '_')] = value.strip()
+        else:
+            positional.append(param.strip())
+    return name.strip().lower().replace('_', ' '), positional, named
+
+
+def _date(positional: List[str]) -> Optional[datetime.date]:
+    numbers = [p for p in positional if p.isdigit()]
+    if len(numbers) < 3:
+        return None
+    try:
+        return datetime.date(*(int(n) for n in numbers[:3]))
+    except ValueError:
+        return None
+
+
+def _age(born: datetime.date, on: datetime.date) -> int:
+    return on.year - born.year - ((on.month, on.day) < (born.month, born.day))
+
+
+def _format_date(date: datetime.date) -> str:
+    return '%s %d, %d' % (calendar.month_name[date.month], date.day,
+                          date.year)
+
+
+class WikitextRenderer:
+    """
+    Render the wikitext constructs the parsers look at into html. Links
+    rendered are collected in links.
+    """
+
+    def __init__(self, today: Optional[datetime.date] = None) -> None:
+        self.today = today or datetime.date.today()
+        self.links: List[str] = []
+
+    def bullet_list(self, items: List[str]) -> str:
+        return '<ul>%s</ul>' % ''.join('<li>%s</li>' % self.inline(item)
+                                       for item in items if item.strip())
+
+    def bullets(self, text: str) -> List[str]:
+        return [line.lstrip('*#:; ') for line in text.split('\n')
+                if line.startswith(('*', '#'))]
+
+    def template(self, body: str) -> str:
+        name, positional, named = parse_template(body)
+        if name in _LIST_TEMPLATES:
+            items = positional
+            if name in ('plainlist', 'plain list', 'flatlist'):
+                items = self.bullets('\n'.join(positional)
+                                     + named.get('1', ''))
+            return self.bullet_list(items)
+        if name in ('birth date and age', 'bda', 'birth date', 'birth-date'):
+            born = _date(positional)
+            if born is None:
+                return ''
+            if name in ('birth date', 'birth-date'):
+                return _format_date(born)
+            return '%s (age %d)' % (_format_date(born),
+                                    _age(born, self.today))
+        if name in ('death date and age', 'dda'):
+            died = _date(positional)
+            born = _date(positional[3:])
+            if died is None or born is None:
+                return ''
+            return '%s (aged %d)' % (_format_date(died), _age(born, died))
+        if name in ('film date', 'start date', 'release date'):
+            date = _date(positional)
+            return _format_date(date) if date else ' '.join(positional[:1])
+        if name in ('us$', 'usd'):
+            return '$' + self.inline(positional[0]) if positional else ''
+        if name in ('nowrap', 'nobr', 'small'):
+            return self.inline(positional[0]) if positional else ''
+        return ''
+
+    def _link(self, match: 're.Match') -> str:
+        target, label = match.group(1).strip(), match.group(2)
+        prefix, colon, _ = target.partition(':')
+        if (target.startswith(':')
+                or colon and (prefix.strip().lower() in _NAMESPACES
+                              or re.fullmatch('[a-z]{2,3}', prefix))):
+            # Files, categories and interwiki links
+            return ''
+        url = title_url(target.split('#')[0])
+        self.links.append(url)
+        return '<a href="%s">%s</a>' % (html.escape(url),
+                                        html.escape(label or target))
+
+    def inline(self, text: str) -> str:
+        """
+        Render templates, links and formatting of a piece of wikitext
+        """
+        text = _REF.sub('', text)
+        output = []
+        position = 0
+        while True:
+            start = text.find('{{', position)
+            if start < 0:
+                break
+            end = _template_end(text, start)
+            if end < 0:
+                break
+            output.append(self._plain(text[position:start]))
+            output.append(self.template(text[start + 2:end - 2]))
+            position = end
+        output.append(self._plain(text[position:]))
+        return ''.join(output)
+
+    def _plain(self, text: str) -> str:
+        text = _EXTERNAL_LINK.sub(r'\1', text)
+        text = text.replace("'''", '').replace("''", '')
+        # Escape everything but the links rendered below
+        pieces = []
+        position = 0
+        for match in _LINK.finditer(text):
+            pieces.append(html.escape(_TAG.sub('', text[position:
+                                                        match.start()])))
+            pieces.append(self._link(match))
+            position = match.end()
+        pieces.append(html.escape(_TAG.sub('', text[position:])))
+        return ''.join(pieces)
+
+    def table(self, text: str) -> str:
+        """
+        Render the first wikitable of the text
+        """
+        start = text.find('{|')
+        if start < 0:
+            return ''
+        # Cells of each row as (tag, wikitext)
+        rows: List[List[Tuple[str, str]]] = [[]]
+        for line in text[start:].split('\n')[1:]:
+            line = line.strip()
+            if line.startswith('|}'):
+                break
+            if line.startswith('|-'):
+                rows.append([])
+            elif line.startswith('|+'):
+                continue
+            elif line.startswith(('!', '|')):
+                tag = 'th' if line[0] == '!' else 'td'
+                for cell in line[1:].split('!!' if tag == 'th' else '||'):
+                    # Drop the attributes in front of the content
+                    rows[-1].append((tag, _split_top_level(cell)[-1]))
+            elif rows[-1]:
+                # Cell content continued on the next line
+                tag, content = rows[-1][-1]
+                rows[-1][-1] = (tag, content + '\n' + line)
+        return ('<table class="wikitable"><tbody>%s</tbody></table>' % ''.join(
+            '<tr>%s</tr>' % ''.join('<%s>%s</%s>' % (tag, self.inline(content),
+                                                     tag)
+                                    for tag, content in row)
+            for row in rows if row))
+
+
+def _sections(wikitext: str) -> List[Tuple[int, str, str]]:
+    """
+    The (level, title, content) of each section, content excluding the
+    subsections
+    """
+    headings = list(_HEADING.finditer(wikitext))
+    sections = []
+    for i, heading in enumerate(headings):
+        end = (headings[i + 1].start() if i + 1 < len(headings)
+               else len(wikitext))
+        sections.append((len(heading.group(1)), heading.group(2).strip(),
+                         wikitext[heading.end():end]))
+    return sections
+
+
+def _headline(level: int, title: str) -> str:
+    return '<h%d><span class="mw-headline" id="%s">%s</span></h%d>' % (
+        level, html.escape(title.replace(' ', '_')), html.escape(title), level)
+
+
+def _infobox(wikitext: str) -> Optional[str]:
+    match = re.search(r'\{\{\s*infobox', wikitext, re.IGNORECASE)
+    if match is None:
+        return None
+    end = _template_end(wikitext, match.start())
+    if end < 0:
+        return None
+    return wikitext[match.start() + 2:end - 2]
+
+
+def render_page(title: str, wikitext: str,
+                today: Optional[datetime.date] = None) -> Tuple[bytes,
+                                                                List[str]]:
+    """
+    Render the parts of an article the parsers read, laid out like the
+    html Wikipedia serves: the infobox, the Cast section and the film
+    table of the Filmography.
+    Args:
+        title: The title of the page
+        wikitext: The source of the page
+        today: The date ages are computed on
+
+    Returns:
+        The html, and the urls of the pages it links to from those parts
+    """
+    renderer = WikitextRenderer(today)
+    # Links the parsers follow: starring, cast and film table
+    links: List[str] = []
+    body = ['<h1 id="firstHeading">%s</h1>' % html.escape(title)]
+    infobox = _infobox(wikitext)
+    if infobox is not None:
+        _, _, named = parse_template(infobox)
+        rows = ['<tr><th colspan="2">%s</th></tr>' % html.escape(title)]
+        if named.get('caption') or named.get('image'):
+            rows.append('<tr><td colspan="2"><a href="/wiki/File:%s" '
+                        'class="image"></a><div>%s</div></td></tr>'
+                        % (html.escape(parse.quote(named.get('image', ''))),
+                           renderer.inline(named.get('caption', ''))))
+        for name, label in INFOBOX_LABELS.items():
+            if named.get(name):
+                renderer.links = []
+                rows.append('<tr><th>%s</th><td>%s</td></tr>'
+                            % (label, renderer.inline(named[name])))
+                if name == 'starring':
+                    links.extend(renderer.links)
+        body.append('<table class="infobox"><tbody>%s</tbody></table>'
+                    % ''.join(rows))
+    in_filmography = False
+    for level, heading, content in _sections(wikitext):
+        if level == 2:
+            in_filmography = heading == 'Filmography'
+        if level == 2 and heading == 'Cast':
+            body.append(_headline(2, heading))
+            items = []
+            for item in renderer.bullets(content):
+                renderer.links = []
+                items.append('<li>%s</li>' % renderer.inline(item))
+                links.extend(renderer.links[:1])
+            body.append('<ul>%s</ul>' % ''.join(items))
+        elif level == 2 and in_filmography:
+            body.append(_headline(2, heading))
+        elif level == 3 and in_filmography and heading == 'Film':
+            body.append(_headline(3, heading))
+            renderer.links = []
+            body.append(renderer.table(content))
+            links.extend(renderer.links)
+    page = ('<!DOCTYPE html><html><head><title>%s</title></head><body>%s'
+            '</body></html>' % (html.escape(title), '\n'.join(body)))
+    return page.encode('utf-8'), links
+
+
+class MediaWikiFetcher(Fetcher):
+    """
+    Fetch articles as wikitext from the MediaWiki API, many per request.
+
+    Titles asked for by concurrent fetch calls are sent together, up to
+    batch_size per query, with redirects resolved by the API. The links
+    of each page returned are queued as well, so a crawl of linked pages
+    mostly finds its next page already downloaded. Only the infobox,
+    cast and filmography are rendered into html for the parsers.
+    """
+
+    def __init__(self, timeout: float = 30.0,
+                 transport: Optional[Fetcher] = None,
+                 batch_size: int = MAX_BATCH, prefetch: bool = True,
+                 max_buffered: int = 1000, workers: int = 2,
+                 api_path: str = '/w/api.php') -> None:
+        """
+        Create a MediaWiki fetcher
+        Args:
+            timeout: Network timeout of the default transport
+            transport: Sends the API requests. Defaults to a PooledFetcher
+            batch_size: Most titles in a query
+            prefetch: Whether to download the pages linked to by fetched
+                pages before they are asked for
+            max_buffered: Bound on the pages downloaded ahead
+            workers: Number of queries in flight
+            api_path: Path of api.php on the wiki
+        """
+        super().__init__(timeout)
+        self.transport = (transport if transport is not None
+                          else PooledFetcher(timeout))
+        # Counts API requests, the unit of network work
+        self.stats = self.transport.stats
+        self.batch_size = min(batch_size, MAX_BATCH)
+        self.prefetch = prefetch
+        self.max_buffered = max_buffered
+        self.num_workers = workers
+        self.api_path = api_path
+        self.batches = 0
+        self._condition = threading.Condition()
+        # Pages asked for or downloaded ahead, oldest first
+        self._pending: Dict[Key, Future] = {}
+        self._urgent: Deque[Key] = deque()
+        self._speculative: Deque[Key] = deque()
+        self._workers: List[threading.Thread] = []
+        self._closed = False
+
+    def _key(self, url: str) -> Key:
+        parts = parse.urlsplit(url)
+        if not parts.path.startswith('/wiki/'):
+            raise FetchError(url, 404, 'Not an article')
+        api_url = parse.urlunsplit((parts.scheme, parts.netloc,
+                                    self.api_path, '', ''))
+        return api_url, normalize_title(parts.path[len('/wiki/'):])
+
+    @staticmethod
+    def _url(key: Key) -> str:
+        parts = parse.urlsplit(key[0])
+        return '%s://%s%s' % (parts.scheme, parts.netloc, title_url(key[1]))
+
+    def _start_workers(self) -> None:
+        while len(self._workers) < self.num_workers:
+            worker = threading.Thread(target=self._work, daemon=True)
+            worker.start()
+            self._workers.append(worker)
+
+    def fetch(self, url: str,
+              headers: Optional[Dict[str, str]] = None) -> FetchResult:
+        key = self._key(url)
+        with self._condition:
+            if self._closed:
+                raise FetchError(url, None, 'Fetcher closed')
+            future = self._pending.get(key)
+            if future is None:
+                future = self._pending[key] = Future()
+                self._urgent.append(key)
+            elif key in self._speculative:
+                self._speculative.remove(key)
+                self._urgent.append(key)
+            self._start_workers()
+            self._condition.notify()
+        try:
+            result = future.result()
+        finally:
+            with self._condition:
+                if self._pending.get(key) is future:
+                    del self._pending[key]
+        # The final url of a redirect for the page asked for
+        return FetchResult(url=result.url, status=result.status,
+                           body=result.body, headers=result.headers,
+                           elapsed=result.elapsed,
+                           wire_bytes=result.wire_bytes)
+
+    def _prefetch(self, api_url: str, urls: List[str]) -> None:
+        with self._condition:
+            for url in urls:
+                key = (api_url, normalize_title(url[len('/wiki/'):]))
+                if key in self._pending:
+                    continue
+                if len(self._pending) >= self.max_buffered:
+                    # Forget the oldest pages downloaded ahead
+                    for old in [k for k, f in self._pending.items()
+                                if f.done()][:self.max_buffered // 10 + 1]:
+                        del self._pending[old]
+                    if len(self._pending) >= self.max_buffered:
+                        return
+                self._pending[key] = Future()
+                self._speculative.append(key)
+            self._condition.notify_all()
+
+    def _next_batch(self) -> Optional[List[Key]]:
+        with self._condition:
+            while not self._closed and not (self._urgent
+                                            or self._speculative):
+                self._condition.wait()
+            if self._closed:
+                return None
+            first = (self._urgent[0] if self._urgent
+                     else self._speculative[0])
+            batch: List[Key] = []
+            for queue in (self._urgent, self._speculative):
+                for key in list(queue):
+                    if len(batch) >= self.batch_size:
+                        break
+                    if key[0] == first[0]:
+                        queue.remove(key)
+                        batch.append(key)
+            return batch
+
+    def _work(self) -> None:
+        while True:
+            batch = self._next_batch()
+            if batch is None:
+                return
+            try:
+                self._query(batch)
+            except BaseException as e:
+                error = (e if isinstance(e, FetchError)
+                         else FetchError(batch[0][0], None, str(e)))
+                for key in batch:
+                    self._fail(key, FetchError(self._url(key), error.status,
+                                               error.reason, error.headers))
+
+    def _future(self, key: Key) -> Optional[Future]:
+        with self._condition:
+            future = self._pending.get(key)
+        if future is None or future.done():
+            return None
+        return future
+
+    def _fail(self, key: Key, error: FetchError) -> None:
+        future = self._future(key)
+        if future is not None:
+            future.set_exception(error)
+
+    def _query(self, batch: List[Key]) -> None:
+        api_url = batch[0][0]
+        params = {'action': 'query', 'format': 'json', 'formatversion': '2',
+                  'prop': 'revisions', 'rvprop': 'content',
+                  'rvslots': 'main', 'redirects': '1',
+                  'titles': '|'.join(title for _, title in batch)}
+        response = self.transport.fetch(
+            '%s?%s' % (api_url, parse.urlencode(params)))
+        self.batches += 1
+        data = json.loads(response.body.decode('utf-8'))
+        if 'error' in data:
+            raise FetchError(api_url, None, data['error'].get('info', ''))
+        query = data.get('query', {})
+        # Requested title -> title of the page served
+        resolved = {title: title for _, title in batch}
+        for step in query.get('normalized', []) + query.get('redirects', []):
+            for title, target in resolved.items():
+                if target == step['from']:
+                    resolved[title] = step['to']
+        pages = {page['title']: page for page in query.get('pages', [])}
+        share = (response.wire_bytes or len(response.body)) // len(batch)
+        retry: List[Key] = []
+        for key in batch:
+            final_title = resolved[key[1]]
+            page = pages.get(final_title)
+            if page is None or page.get('missing') or page.get('invalid'):
+                self._fail(key, FetchError(self._url(key), 404,
+                                           'Missing page'))
+                continue
+            revisions = page.get('revisions')
+            if not revisions:
+                # Left out of a response that was too large
+                retry.append(key)
+                continue
+            content = revisions[0].get('slots', {}).get('main', {}).get(
+                'content', '')
+            body, links = render_page(final_title, content)
+            future = self._future(key)
+            if future is not None:
+                future.set_result(FetchResult(
+                    url=self._url((api_url, final_title)), status=200,
+                    body=body,
+                    headers={'Content-Type': 'text/html; charset=UTF-8'},
+                    elapsed=response.elapsed, wire_bytes=share))
+            if self.prefetch:
+                self._prefetch(api_url, links)
+        if retry:
+            with self._condition:
+                self._urgent.extendleft(retry)
+                self._condition.notify()
+
+    def close(self) -> None:
+        """
+        Stop the workers. Pages downloaded ahead are dropped and fetches
+        still waiting fail.
+        """
+        with self._condition:
+            self._closed = True
+            self._urgent.clear()
+            self._speculative.clear()
+            self._condition.notify_all()
+        for worker in self._workers:
+            worker.join()
+        for key in list(self._pending):
+            self._fail(key, FetchError(self._url(key), None,
+                                       'Fetcher closed'))
+        self.transport.close()
+
+
+FETCHERS: Dict[str, Type[Fetcher]] = dict(fetcher.FETCHERS,
+                                          mediawiki=MediaWikiFetcher)
@@ -0,0 +1,384 @@
+import bisect
+import json
+import logging
+import os
+import threading
+import time
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple
+
+logger = logging.getLogger('Web-Scraper')
+
+# Upper bounds in seconds, from a fast parse to a slow download
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+                   1.0, 2.5, 5.0, 10.0, 30.0)
+
+LabelValues = Tuple[str, ...]
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str]) -> str:
+    if not names:
+        return ''
+    escaped = (str(v).replace('\\', '\\\\').replace('"', '\\"')
+               .replace('\n', '\\n') for v in values)
+    return '{%s}' % ','.join('%s="%s"' % (n, v)
+                             for n, v in zip(names, escaped))
+
+
+def _format_value(value: float) -> str:
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if value != int(value) else str(int(value))
+
+
+class Metric(ABC):
+    """
+    Base class of the metric types. Values are kept per combination of
+    label values and are thread safe.
+    """
+
+    kind = ''
+
+    def __init__(self, name: str, documentation: str,
+                 labelnames: Sequence[str] = ()) -> None:
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, str]) -> LabelValues:
+        if set(labels) != set(self.labelnames):
+            raise ValueError('%s takes labels %s, got %s'
+                             % (self.name, self.labelnames, sorted(labels)))
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    @abstractmethod
+    def samples(self) -> List[Tuple[str, LabelValues, float]]:
+        """
+        The (suffix, label values, value) lines of the text format
+        """
+
+    @abstractmethod
+    def to_json(self) -> List[Dict[str, Any]]:
+        pass
+
+    def render(self) -> str:
+        lines = ['# HELP %s %s' % (self.name, self.documentation),
+                 '# TYPE %s %s' % (self.name, self.kind)]
+        for suffix, values, value in self.samples():
+            names = self.labelnames
+            if suffix == '_bucket':
+                names = names + ('le',)
+            lines.append('%s%s%s %s' % (self.name, suffix,
+                                        _format_labels(names, values),
+                                        _format_value(value)))
+        return '\n'.join(lines) + '\n'
+
+
+class Counter(Metric):
+    """
+    A value that only goes up
+    """
+
+    kind = 'counter'
+
+    def __init__(self, name: str, documentation: str,
+                 labelnames: Sequence[str] = ()) -> None:
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[LabelValues, float] = {}
+
+    def inc(self, amount: float = 1.0, **labels: str) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def value(self, **labels: str) -> float:
+        return self._values.get(self._key(labels), 0.0)
+
+    def samples(self) -> List[Tuple[str, LabelValues, float]]:
+        with self._lock:
+            return [('', key, value)
+                    for key, value in sorted(self._values.items())]
+
+    def to_json(self) -> List[Dict[str, Any]]:
+        return [{'labels': dict(zip(self.labelnames, key)), 'value': value}
+                for _, key, value in self.samples()]
+
+
+class Gauge(Counter):
+    """
+    A value that goes up and down, like the length of a queue
+    """
+
+    kind = 'gauge'
+
+    def set(self, value: float, **labels: str) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+
+class _HistogramValues:
+    def __init__(self, num_buckets: int) -> None:
+        self.counts = [0] * num_buckets
+        self.sum = 0.0
+        self.count = 0
+
+
+class Histogram(Metric):
+    """
+    Counts of observations below each bucket bound, with their sum
+    """
+
+    kind = 'histogram'
+
+    def __init__(self, name: str, documentation: str,
+                 labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = LATENCY_BUCKETS) -> None:
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (float('inf'),)
+        self._values: Dict[LabelValues, _HistogramValues] = {}
+
+    def observe(self, value: float, **labels: str) -> None:
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            values = self._values.get(key)
+            if values is None:
+                values = self._values[key] = _HistogramValues(
+                    len(self.buckets))
+            values.counts[index] += 1
+            values.sum += value
+            values.count += 1
+
+    @contextmanager
+    def time(self, **labels: str) -> Iterator[None]:
+        """
+        Observe the seconds spent in a with block
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def count(self, **labels: str) -> int:
+        values = self._values.get(self._key(labels))
+        return values.count if values else 0
+
+    def total(self, **labels: str) -> float:
+        values = self._values.get(self._key(labels))
+        return values.sum if values else 0.0
+
+    def _cumulative(self) -> List[Tuple[LabelValues, List[int], float, int]]:
+        with self._lock:
+            result = []
+            for key, values in sorted(self._values.items()):
+                cumulative = []
+                running = 0
+                for count in values.counts:
+                    running += count
+                    cumulative.append(running)
+                result.append((key, cumulative, values.sum, values.count))
+            return result
+
+    def samples(self) -> List[Tuple[str, LabelValues, float]]:
+        samples: List[Tuple[str, LabelValues, float]] = []
+        for key, cumulative, total, count in self._cumulative():
+            for bound, running in zip(self.buckets, cumulative):
+                samples.append(('_bucket', key + (_format_value(bound),),
+                                running))
+            samples.append(('_sum', key, total))
+            samples.append(('_count', key, count))
+        return samples
+
+    def to_json(self) -> List[Dict[str, Any]]:
+        return [{'labels': dict(zip(self.labelnames, key)),
+                 'count': count, 'sum': total,
+                 'mean': total / count if count else 0.0,
+                 'buckets': {_format_value(b): c
+                             for b, c in zip(self.buckets, cumulative)}}
+                for key, cumulative, total, count in self._cumulative()]
+
+
+class MetricsRegistry:
+    """
+    The set of metrics exported together
+    """
+
+    def __init__(self) -> None:
+        self._metrics: Dict[str, Metric] = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric: Metric) -> Metric:
+        with self._lock:
+            if metric.name in self._metrics:
+                raise ValueError('Duplicate metric %s' % metric.name)
+            self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, documentation: str,
+                labelnames: Sequence[str] = ()) -> Counter:
+        metric = Counter(name, documentation, labelnames)
+        self.register(metric)
+        return metric
+
+    def gauge(self, name: str, documentation: str,
+              labelnames: Sequence[str] = ()) -> Gauge:
+        metric = Gauge(name, documentation, labelnames)
+        self.register(metric)
+        return metric
+
+    def histogram(self, name: str, documentation: str,
+                  labelnames: Sequence[str] = (),
+                  buckets: Sequence[float] = LATENCY_BUCKETS) -> Histogram:
+        metric = Histogram(name, documentation, labelnames, buckets)
+        self.register(metric)
+        return metric
+
+    def get(self, name: str) -> Optional[Metric]:
+        return self._metrics.get(name)
+
+    def render(self) -> str:
+        """
+        All metrics in the Prometheus text exposition format
+        """
+        with self._lock:
+            metrics = list(self._metrics.values())
+        return ''.join(metric.render() for metric in metrics)
+
+    def to_json(self) -> Dict[str, Any]:
+        with self._lock:
+            metrics = list(self._metrics.values())
+        return {'timestamp': time.time(),
+                'metrics': {metric.name: {'type': metric.kind,
+                                          'help': metric.documentation,
+                                          'values': metric.to_json()}
+                            for metric in metrics}}
+
+
+class CrawlMetrics:
+    """
+    What each stage of a crawl does and how long it takes
+    """
+
+    def __init__(self, registry: Optional[MetricsRegistry] = None) -> None:
+        self.registry = registry if registry is not None else MetricsRegistry()
+        registry = self.registry
+        self.queue_depth = registry.gauge(
+            'spider_queue_depth', 'Urls waiting in the frontier')
+        self.in_flight = registry.gauge(
+            'spider_in_flight', 'Pages being fetched or parsed')
+        self.fetch_seconds = registry.histogram(
+            'spider_fetch_seconds', 'Time to download a page')
+        self.downloaded_bytes = registry.counter(
+            'spider_downloaded_bytes_total',
+            'Bytes received, before decompression')
+        self.html_parse_seconds = registry.histogram(
+            'spider_html_parse_seconds', 'Time to parse the html of a page')
+        self.infobox_parse_seconds = registry.histogram(
+            'spider_infobox_parse_seconds',
+            'Time to extract the infobox and links of a parsed page')
+        self.graph_insert_seconds = registry.histogram(
+            'spider_graph_insert_seconds',
+            'Time to merge a page into the graph')
+        self.record_cache = registry.counter(
+            'spider_record_cache_total',
+            'Record cache lookups, by whether the page had to be parsed',
+            ('result',))
+        self.pages = registry.counter(
+            'spider_pages_total', 'Pages merged, by type', ('type',))
+        self.skipped = registry.counter(
+            'spider_skipped_total', 'Urls not fetched, by reason',
+            ('reason',))
+        self.failed = registry.counter(
+            'spider_failed_total',
+            'Failed fetches, by status and whether the url was queued again',
+            ('reason', 'action'))
+
+
+class MetricsServer:
+    """
+    Serve the metrics of a registry to Prometheus on /metrics
+    """
+
+    def __init__(self, registry: MetricsRegistry, port: int = 9100,
+                 host: str = '127.0.0.1') -> None:
+        self.registry = registry
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self) -> None:
+                if self.path.split('?')[0] not in ('/', '/metrics'):
+                    self.send_error(404)
+                    return
+                body = registry.render().encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type',
+                                 'text/plain; version=0.0.4; charset=utf-8')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format: str, *args: Any) -> None:
+                pass
+
+        self._server = ThreadingHTTPServer((host, port), Handler)
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(target=self._server.serve_forever,
+                                        daemon=True)
+
+    @property
+    def port(self) -> int:
+        return self._server.server_address[1]
+
+    def start(self) -> 'MetricsServer':
+        self._thread.start()
+        logger.info('Serving metrics on port %d' % self.port)
+        return self
+
+    def stop(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+
+
+class JsonDumper:
+    """
+    Periodically write the metrics of a registry to a json file, replaced
+    atomically so readers never see a partial dump
+    """
+
+    def __init__(self, registry: MetricsRegistry, path: str,
+                 interval: float = 10.0) -> None:
+        self.registry = registry
+        self.path = path
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._loop, daemon=True)
+
+    def dump(self) -> None:
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(self.registry.to_json(), f)
+        os.replace(tmp_path, self.path)
+
+    def _loop(self) -> None:
+        while not self._stop.wait(self.interval):
+            try:
+                self.dump()
+            except OSError as e:
+                logger.error('Failed to dump metrics: %s' % e)
+
+    def start(self) -> 'JsonDumper':
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        """
+        Stop dumping, after writing the final values
+        """
+        self._stop.set()
+        if self._thread.is_alive():
+            self._thread.join()
+        self.dump()
@@ -1,6 +1,6 @@
 import logging
 import re
-from typing import Dict, List
+from typing import Dict, List, Optional, cast
 from urllib import parse
 
 from bs4.element import Tag
@@ -102,14 +102,13 @@ class MovieParser:
         Returns:
             A list of actors
         """
-        urls: List[Url] = []
         cast_h2 = html.find_all(
             lambda tag: tag.name == 'h2' and tag.find_all('span', id='Cast'))
         if len(cast_h2) != 1:
             logger.log(logging.WARN,
                        '%d cast section found for %s' % (
                            len(cast_h2), self.url))
-            return urls
+            return []
         cast_list = None
         for sibling in cast_h2[0].next_siblings:
             if hasattr(sibling, 'name') and sibling.name == 'ul':
@@ -119,6 +118,18 @@ class MovieParser:
                   and sibling.ul is not None):
                 cast_list = sibling.ul
                 break
+        return self.parse_cast_list(cast(Optional[Tag], cast_list))
+
+    def parse_cast_list(self, cast_list: Optional[Tag]) -> List[Url]:
+        """
+        Parse the actors out of the list following the Cast headline
+        Args:
+            cast_list: The ul element, None if there isn't one
+
+        Returns:
+            A list of actors
+        """
+        urls: List[Url] = []
         if cast_list:
             for li in cast_list.find_all('li'):
                 link = li.find('a', href=re.compile('/wiki/'))
@@ -0,0 +1,300 @@
+import gzip
+import hashlib
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+from dataclasses import dataclass
+from typing import Dict, Optional
+from urllib import parse
+
+from scraper.spider.fetcher import FetchResult, Fetcher
+
+_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS pages (
+    url TEXT PRIMARY KEY,
+    final_url TEXT,
+    digest TEXT NOT NULL,
+    etag TEXT,
+    last_modified TEXT,
+    fetched_at REAL NOT NULL,
+    accessed_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS pages_accessed ON pages (accessed_at);
+CREATE INDEX IF NOT EXISTS pages_digest ON pages (digest);
+CREATE TABLE IF NOT EXISTS blobs (
+    digest TEXT PRIMARY KEY,
+    size INTEGER NOT NULL
+);
+'''
+
+
+def canonical_cache_key(url: str) -> str:
+    """
+    Normalize a url so equivalent spellings share a cache entry
+    Args:
+        url: The full url
+
+    Returns:
+        The cache key
+    """
+    parts = parse.urlsplit(url)
+    # Segment by segment, as an encoded slash is not a path separator
+    path = '/'.join(parse.quote(parse.unquote(segment),
+                                safe=':@!$&\'()*+,;=-._~')
+                    for segment in parts.path.split('/'))
+    return parse.urlunsplit((parts.scheme.lower(), parts.netloc.lower(),
+                             path or '/', parts.query, ''))
+
+
+@dataclass
+class CacheEntry:
+    """
+    A cached page
+    """
+    # Final url after redirects, or None if the page was not redirected
+    url: Optional[str]
+    body: bytes
+    etag: Optional[str]
+    last_modified: Optional[str]
+    fresh: bool
+
+
+class PageCache:
+    """
+    Persistent page cache shared between runs and processes.
+
+    Bodies are stored gzip compressed under their sha256 digest, so pages
+    with the same content are kept once. A sqlite index maps canonical urls
+    to digests, the url they redirected to and the validators needed for
+    conditional requests. Entries
+    younger than the ttl are served without touching the network, and the
+    least recently used pages are evicted once the stored bytes exceed the
+    size bound.
+    """
+
+    def __init__(self, directory: str, max_bytes: int = 1 << 30,
+                 ttl: float = 7 * 24 * 3600) -> None:
+        """
+        Open or create a cache
+        Args:
+            directory: Where the cache lives
+            max_bytes: Bound on the compressed size of stored pages
+            ttl: Seconds before an entry has to be revalidated
+        """
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        os.makedirs(os.path.join(directory, 'objects'), exist_ok=True)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(os.path.join(directory, 'index.sqlite'),
+                                   timeout=60, check_same_thread=False,
+                                   isolation_level=None)
+        self._db.execute('PRAGMA journal_mode=WAL')
+        self._db.executescript(_SCHEMA)
+        columns = [row[1] for row
+                   in self._db.execute('PRAGMA table_info(pages)')]
+        if 'final_url' not in columns:
+            # Cache created before redirects were kept
+            try:
+                self._db.execute(
+                    'ALTER TABLE pages ADD COLUMN final_url TEXT')
+            except sqlite3.OperationalError:
+                # Added by another process in the meantime
+                pass
+
+    def _blob_path(self, digest: str) -> str:
+        return os.path.join(self.directory, 'objects', digest[:2],
+                            digest + '.gz')
+
+    def _read_blob(self, digest: str) -> Optional[bytes]:
+        try:
+            with gzip.open(self._blob_path(digest), 'rb') as f:
+                return f.read()
+        except (OSError, EOFError):
+            return None
+
+    def _write_blob(self, digest: str, body: bytes) -> int:
+        path = self._blob_path(digest)
+        if os.path.exists(path):
+            return os.path.getsize(path)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path))
+        with os.fdopen(fd, 'wb') as f:
+            f.write(gzip.compress(body))
+        # Atomic, so concurrent writers of the same digest are harmless
+        os.replace(tmp_path, path)
+        return os.path.getsize(path)
+
+    def get(self, url: str) -> Optional[CacheEntry]:
+        """
+        Look up a page
+        Args:
+            url: The full url
+
+        Returns:
+            The entry or None on a miss
+        """
+        key = canonical_cache_key(url)
+        with self._lock:
+            row = self._db.execute(
+                'SELECT final_url, digest, etag, last_modified, fetched_at '
+                'FROM pages WHERE url = ?', (key,)).fetchone()
+            if row is None:
+                return None
+            final_url, digest, etag, last_modified, fetched_at = row
+            body = self._read_blob(digest)
+            if body is None:
+                # Blob evicted by another process, treat as a miss
+                self._db.execute('DELETE FROM pages WHERE url = ?', (key,))
+                return None
+            now = time.time()
+            self._db.execute('UPDATE pages SET accessed_at = ? WHERE url = ?',
+                             (now, key))
+        return CacheEntry(url=final_url, body=body, etag=etag,
+                          last_modified=last_modified,
+                          fresh=now - fetched_at < self.ttl)
+
+    def put(self, url: str, body: bytes,
+            headers: Optional[Dict[str, str]] = None,
+            final_url: Optional[str] = None) -> str:
+        """
+        Store a page
+        Args:
+            url: The full url
+            body: The page content
+            headers: The response headers, used for revalidation
+            final_url: The url the page was redirected to, also stored as
+                an entry of its own
+
+        Returns:
+            The content digest
+        """
+        headers = {k.lower(): v for k, v in (headers or {}).items()}
+        digest = hashlib.sha256(body).hexdigest()
+        size = self._write_blob(digest, body)
+        now = time.time()
+        if final_url is not None and (canonical_cache_key(final_url)
+                                      == canonical_cache_key(url)):
+            final_url = None
+        rows = [(canonical_cache_key(url), final_url)]
+        if final_url is not None:
+            rows.append((canonical_cache_key(final_url), None))
+        with self._lock:
+            self._db.execute('BEGIN IMMEDIATE')
+            try:
+                self._db.execute(
+                    'INSERT OR IGNORE INTO blobs (digest, size) '
+                    'VALUES (?, ?)', (digest, size))
+                for key, redirect in rows:
+                    self._db.execute(
+                        'INSERT OR REPLACE INTO pages (url, final_url, '
+                        'digest, etag, last_modified, fetched_at, '
+                        'accessed_at) VALUES (?, ?, ?, ?, ?, ?, ?)',
+                        (key, redirect, digest, headers.get('etag'),
+                         headers.get('last-modified'), now, now))
+                self._evict()
+                self._db.execute('COMMIT')
+            except BaseException:
+                self._db.execute('ROLLBACK')
+                raise
+        return digest
+
+    def refresh(self, url: str) -> None:
+        """
+        Mark an entry as fresh after a successful revalidation
+        """
+        now = time.time()
+        with self._lock:
+            self._db.execute(
+                'UPDATE pages SET fetched_at = ?, accessed_at = ? '
+                'WHERE url = ?', (now, now, canonical_cache_key(url)))
+
+    @property
+    def size(self) -> int:
+        """
+        Compressed bytes currently stored
+        """
+        with self._lock:
+            return self._stored_bytes()
+
+    def _stored_bytes(self) -> int:
+        return self._db.execute(
+            'SELECT COALESCE(SUM(size), 0) FROM blobs').fetchone()[0]
+
+    def _evict(self) -> None:
+        """
+        Drop least recently used pages until the size bound holds
+        """
+        total = self._stored_bytes()
+        while total > self.max_bytes:
+            row = self._db.execute(
+                'SELECT url, digest FROM pages '
+                'ORDER BY accessed_at LIMIT 1').fetchone()
+            if row is None:
+                break
+            url, digest = row
+            self._db.execute('DELETE FROM pages WHERE url = ?', (url,))
+            referenced = self._db.execute(
+                'SELECT 1 FROM pages WHERE digest = ? LIMIT 1',
+                (digest,)).fetchone()
+            if referenced is None:
+                size = self._db.execute(
+                    'SELECT size FROM blobs WHERE digest = ?',
+                    (digest,)).fetchone()[0]
+                self._db.execute('DELETE FROM blobs WHERE digest = ?',
+                                 (digest,))
+                try:
+                    os.remove(self._blob_path(digest))
+                except OSError:
+                    pass
+                total -= size
+
+    def close(self) -> None:
+        with self._lock:
+            self._db.close()
+
+
+class CachingFetcher(Fetcher):
+    """
+    Serve pages from a PageCache, falling back to another fetcher
+    """
+
+    def __init__(self, fetcher: Fetcher, cache: PageCache) -> None:
+        super().__init__(fetcher.timeout)
+        self.fetcher = fetcher
+        self.cache = cache
+        # Cache hits are reported along with the network counters
+        self.stats = fetcher.stats
+
+    def fetch(self, url: str,
+              headers: Optional[Dict[str, str]] = None) -> FetchResult:
+        start = time.perf_counter()
+        entry = self.cache.get(url)
+        if entry is not None and entry.fresh:
+            self.stats.record_cache_hit()
+            return FetchResult(url=entry.url or url, status=200,
+                               body=entry.body,
+                               elapsed=time.perf_counter() - start)
+        request_headers = dict(headers or {})
+        if entry is not None:
+            if entry.etag:
+                request_headers['If-None-Match'] = entry.etag
+            if entry.last_modified:
+                request_headers['If-Modified-Since'] = entry.last_modified
+        result = self.fetcher.fetch(url, request_headers)
+        if result.status == 304 and entry is not None:
+            self.cache.refresh(url)
+            self.stats.record_revalidation()
+            result.url = entry.url or url
+            result.status = 200
+            result.body = entry.body
+            return result
+        if result.status != 304:
+            self.cache.put(url, result.body, result.headers, result.url)
+        return result
+
+    def close(self) -> None:
+        self.fetcher.close()
+        self.cache.close()
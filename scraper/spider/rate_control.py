@@ -0,0 +1,323 @@
+import logging
+import random
+import threading
+import time
+from email.utils import parsedate_to_datetime
+from typing import Callable, Dict, Optional
+from urllib import parse
+
+from scraper.spider.fetcher import FetchError, FetchResult, Fetcher
+
+logger = logging.getLogger('Web-Scraper')
+
+
+def retry_after(headers: Dict[str, str]) -> Optional[float]:
+    """
+    Seconds to wait asked for by a Retry-After header
+    Args:
+        headers: The response headers
+
+    Returns:
+        The delay, or None if there is no valid header
+    """
+    value = {k.lower(): v for k, v in headers.items()}.get('retry-after')
+    if not value:
+        return None
+    if value.strip().isdigit():
+        return float(value)
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+class TokenBucket:
+    """
+    Requests per second with bursts of up to burst requests.
+
+    Callers take a token even when the bucket is empty and wait for the
+    time it takes to refill, so waiting callers are served in order.
+    """
+
+    def __init__(self, rate: float, burst: float = 1.0,
+                 clock: Callable[[], float] = time.monotonic) -> None:
+        self.rate = rate
+        self.burst = burst
+        self._clock = clock
+        self._tokens = burst
+        self._updated = clock()
+
+    def reserve(self) -> float:
+        """
+        Take a token
+        Returns:
+            Seconds to wait before using it
+        """
+        now = self._clock()
+        self._tokens = min(self.burst,
+                           self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+        self._tokens -= 1
+        return max(0.0, -self._tokens / self.rate)
+
+    def pause(self, seconds: float) -> None:
+        """
+        Hand out no tokens for a while, e.g. as asked by Retry-After
+        """
+        self._tokens = min(self._tokens, -seconds * self.rate)
+
+
+class CircuitBreaker:
+    """
+    Stops requests to a host after consecutive failures.
+
+    Once failure_threshold requests in a row have failed the breaker opens
+    and requests wait for the cooldown. Then a single probe is let through:
+    the breaker closes if it succeeds, and reopens with twice the cooldown
+    if it fails.
+    """
+
+    CLOSED, OPEN, HALF_OPEN = 'closed', 'open', 'half-open'
+
+    def __init__(self, failure_threshold: int = 5, cooldown: float = 30.0,
+                 max_cooldown: float = 600.0) -> None:
+        self.failure_threshold = failure_threshold
+        self.base_cooldown = cooldown
+        self.max_cooldown = max_cooldown
+        self.state = self.CLOSED
+        self.failures = 0
+        self._cooldown = cooldown
+        self._open_until = 0.0
+        self._probing = False
+
+    def wait_time(self, now: float) -> Optional[float]:
+        """
+        How long a request has to wait
+        Returns:
+            0 if it may go now, None if it has to wait for a probe
+        """
+        if self.state == self.OPEN:
+            if now < self._open_until:
+                return self._open_until - now
+            self.state = self.HALF_OPEN
+        if self.state == self.HALF_OPEN:
+            if self._probing:
+                return None
+            self._probing = True
+        return 0.0
+
+    def success(self) -> None:
+        self.state = self.CLOSED
+        self.failures = 0
+        self._cooldown = self.base_cooldown
+        self._probing = False
+
+    def failure(self, now: float) -> None:
+        self.failures += 1
+        if (self.state == self.HALF_OPEN
+                or self.failures >= self.failure_threshold):
+            if self.state != self.OPEN:
+                logger.warning('Circuit open for %.0fs after %d failures'
+                               % (self._cooldown, self.failures))
+            self.state = self.OPEN
+            self._open_until = now + self._cooldown
+            self._cooldown = min(self.max_cooldown, self._cooldown * 2)
+            self._probing = False
+
+
+class _HostState:
+    def __init__(self, rate: float, concurrency: float, burst: float,
+                 breaker: CircuitBreaker,
+                 clock: Callable[[], float]) -> None:
+        self.condition = threading.Condition()
+        self.bucket = TokenBucket(rate, burst, clock)
+        self.breaker = breaker
+        self.concurrency = concurrency
+        self.in_flight = 0
+        self.latency = 0.0
+
+
+class RateController:
+    """
+    Adapts the request rate and concurrency of each host to its responses.
+
+    Every host gets a token bucket and a limit on requests in flight. Both
+    grow additively while responses are fast and successful, and are
+    halved when the host answers 429 or 503, fails, or slows down past
+    twice the target latency. A circuit breaker per host pauses requests
+    after repeated failures.
+    """
+
+    # Statuses telling the client to slow down
+    THROTTLE_STATUSES = (429, 503)
+
+    def __init__(self, rate: float = 5.0, min_rate: float = 0.2,
+                 max_rate: float = 50.0, concurrency: float = 4.0,
+                 max_concurrency: float = 32.0, target_latency: float = 1.0,
+                 failure_threshold: int = 5, cooldown: float = 30.0,
+                 clock: Callable[[], float] = time.monotonic) -> None:
+        """
+        Create a rate controller
+        Args:
+            rate: Initial requests per second for a host
+            min_rate: Lowest requests per second
+            max_rate: Highest requests per second
+            concurrency: Initial requests in flight for a host
+            max_concurrency: Highest requests in flight
+            target_latency: Seconds. Slower responses stop the increase,
+                twice as slow ones cut the rate
+            failure_threshold: Consecutive failures that open the breaker
+            cooldown: Seconds the breaker first stays open
+            clock: Monotonic time source
+        """
+        self.initial_rate = rate
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.initial_concurrency = concurrency
+        self.max_concurrency = max_concurrency
+        self.target_latency = target_latency
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._hosts: Dict[str, _HostState] = {}
+
+    def _host(self, url: str) -> _HostState:
+        host = parse.urlsplit(url).netloc.lower()
+        with self._lock:
+            if host not in self._hosts:
+                self._hosts[host] = _HostState(
+                    self.initial_rate, self.initial_concurrency,
+                    max(1.0, self.initial_concurrency),
+                    CircuitBreaker(self.failure_threshold, self.cooldown),
+                    self._clock)
+            return self._hosts[host]
+
+    def rate(self, url: str) -> float:
+        """
+        Current requests per second for the host of a url
+        """
+        return self._host(url).bucket.rate
+
+    def concurrency(self, url: str) -> float:
+        """
+        Current limit on requests in flight for the host of a url
+        """
+        return self._host(url).concurrency
+
+    def acquire(self, url: str) -> None:
+        """
+        Block until a request to the url may be sent
+        """
+        state = self._host(url)
+        with state.condition:
+            while True:
+                wait = None
+                if state.in_flight < state.concurrency:
+                    wait = state.breaker.wait_time(self._clock())
+                    if wait == 0.0:
+                        break
+                state.condition.wait(wait)
+            state.in_flight += 1
+            delay = state.bucket.reserve()
+        if delay > 0:
+            time.sleep(delay)
+
+    def release(self, url: str, elapsed: float,
+                error: Optional[FetchError] = None) -> None:
+        """
+        Report the outcome of a request started with acquire
+        Args:
+            url: The requested url
+            elapsed: Seconds the request took
+            error: The error raised by the fetcher, if any
+        """
+        state = self._host(url)
+        with state.condition:
+            state.in_flight -= 1
+            bucket = state.bucket
+            if error is not None and error.retryable:
+                state.breaker.failure(self._clock())
+                bucket.rate = max(self.min_rate, bucket.rate / 2)
+                state.concurrency = max(1.0, state.concurrency / 2)
+                delay = retry_after(error.headers)
+                if error.status in self.THROTTLE_STATUSES and delay:
+                    bucket.pause(delay)
+            else:
+                # A 404 still means the host is answering
+                state.breaker.success()
+                state.latency = (elapsed if not state.latency
+                                 else 0.8 * state.latency + 0.2 * elapsed)
+                if state.latency > 2 * self.target_latency:
+                    bucket.rate = max(self.min_rate, bucket.rate / 2)
+                    state.concurrency = max(1.0, state.concurrency / 2)
+                elif state.latency <= self.target_latency:
+                    bucket.rate = min(self.max_rate, bucket.rate + 0.1)
+                    state.concurrency = min(
+                        self.max_concurrency,
+                        state.concurrency + 1 / state.concurrency)
+            state.condition.notify_all()
+
+
+class ThrottledFetcher(Fetcher):
+    """
+    Send requests through a RateController, retrying transient failures
+    with jittered exponential backoff
+    """
+
+    def __init__(self, fetcher: Fetcher, controller: RateController,
+                 max_retries: int = 3, base_delay: float = 0.5,
+                 max_delay: float = 60.0) -> None:
+        """
+        Wrap a fetcher
+        Args:
+            fetcher: Does the actual requests
+            controller: Paces the requests
+            max_retries: Retries of a request before giving up
+            base_delay: Seconds before the first retry, doubled each time
+            max_delay: Bound on the delay between retries
+        """
+        super().__init__(fetcher.timeout)
+        self.fetcher = fetcher
+        self.controller = controller
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.stats = fetcher.stats
+
+    def backoff(self, attempt: int, error: FetchError) -> float:
+        """
+        Seconds to wait before a retry, at least what Retry-After asks for
+        """
+        delay = random.uniform(
+            0, min(self.max_delay, self.base_delay * 2 ** attempt))
+        return max(delay, retry_after(error.headers) or 0.0)
+
+    def fetch(self, url: str,
+              headers: Optional[Dict[str, str]] = None) -> FetchResult:
+        attempt = 0
+        while True:
+            self.controller.acquire(url)
+            start = time.perf_counter()
+            error: Optional[FetchError] = None
+            try:
+                return self.fetcher.fetch(url, headers)
+            except FetchError as e:
+                error = e
+                if not e.retryable or attempt >= self.max_retries:
+                    raise
+            except Exception as e:
+                # Any other failure still ends the request, as a failure
+                error = FetchError(url, reason=repr(e))
+                raise
+            finally:
+                self.controller.release(url, time.perf_counter() - start,
+                                        error)
+            delay = self.backoff(attempt, error)
+            logger.warning('Retrying %s in %.01fs: %s' % (url, delay, error))
+            self.stats.record_retry()
+            time.sleep(delay)
+            attempt += 1
+
+    def close(self) -> None:
+        self.fetcher.close()
@@ -0,0 +1,133 @@
+import functools
+import hashlib
+import json
+import os
+import sqlite3
+import sys
+import threading
+import time
+from typing import Callable, Optional
+
+from scraper.graph.base_objects import Url
+from scraper.spider.extract import PageRecord
+from scraper.spider.utils import PageType
+
+_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS records (
+    key TEXT PRIMARY KEY,
+    version TEXT NOT NULL,
+    record TEXT NOT NULL,
+    created_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS records_version ON records (version);
+'''
+
+# Modules whose code decides what is extracted from a page
+PARSER_MODULES = ('scraper.spider.extract', 'scraper.spider.stream_extract',
+                  'scraper.spider.movie_parser',
+                  'scraper.spider.actor_parser', 'scraper.spider.utils')
+
+Extractor = Callable[[Url, bytes], PageRecord]
+
+
+@functools.lru_cache(maxsize=None)
+def parser_version(extractor: Extractor) -> str:
+    """
+    Fingerprint of the parsing code, changing whenever the code does
+    Args:
+        extractor: The extractor used on the pages
+
+    Returns:
+        A digest of the extractor name and of the source of its module
+        and of the parser modules
+    """
+    name = getattr(extractor, '__qualname__', type(extractor).__qualname__)
+    digest = hashlib.sha256(('%s.%s' % (extractor.__module__, name))
+                            .encode('utf-8'))
+    for module_name in sorted(set(PARSER_MODULES + (extractor.__module__,))):
+        path = getattr(sys.modules.get(module_name), '__file__', None)
+        if path is not None and os.path.exists(path):
+            with open(path, 'rb') as f:
+                digest.update(f.read())
+    return digest.hexdigest()[:16]
+
+
+def record_key(version: str, url: Url, content: bytes) -> str:
+    """
+    Cache key of the record extracted from a page. The url is part of the
+    key since records carry it, along with names derived from it.
+    """
+    digest = hashlib.sha256(version.encode('utf-8'))
+    digest.update(b'\0' + url.encode('utf-8') + b'\0')
+    digest.update(content)
+    return digest.hexdigest()
+
+
+class RecordCache:
+    """
+    Persistent cache of the records extracted from pages.
+
+    Records are keyed by a digest of the parser version, the url and the
+    html, so a page is parsed again only when its content or the parsing
+    code changed. Records of other parser versions are never served and
+    can be dropped with prune.
+    """
+
+    def __init__(self, path: str) -> None:
+        """
+        Open or create a cache
+        Args:
+            path: The sqlite file
+        """
+        self.path = path
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, timeout=60, check_same_thread=False,
+                                   isolation_level=None)
+        self._db.execute('PRAGMA journal_mode=WAL')
+        self._db.executescript(_SCHEMA)
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: str) -> Optional[PageRecord]:
+        with self._lock:
+            row = self._db.execute('SELECT record FROM records WHERE key = ?',
+                                   (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+        data = json.loads(row[0])
+        return PageRecord(url=data['url'],
+                          page_type=PageType[data['page_type']],
+                          attributes=data['attributes'],
+                          related=data['related'])
+
+    def put(self, key: str, version: str, record: PageRecord) -> None:
+        data = json.dumps({'url': record.url,
+                           'page_type': record.page_type.name,
+                           'attributes': record.attributes,
+                           'related': record.related})
+        with self._lock:
+            self._db.execute(
+                'INSERT OR REPLACE INTO records (key, version, record, '
+                'created_at) VALUES (?, ?, ?, ?)',
+                (key, version, data, time.time()))
+
+    def prune(self, version: str) -> int:
+        """
+        Drop the records of other parser versions
+        Returns:
+            The number of records dropped
+        """
+        with self._lock:
+            return self._db.execute('DELETE FROM records WHERE version != ?',
+                                    (version,)).rowcount
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._db.execute(
+                'SELECT COUNT(*) FROM records').fetchone()[0]
+
+    def close(self) -> None:
+        with self._lock:
+            self._db.close()
@@ -0,0 +1,534 @@
+import json
+import logging
+import multiprocessing
+import os
+import sqlite3
+import time
+import zlib
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+from scraper.graph.actor import Actor
+from scraper.graph.base_objects import EntityType, NodeBase, Url
+from scraper.graph.graph import Graph
+from scraper.graph.movie import Movie
+from scraper.spider.dedup import SeenSet
+from scraper.spider.extract import PageRecord
+from scraper.spider.fetcher import Fetcher, UrllibFetcher
+from scraper.spider.frontier import Frontier, QueueEntry, expected_page_type
+from scraper.spider.page_cache import PageCache
+from scraper.spider.record_cache import RecordCache
+from scraper.spider.spider_runner import SpiderRunner
+from scraper.spider.utils import PageType
+
+logger = logging.getLogger('Web-Scraper')
+
+_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS frontier (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    url TEXT NOT NULL UNIQUE,
+    shard INTEGER NOT NULL,
+    predecessor TEXT,
+    weight REAL NOT NULL,
+    depth INTEGER NOT NULL,
+    page_type TEXT NOT NULL,
+    state INTEGER NOT NULL DEFAULT 0,
+    retries INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS frontier_next
+    ON frontier (shard, state, depth, retries, weight DESC, id);
+CREATE INDEX IF NOT EXISTS frontier_state ON frontier (state);
+CREATE TABLE IF NOT EXISTS seen (
+    url TEXT PRIMARY KEY
+);
+CREATE TABLE IF NOT EXISTS budget (
+    node_type TEXT PRIMARY KEY,
+    count INTEGER NOT NULL,
+    node_limit INTEGER NOT NULL
+);
+'''
+
+# Frontier entry states
+_QUEUED, _CLAIMED, _DONE = 0, 1, 2
+
+_NODE_TYPES = {PageType.ACTOR: EntityType.ACTOR,
+               PageType.MOVIE: EntityType.MOVIE}
+
+# (movie url, actor url, weight) of an edge
+Link = Tuple[Url, Url, float]
+
+
+def shard_of(url: str, num_shards: int) -> int:
+    """
+    The worker responsible for a canonical url, stable across processes
+    """
+    return zlib.crc32(url.encode('utf-8')) % num_shards
+
+
+class ShardStore:
+    """
+    State shared by the workers of a sharded crawl.
+
+    A sqlite database holds the frontier of every shard, the urls crawled
+    by any worker, and the number of nodes of each type against the global
+    limits. It can be shared by processes on one machine only: the
+    database is in WAL mode, whose shared memory index does not work over
+    a network filesystem.
+    """
+
+    def __init__(self, path: str, num_shards: int, actor_limit: int = -1,
+                 movie_limit: int = -1) -> None:
+        """
+        Open or create a store
+        Args:
+            path: The database file
+            num_shards: Number of workers
+            actor_limit: Global actor limit
+            movie_limit: Global movie limit
+        """
+        self.num_shards = num_shards
+        self._db = sqlite3.connect(path, timeout=60, isolation_level=None)
+        self._db.execute('PRAGMA journal_mode=WAL')
+        self._db.executescript(_SCHEMA)
+        self._db.executemany(
+            'INSERT OR IGNORE INTO budget VALUES (?, 0, ?)',
+            [(EntityType.ACTOR.value, actor_limit),
+             (EntityType.MOVIE.value, movie_limit)])
+
+    def push(self, url: Url, predecessor: Optional[Url], weight: float,
+             depth: int, page_type: PageType) -> None:
+        """
+        Queue a url on its shard, unless it was queued before
+        """
+        self._db.execute(
+            'INSERT OR IGNORE INTO frontier (url, shard, predecessor, '
+            'weight, depth, page_type) VALUES (?, ?, ?, ?, ?, ?)',
+            (url, shard_of(url, self.num_shards), predecessor, weight, depth,
+             page_type.name))
+
+    def claim(self, shard: int) -> Optional[Tuple[Any, ...]]:
+        """
+        Take the next url of a shard
+        Args:
+            shard: The shard
+
+        Returns:
+            (id, url, predecessor, weight, depth) or None if the shard
+            has nothing queued
+        """
+        self._db.execute('BEGIN IMMEDIATE')
+        try:
+            row = self._db.execute(
+                'SELECT id, url, predecessor, weight, depth FROM frontier '
+                'WHERE shard = ? AND state = ? '
+                'ORDER BY depth, retries, weight DESC, id LIMIT 1',
+                (shard, _QUEUED)).fetchone()
+            if row is not None:
+                self._db.execute('UPDATE frontier SET state = ? WHERE id = ?',
+                                 (_CLAIMED, row[0]))
+        finally:
+            self._db.execute('COMMIT')
+        return row
+
+    def set_state(self, entry_id: int, state: int) -> None:
+        self._db.execute('UPDATE frontier SET state = ? WHERE id = ?',
+                         (state, entry_id))
+
+    def requeue(self, entry_id: int) -> None:
+        """
+        Queue a claimed url again, behind the others of its depth
+        """
+        self._db.execute(
+            'UPDATE frontier SET state = ?, retries = retries + 1 '
+            'WHERE id = ?', (_QUEUED, entry_id))
+
+    def drop(self, page_type: PageType) -> None:
+        """
+        Remove the queued urls of a type from every shard
+        """
+        self._db.execute(
+            'DELETE FROM frontier WHERE state = ? AND page_type = ?',
+            (_QUEUED, page_type.name))
+
+    def clear(self, shard: int) -> None:
+        self._db.execute('DELETE FROM frontier WHERE shard = ? AND state = ?',
+                         (shard, _QUEUED))
+
+    def has_queued(self, shard: int) -> bool:
+        return bool(self._db.execute(
+            'SELECT EXISTS (SELECT 1 FROM frontier '
+            'WHERE shard = ? AND state = ?)', (shard, _QUEUED)).fetchone()[0])
+
+    def num_queued(self, shard: int) -> int:
+        return self._db.execute(
+            'SELECT COUNT(*) FROM frontier WHERE shard = ? AND state = ?',
+            (shard, _QUEUED)).fetchone()[0]
+
+    def queued(self, shard: int) -> List[Tuple[Any, ...]]:
+        """
+        The queued (url, predecessor, weight, depth) of a shard
+        """
+        return self._db.execute(
+            'SELECT url, predecessor, weight, depth FROM frontier '
+            'WHERE shard = ? AND state = ? ORDER BY id',
+            (shard, _QUEUED)).fetchall()
+
+    def busy(self) -> bool:
+        """
+        Whether any shard still has urls queued or being crawled
+        """
+        return self._db.execute(
+            'SELECT 1 FROM frontier WHERE state < ? LIMIT 1',
+            (_DONE,)).fetchone() is not None
+
+    def add_seen(self, url: Url) -> None:
+        self._db.execute('INSERT OR IGNORE INTO seen VALUES (?)', (url,))
+
+    def is_seen(self, url: str) -> bool:
+        return self._db.execute('SELECT 1 FROM seen WHERE url = ?',
+                                (url,)).fetchone() is not None
+
+    def num_seen(self) -> int:
+        return self._db.execute('SELECT COUNT(*) FROM seen').fetchone()[0]
+
+    def reserve(self, node_type: EntityType) -> bool:
+        """
+        Count a new node against the global limit of its type
+        Args:
+            node_type: The type of the node
+
+        Returns:
+            False if the limit has already been exceeded
+        """
+        cursor = self._db.execute(
+            'UPDATE budget SET count = count + 1 WHERE node_type = ? '
+            'AND (node_limit <= 0 OR count <= node_limit)',
+            (node_type.value,))
+        return cursor.rowcount == 1
+
+    def count(self, node_type: EntityType) -> int:
+        return self._db.execute(
+            'SELECT count FROM budget WHERE node_type = ?',
+            (node_type.value,)).fetchone()[0]
+
+    def limits_reached(self) -> bool:
+        """
+        Whether both global limits have been exceeded
+        """
+        rows = self._db.execute(
+            'SELECT count, node_limit FROM budget').fetchall()
+        return all(0 < limit < count for count, limit in rows)
+
+    def close(self) -> None:
+        self._db.close()
+
+
+class SharedSeenSet(SeenSet):
+    """
+    Urls crawled by any worker of a sharded crawl
+    """
+
+    def __init__(self, store: ShardStore) -> None:
+        self.store = store
+
+    def add(self, url: Url) -> None:
+        self.store.add_seen(url)
+
+    def __contains__(self, url: object) -> bool:
+        return isinstance(url, str) and self.store.is_seen(url)
+
+    def __len__(self) -> int:
+        return self.store.num_seen()
+
+
+class SharedFrontier(Frontier):
+    """
+    The part of a shared frontier owned by one worker.
+
+    Urls are queued on the shard of their hash, whichever worker found
+    them. A worker whose shard is empty waits while any other worker is
+    still busy, since it may yet queue urls for this shard.
+    """
+
+    def __init__(self, store: ShardStore, shard: int,
+                 poll_interval: float = 0.05) -> None:
+        super().__init__()
+        self.store = store
+        self.shard = shard
+        self.poll_interval = poll_interval
+        self._claimed: Optional[int] = None
+        self._claimed_url: Optional[Url] = None
+
+    def _put(self, entry: QueueEntry) -> None:
+        url, predecessor, weight, depth = entry
+        self.store.push(url, predecessor.url if predecessor else None,
+                        weight, depth, expected_page_type(entry))
+
+    def _requeue(self, entry: QueueEntry) -> None:
+        if self._claimed is not None and entry[0] == self._claimed_url:
+            self.store.requeue(self._claimed)
+            self._claimed = None
+        else:
+            self._put(entry)
+
+    def finish(self) -> None:
+        """
+        Mark the entry last taken as crawled
+        """
+        if self._claimed is not None:
+            self.store.set_state(self._claimed, _DONE)
+            self._claimed = None
+
+    def empty(self) -> bool:
+        while not self.store.has_queued(self.shard):
+            if self.store.limits_reached() or not self.store.busy():
+                return True
+            time.sleep(self.poll_interval)
+        return False
+
+    def get(self) -> QueueEntry:
+        self.finish()
+        row = self.store.claim(self.shard)
+        while row is None:
+            # The queued urls may have been dropped by another worker
+            if self.empty():
+                raise IndexError('Empty frontier')
+            row = self.store.claim(self.shard)
+        entry_id, url, predecessor, weight, depth = row
+        self._claimed = entry_id
+        self._claimed_url = url
+        movie = None
+        if predecessor is not None:
+            # Only the url of a movie crawled by another worker is known
+            movie = Movie(url=predecessor)
+        return url, movie, weight, depth
+
+    def entries(self) -> List[QueueEntry]:
+        return [(url, Movie(url=predecessor) if predecessor else None,
+                 weight, depth)
+                for url, predecessor, weight, depth
+                in self.store.queued(self.shard)]
+
+    def _drop_closed(self) -> None:
+        for page_type in self.closed:
+            self.store.drop(page_type)
+
+    def clear(self) -> None:
+        self.store.clear(self.shard)
+
+    def __len__(self) -> int:
+        return self.store.num_queued(self.shard)
+
+
+class ShardWorker(SpiderRunner):
+    """
+    Spider runner crawling one shard of a sharded crawl.
+
+    The worker builds a partial graph of the pages it crawled. Edges to
+    movies crawled by other workers are kept as links between urls, which
+    merge_shards resolves once every worker is done.
+    """
+
+    def __init__(self, init_url: Url, store: ShardStore, shard: int,
+                 **kwargs: Any) -> None:
+        """
+        Create a shard worker
+        Args:
+            init_url: Has to be a url to a movie.
+            store: The state shared with the other workers
+            shard: The shard crawled by this worker
+            **kwargs: Passed on to SpiderRunner
+        """
+        self.store = store
+        self.shard = shard
+        self.links: List[Link] = []
+        self.shared_frontier = SharedFrontier(store, shard)
+        super().__init__(init_url, frontier=self.shared_frontier,
+                         seen=SharedSeenSet(store), **kwargs)
+
+    def _link(self, movie: Movie, actor: Actor, weight: float) -> None:
+        self.links.append((movie.url, actor.url, weight))
+
+    def _count(self, node_type: EntityType) -> int:
+        return self.store.count(node_type)
+
+    def _entry_done(self, entry: QueueEntry) -> None:
+        super()._entry_done(entry)
+        self.shared_frontier.finish()
+
+    def _process_record(self, record: PageRecord,
+                        predecessor: Optional[Movie], weight: float,
+                        depth: int) -> None:
+        node_type = _NODE_TYPES.get(record.page_type)
+        if node_type is not None and not self.store.reserve(node_type):
+            logger.debug('drop %s, over budget' % record.url)
+            return
+        super()._process_record(record, predecessor, weight, depth)
+
+    def run(self):
+        try:
+            super().run()
+        finally:
+            self.shared_frontier.finish()
+
+    def save(self, out_file: str) -> None:
+        """
+        Save the partial graph along with its links to other shards
+        """
+        partial = json.loads(self.graph.serialize())
+        partial['links'] = self.links
+        with open(out_file, 'w') as f:
+            json.dump(partial, f)
+
+
+def _copy_node(node: NodeBase) -> NodeBase:
+    data = node.to_dict()
+    del data['class_name'], data['module_name']
+    copy = type(node)()
+    copy.from_dict(data)
+    return copy
+
+
+def merge_shards(paths: Iterable[str], actor_limit: int = -1,
+                 movie_limit: int = -1) -> Graph:
+    """
+    Combine the partial graphs of a sharded crawl
+    Args:
+        paths: Files saved by the shard workers
+        actor_limit: Global actor limit
+        movie_limit: Global movie limit
+
+    Returns:
+        The graph with node ids reassigned and edges matched by url. A
+        page crawled by several workers is kept once, and nodes beyond
+        the limits are left out along with their edges.
+    """
+    limits = {EntityType.ACTOR: actor_limit, EntityType.MOVIE: movie_limit}
+    graph = Graph()
+    links: List[Link] = []
+    for path in paths:
+        partial = Graph()
+        with open(path, 'r') as f:
+            partial_dict = json.load(f)
+        if not partial.deserialize(json.dumps(partial_dict)):
+            raise ValueError('Invalid partial graph %s' % path)
+        for node in partial.nodes:
+            limit = limits.get(node.type, -1)
+            if 0 < limit < graph.num_node(node.type):
+                continue
+            graph.add_node(_copy_node(node))
+        links.extend((edge.ends[0].url, edge.ends[1].url, edge.weight)
+                     for edge in partial.edges)
+        links.extend(partial_dict.get('links', []))
+    for movie_url, actor_url, weight in links:
+        movie = graph.get_node(movie_url)
+        actor = graph.get_node(actor_url)
+        if movie is not None and actor is not None:
+            edge = graph.add_relationship(movie.node_id, actor.node_id)
+            if edge:
+                edge.weight = weight
+    return graph
+
+
+def _store_path(directory: str) -> str:
+    return os.path.join(directory, 'frontier.sqlite')
+
+
+def shard_path(directory: str, shard: int) -> str:
+    return os.path.join(directory, 'shard-%d.json' % shard)
+
+
+def run_shard_worker(init_url: Url, directory: str, shard: int,
+                     num_shards: int, actor_limit: int = -1,
+                     movie_limit: int = -1,
+                     fetcher_factory: Callable[[], Fetcher] = UrllibFetcher,
+                     cache_factory: Optional[Callable[[], PageCache]] = None,
+                     record_cache_factory: Optional[
+                         Callable[[], RecordCache]] = None,
+                     **kwargs: Any) -> str:
+    """
+    Crawl one shard and save its partial graph
+    Args:
+        init_url: Has to be a url to a movie.
+        directory: Directory shared by the workers
+        shard: The shard to crawl
+        num_shards: Number of workers
+        actor_limit: Global actor limit
+        movie_limit: Global movie limit
+        fetcher_factory: Creates the fetcher of the worker
+        cache_factory: Creates the page cache of the worker, if any
+        record_cache_factory: Creates the record cache of the worker, if
+            any
+        **kwargs: Passed on to SpiderRunner
+
+    Returns:
+        The path of the partial graph
+    """
+    store = ShardStore(_store_path(directory), num_shards, actor_limit,
+                       movie_limit)
+    worker = ShardWorker(
+        init_url, store, shard, actor_limit=actor_limit,
+        movie_limit=movie_limit, fetcher=fetcher_factory(),
+        cache=cache_factory() if cache_factory else None,
+        record_cache=record_cache_factory() if record_cache_factory else None,
+        **kwargs)
+    try:
+        worker.run()
+        path = shard_path(directory, shard)
+        worker.save(path)
+    finally:
+        worker.fetcher.close()
+        if worker.record_cache is not None:
+            worker.record_cache.close()
+        store.close()
+    return path
+
+
+def run_sharded(init_url: Url, directory: str, num_workers: int,
+                actor_limit: int = -1, movie_limit: int = -1,
+                **kwargs: Any) -> Graph:
+    """
+    Crawl with several worker processes and merge their graphs
+    Args:
+        init_url: Has to be a url to a movie.
+        directory: Where the shared frontier and partial graphs are kept
+        num_workers: Number of worker processes
+        actor_limit: Global actor limit
+        movie_limit: Global movie limit
+        **kwargs: Passed on to run_shard_worker, they have to be picklable
+
+    Returns:
+        The merged graph
+    """
+    os.makedirs(directory, exist_ok=True)
+    # Start from a fresh frontier
+    for suffix in ('', '-wal', '-shm'):
+        if os.path.exists(_store_path(directory) + suffix):
+            os.remove(_store_path(directory) + suffix)
+    ShardStore(_store_path(directory), num_workers, actor_limit,
+               movie_limit).close()
+    options: Dict[str, Any] = dict(kwargs, actor_limit=actor_limit,
+                                   movie_limit=movie_limit)
+    processes = [multiprocessing.Process(
+        target=run_shard_worker,
+        args=(init_url, directory, shard, num_workers), kwargs=options)
+        for shard in range(num_workers)]
+    for process in processes:
+        process.start()
+    try:
+        while any(process.is_alive() for process in processes):
+            for process in processes:
+                process.join(0.1)
+                if process.exitcode:
+                    raise RuntimeError('Shard worker exited with %d'
+                                       % process.exitcode)
+    finally:
+        for process in processes:
+            if process.is_alive():
+                process.terminate()
+    for process in processes:
+        if process.exitcode:
+            raise RuntimeError('Shard worker exited with %d'
+                               % process.exitcode)
+    return merge_shards([shard_path(directory, shard)
+                         for shard in range(num_workers)],
+                        actor_limit, movie_limit)
@@ -1,123 +1,411 @@
 import logging
 import os
-from queue import LifoQueue, Queue
-from typing import Dict, Type, cast
-from urllib import parse, request
+from queue import LifoQueue
+from typing import Callable, Dict, Optional, Tuple, cast
+from urllib import parse
 
-from bs4 import BeautifulSoup
-from bs4.element import Tag
 from tqdm import tqdm
 
-from scraper.graph.base_objects import EntityType, Url
+from scraper.graph.actor import Actor
+from scraper.graph.base_objects import EntityType, NodeBase, Url
 from scraper.graph.graph import Graph
 from scraper.graph.movie import Movie
-from scraper.spider.actor_parser import ActorParser
-from scraper.spider.movie_parser import MovieParser
-from scraper.spider.utils import PageType, parse_page_type_get_infobox
+from scraper.graph.mutation_log import compact
+from scraper.spider.archive import ArchiveWriter, RecordingFetcher
+from scraper.spider.checkpoint import Checkpointer
+from scraper.spider.dedup import SeenSet, UrlCanonicalizer
+from scraper.spider.extract import PageRecord, extract_page
+from scraper.spider.fetcher import (FetchError, FetchResult, Fetcher,
+                                    UrllibFetcher)
+from scraper.spider.frontier import (Frontier, QueueEntry, QueueType,
+                                     make_frontier)
+from scraper.spider.metrics import CrawlMetrics
+from scraper.spider.page_cache import CachingFetcher, PageCache
+from scraper.spider.rate_control import RateController, ThrottledFetcher
+from scraper.spider.record_cache import (RecordCache, parser_version,
+                                         record_key)
+from scraper.spider.utils import PageType
 
 logger = logging.getLogger('Web-Scraper')
 
+PROGRESS_BAR_FORMAT = (
+    '{l_bar}{bar}[{elapsed}<{remaining}, {rate_fmt}{postfix} ]')
+
 
 class SpiderRunner:
     _URL_PREFIX = 'https://en.wikipedia.org'
 
     def __init__(self, init_url: Url, actor_limit: int = -1,
-                 movie_limit: int = -1, queue: Type[Queue] = LifoQueue) -> None:
+                 movie_limit: int = -1, queue: QueueType = LifoQueue,
+                 frontier: Optional[Frontier] = None,
+                 fetcher: Optional[Fetcher] = None,
+                 base_url: str = _URL_PREFIX,
+                 cache: Optional[PageCache] = None,
+                 archive: Optional[ArchiveWriter] = None,
+                 extractor: Callable[[Url, bytes], PageRecord] = extract_page,
+                 checkpointer: Optional[Checkpointer] = None,
+                 seen: Optional[SeenSet] = None,
+                 rate_controller: Optional[RateController] = None,
+                 max_requeues: int = 3,
+                 metrics: Optional[CrawlMetrics] = None,
+                 record_cache: Optional[RecordCache] = None,
+                 graph: Optional[Graph] = None) -> None:
         """
         Create a spider runner.
         Args:
             init_url: Has to be a url to a movie.
+            queue: Class of the frontier, a Frontier or a queue.Queue. The
+                default crawls depth first
+            frontier: Orders the urls to crawl, instead of a new frontier
+                of the queue class
+            fetcher: How pages are downloaded. Defaults to plain urlopen
+            base_url: The site relative urls are resolved against
+            cache: Page cache consulted before the fetcher
+            archive: Records every page crawled, cache hits included
+            extractor: Turns a raw page into a PageRecord. Has to be a
+                module level function to be usable by parser processes
+            checkpointer: Periodically saves the crawl state
+            seen: Set of canonical urls already crawled. Defaults to an
+                exact set
+            rate_controller: Paces requests and retries transient errors
+            max_requeues: Times a url that failed is queued again before
+                it is given up
+            metrics: Where the counters and timings of the crawl go
+            record_cache: Records of pages already extracted, consulted
+                before the extractor
+            graph: Where the crawled pages go. Defaults to an empty Graph
         """
         self.init_url = init_url
-        self.graph = Graph()
-        # Contains tuple of (url, predecessor, weight)
-        self.queue = queue()
-        self.queue.put((init_url, None, 0))
+        self.fetcher = fetcher if fetcher is not None else UrllibFetcher()
+        if rate_controller is not None:
+            self.fetcher = ThrottledFetcher(self.fetcher, rate_controller)
+        if cache is not None:
+            self.fetcher = CachingFetcher(self.fetcher, cache)
+        if archive is not None:
+            self.fetcher = RecordingFetcher(self.fetcher, archive)
+        self.base_url = base_url
+        self.extractor = extractor
+        self.record_cache = record_cache
+        self._parser_version = (parser_version(extractor)
+                                if record_cache is not None else '')
+        self.canonicalizer = UrlCanonicalizer(base_url)
+        self.metrics = metrics if metrics is not None else CrawlMetrics()
+        self.graph = graph if graph is not None else Graph()
+        # Canonical urls whose page has been merged
+        self.seen = seen if seen is not None else SeenSet()
+        # Contains tuple of (url, predecessor, weight, depth)
+        self.frontier = (frontier if frontier is not None
+                         else make_frontier(queue))
+        self.frontier.bind(self._node_by_id)
         self.actor_limit = actor_limit
         self.movie_limit = movie_limit
+        self.checkpointer = checkpointer
+        self._enqueue(init_url, None, 0, 0)
+        self.pages_fetched = 0
+        self.max_requeues = max_requeues
+        # Number of failed fetches of each url
+        self.failures: Dict[Url, int] = {}
 
     @staticmethod
-    def get_full_url(url: Url) -> Url:
-        return cast(Url, parse.urljoin(SpiderRunner._URL_PREFIX, url))
+    def get_full_url(url: Url, base_url: str = _URL_PREFIX) -> Url:
+        return cast(Url, parse.urljoin(base_url, url))
+
+    def _fetch(self, url: Url) -> FetchResult:
+        """
+        Download a page
+        Args:
+            url: The (relative) url of the page
+
+        Returns:
+            The response
+        """
+        with self.metrics.fetch_seconds.time():
+            result = self.fetcher.fetch(self.get_full_url(url, self.base_url))
+        self.metrics.downloaded_bytes.inc(result.wire_bytes
+                                          or len(result.body))
+        return result
+
+    def _cached_record(self, url: Url, content: bytes
+                       ) -> Tuple[Optional[str], Optional[PageRecord]]:
+        """
+        Look up the record of a page in the record cache
+        Returns:
+            The cache key, None without a cache, and the record on a hit
+        """
+        if self.record_cache is None:
+            return None, None
+        key = record_key(self._parser_version, url, content)
+        record = self.record_cache.get(key)
+        self.metrics.record_cache.inc(result='miss' if record is None
+                                      else 'hit')
+        return key, record
+
+    def _cache_record(self, key: Optional[str], record: PageRecord) -> None:
+        if self.record_cache is not None and key is not None:
+            self.record_cache.put(key, self._parser_version, record)
+
+    def _extract(self, url: Url, content: bytes) -> PageRecord:
+        """
+        Extract a page, unless its record is cached
+        """
+        key, record = self._cached_record(url, content)
+        if record is None:
+            record = self.extractor(url, content)
+            self._cache_record(key, record)
+        return record
+
+    def _node_by_id(self, node_id: int) -> Optional[NodeBase]:
+        return self.graph.get_node_by_id(node_id)
+
+    def _enqueue(self, url: Url, predecessor: Optional[Movie],
+                 weight: float, depth: int) -> None:
+        """
+        Queue a link unless its page has already been crawled
+        """
+        url = self.canonicalizer.canonicalize(url)
+        if url in self.seen:
+            logger.debug('skip %s' % url)
+            self.metrics.skipped.inc(reason='seen')
+            return
+        if not self._put((url, predecessor, weight, depth)):
+            logger.debug('skip %s, over budget' % url)
+            self.metrics.skipped.inc(reason='over_budget')
+
+    def _put(self, entry: QueueEntry, retry: bool = False) -> bool:
+        """
+        Queue an entry in the frontier, and in the checkpoint if there is one
+        Args:
+            entry: The entry to queue
+            retry: Whether the fetch of the entry failed, so that it is
+                queued behind its peers
+
+        Returns:
+            False if the frontier refused it
+        """
+        queued = (self.frontier.requeue(entry) if retry
+                  else self.frontier.put(entry))
+        if not queued:
+            return False
+        if self.checkpointer:
+            self.checkpointer.record_put(entry)
+        return True
+
+    def _entry_done(self, entry: QueueEntry) -> None:
+        """
+        Forget an entry taken out of the frontier, once its page is merged,
+        skipped or queued again
+        """
+        if self.checkpointer:
+            self.checkpointer.record_done(entry)
+
+    def _fetch_failed(self, entry: QueueEntry, error: FetchError) -> None:
+        """
+        Queue a url again after a transient error, or give up on it
+        """
+        url = entry[0]
+        failures = self.failures.get(url, 0) + 1
+        self.failures[url] = failures
+        reason = 'network' if error.status is None else str(error.status)
+        if error.retryable and failures <= self.max_requeues:
+            logger.warning('Failed %s, queued again: %s' % (url, error))
+            self.metrics.failed.inc(reason=reason, action='requeued')
+            self._put(entry, retry=True)
+        else:
+            logger.error('Giving up on %s: %s' % (url, error))
+            self.metrics.failed.inc(reason=reason, action='gave_up')
 
-    def _process_movie(self, url: Url, html: Tag,
-                       infobox: Dict[str, Tag]) -> None:
-        parser = MovieParser(url)
-        movie = parser.parse_movie_object(infobox)
+    def _resolve(self, url: Url, result: FetchResult) -> Optional[Url]:
+        """
+        Learn the redirect taken by a fetch
+        Args:
+            url: The requested canonical url
+            result: The response
+
+        Returns:
+            The canonical url of the page, None if it was already crawled
+            under that url
+        """
+        final_url = self.canonicalizer.learn_redirect(url, result.url)
+        if final_url != url and final_url in self.seen:
+            logger.debug('skip %s, redirects to %s' % (url, final_url))
+            self.metrics.skipped.inc(reason='redirect_seen')
+            self._mark_seen(url)
+            return None
+        return final_url
+
+    def _process_movie(self, record: PageRecord, depth: int) -> None:
+        movie = cast(Movie, record.to_node())
         if self.graph.add_node(movie):
-            stars = parser.parse_staring(infobox)
-            casts = parser.parse_cast(html)
-            total_actors = stars
-            actors_added = set(total_actors)
+            total_actors = record.related
             # Distribute weight according to the order
-            for actor in casts:
-                if actor not in actors_added:
-                    total_actors.append(actor)
-                    actors_added.add(actor)
             total_weight_units = (1 + len(total_actors)) * len(total_actors) / 2
             for i, actor in enumerate(reversed(total_actors)):
-                self.queue.put((actor, movie, (i + 1) / total_weight_units))
+                self._enqueue(actor, movie, (i + 1) / total_weight_units,
+                              depth + 1)
 
-    def _process_actor(self, url: Url, html: Tag, infobox: Dict[str, Tag],
-                       predecessor: Movie, weight: float) -> None:
-        parser = ActorParser(url)
-        actor = parser.parse_actor_object(infobox)
+    def _process_actor(self, record: PageRecord, predecessor: Movie,
+                       weight: float, depth: int) -> None:
+        actor = cast(Actor, record.to_node())
         if self.graph.add_node(actor):
             if predecessor:
-                edge = self.graph.add_relationship(
-                    predecessor.node_id, actor.node_id)
-                if edge:
-                    edge.weight = weight
-            movies = parser.parse_related_movies(html)
-            for movie in movies:
-                self.queue.put((movie, None, 0))
+                self._link(predecessor, actor, weight)
+            for movie in record.related:
+                self._enqueue(movie, None, 0, depth + 1)
+
+    def _link(self, movie: Movie, actor: Actor, weight: float) -> None:
+        """
+        Connect an actor to the movie whose cast linked to it
+        """
+        edge = self.graph.add_relationship(movie.node_id, actor.node_id)
+        if edge:
+            edge.weight = weight
+
+    def _process_record(self, record: PageRecord,
+                        predecessor: Optional[Movie], weight: float,
+                        depth: int) -> None:
+        """
+        Merge an extracted page into the graph
+        Args:
+            record: The extracted page
+            predecessor: The movie that linked to this page, if any
+            weight: The weight of the edge from the predecessor
+            depth: Number of links between the start url and the page
+        """
+        if record.page_type == PageType.ACTOR:
+            self._process_actor(record, cast(Movie, predecessor), weight,
+                                depth)
+        elif record.page_type == PageType.MOVIE:
+            self._process_movie(record, depth)
+
+    def _merge(self, record: PageRecord, predecessor: Optional[Movie],
+               weight: float, depth: int) -> None:
+        """
+        Process an extracted page, timing each stage, and apply the budget
+        """
+        metrics = self.metrics
+        if 'html' in record.timings:
+            metrics.html_parse_seconds.observe(record.timings['html'])
+            metrics.infobox_parse_seconds.observe(record.timings['infobox'])
+        with metrics.graph_insert_seconds.time():
+            self._process_record(record, predecessor, weight, depth)
+            if self.graph.log is not None:
+                self.graph.log.flush()
+        metrics.pages.inc(type=record.page_type.name.lower())
+        self._apply_budget()
+
+    def _mark_seen(self, url: Url) -> None:
+        self.seen.add(url)
+        if self.checkpointer:
+            self.checkpointer.record_seen(url)
+
+    def _count(self, node_type: EntityType) -> int:
+        """
+        Number of nodes of a type crawled so far, checked against the limits
+        """
+        return self.graph.num_node(node_type)
+
+    def _apply_budget(self) -> None:
+        """
+        Stop crawling the types of pages whose limit has been exceeded
+        """
+        limits = ((PageType.ACTOR, EntityType.ACTOR, self.actor_limit),
+                  (PageType.MOVIE, EntityType.MOVIE, self.movie_limit))
+        for page_type, entity_type, limit in limits:
+            if (0 < limit < self._count(entity_type)
+                    and page_type not in self.frontier.closed):
+                self.frontier.close(page_type)
+                if self.checkpointer:
+                    self.checkpointer.record_closed(page_type)
+
+    def _limits_reached(self) -> bool:
+        """
+        Whether both the actor and the movie limit have been exceeded
+        """
+        num_actors = self._count(EntityType.ACTOR)
+        num_movies = self._count(EntityType.MOVIE)
+        return (0 < self.actor_limit < num_actors
+                and 0 < self.movie_limit < num_movies)
+
+    def _update_progress(self, progress_bar: tqdm,
+                         previous_percent: float) -> float:
+        """
+        Refresh the progress bar from the current graph size
+        Args:
+            progress_bar: The bar to update
+            previous_percent: The percentage shown before this update
+
+        Returns:
+            The percentage shown after this update
+        """
+        num_actors = self._count(EntityType.ACTOR)
+        num_movies = self._count(EntityType.MOVIE)
+        progress = '\033[92mactor: %d, movie: %d\033[0m' % (
+            num_actors, num_movies)
+        percentage = ((min(num_actors, self.actor_limit) / self.actor_limit
+                       + min(num_movies, self.movie_limit) / self.movie_limit)
+                      / 2)
+        progress_bar.update((percentage - previous_percent) * 100)
+        progress_bar.set_postfix_str(progress)
+        return percentage
 
     def run(self):
         try:
-            fmt = '{l_bar}{bar}[{elapsed}<{remaining}, {rate_fmt}{postfix} ]'
+            fmt = PROGRESS_BAR_FORMAT
             with tqdm(total=100, bar_format=fmt) as progress_bar:
-                previous_percent = 0
-                while not self.queue.empty():
-                    url, predecessor, weight = self.queue.get()
+                previous_percent = 0.0
+                # Limits may have been reached by a restored checkpoint
+                self._apply_budget()
+                while not self.frontier.empty():
+                    try:
+                        entry = self.frontier.get()
+                    except IndexError:
+                        # A shared frontier emptied by another process
+                        break
+                    self.metrics.queue_depth.set(len(self.frontier))
+                    url, predecessor, weight, depth = entry
+                    # Redirects learnt since the url was queued
+                    url = self.canonicalizer.canonicalize(url)
+                    if url in self.seen:
+                        logger.debug('skip %s' % url)
+                        self.metrics.skipped.inc(reason='seen')
+                        self._entry_done(entry)
+                        continue
                     logger.info(url)
                     logger.debug('%s %s %s' % (url, predecessor, weight))
-                    if self.graph.check_node_exist(url):
-                        logger.debug('skip %s' % url)
 
-                    actor_parser = ActorParser(url)
-                    full_url = self.get_full_url(url)
-                    soup = BeautifulSoup(request.urlopen(full_url),
-                                         features="lxml")
-                    page_type, infobox = parse_page_type_get_infobox(soup.html)
-                    if page_type == PageType.ACTOR:
-                        self._process_actor(url, soup.html, infobox,
-                                            predecessor,
-                                            weight)
-                    elif page_type == PageType.MOVIE:
-                        self._process_movie(url, soup.html, infobox)
-                    num_actors = self.graph.num_node(EntityType.ACTOR)
-                    num_movies = self.graph.num_node(EntityType.MOVIE)
-                    progress = '\033[92mactor: %d, movie: %d\033[0m' % (
-                        self.graph.num_node(EntityType.ACTOR),
-                        self.graph.num_node(EntityType.MOVIE))
-                    percentage = ((min(num_actors,
-                                       self.actor_limit) / self.actor_limit
-                                   + min(num_movies,
-                                         self.movie_limit) /
-                                   self.movie_limit) / 2)
-                    progress_bar.update((percentage - previous_percent) * 100)
-                    previous_percent = percentage
-                    progress_bar.set_postfix_str(progress)
-                    if (0 < self.actor_limit < num_actors
-                            and 0 < self.movie_limit < num_movies):
+                    try:
+                        result = self._fetch(url)
+                    except FetchError as e:
+                        self._fetch_failed((url, predecessor, weight, depth),
+                                           e)
+                        self._entry_done(entry)
+                        continue
+                    self.pages_fetched += 1
+                    final_url = self._resolve(url, result)
+                    if final_url is not None:
+                        record = self._extract(final_url, result.body)
+                        self._mark_seen(url)
+                        if final_url != url:
+                            self._mark_seen(final_url)
+                        self._merge(record, predecessor, weight, depth)
+                    self._entry_done(entry)
+                    previous_percent = self._update_progress(
+                        progress_bar, previous_percent)
+                    if self.checkpointer:
+                        self.checkpointer.tick(self)
+                    if self._limits_reached():
                         break
         except KeyboardInterrupt:
             logger.info('Terminated due to keyboard interrupt')
+        if self.checkpointer:
+            self.checkpointer.save(self)
+        logger.info(self.fetcher.stats.summary())
 
     def save(self, out_file: str) -> None:
-        json_str = self.graph.serialize()
+        """
+        Save the graph, emptying its mutation log if it has one
+        """
         out_dir = os.path.dirname(out_file)
         if os.path.isdir(out_dir) and not os.path.exists(out_dir):
             os.mkdir(out_dir)
-        with open(out_file, 'w') as f:
-            f.write(json_str)
+        compact(self.graph, out_file)
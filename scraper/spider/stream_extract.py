@@ -0,0 +1,270 @@
+import logging
+import time
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Type, cast
+
+from bs4.builder import TreeBuilder, builder_registry
+from bs4.element import NavigableString, Tag
+from lxml import etree
+
+from scraper.graph.base_objects import Url
+from scraper.spider.actor_parser import ActorParser
+from scraper.spider.extract import (PageRecord, actor_record, extract_page,
+                                    movie_record)
+from scraper.spider.movie_parser import MovieParser
+from scraper.spider.utils import PageType, parse_infobox, parse_page_type
+
+logger = logging.getLogger('Web-Scraper')
+
+_INFOBOX = 'infobox'
+_CAST_LIST = 'cast_list'
+_FILM_TABLE = 'film_table'
+
+# Gives the captured tags the attributes html.parser would, such as class
+# as a list. Looked up by feature as BeautifulSoup does
+_BUILDER = cast(Type[TreeBuilder], builder_registry.lookup('html.parser'))()
+
+
+@dataclass
+class PageRegions:
+    """
+    The only parts of a page the parsers look at
+    """
+    infobox: Optional[Tag] = None
+    infobox_count: int = 0
+    cast_list: Optional[Tag] = None
+    cast_section_count: int = 0
+    film_table: Optional[Tag] = None
+    filmography_count: int = 0
+
+
+class _Capture:
+    """
+    Builds the bs4 subtree of one element while the parser streams past it,
+    so the parsers get the Tag they expect without parsing it again
+    """
+
+    def __init__(self, key: str, depth: int) -> None:
+        self.key = key
+        self.depth = depth
+        self.root: Optional[Tag] = None
+        self.open: List[Tag] = []
+        # Text is handed over in pieces, a string is made of all of them
+        self.text: List[str] = []
+
+    def _flush(self) -> None:
+        if self.text:
+            self.open[-1].append(NavigableString(''.join(self.text)))
+            self.text = []
+
+    def start(self, tag: str, attrib: Dict[str, str]) -> None:
+        self._flush()
+        element = Tag(builder=_BUILDER, name=tag, attrs=dict(attrib))
+        if self.open:
+            self.open[-1].append(element)
+        else:
+            self.root = element
+        self.open.append(element)
+
+    def end(self) -> None:
+        self._flush()
+        self.open.pop()
+
+    def data(self, data: str) -> None:
+        self.text.append(data)
+
+
+class _RegionTarget:
+    """
+    lxml parser target that follows the document in a single forward pass.
+
+    It mirrors the searches of parse_page_type_get_infobox,
+    MovieParser.parse_cast and ActorParser.parse_related_movies, and only
+    builds elements for the infobox table, the list after the Cast headline
+    and the table after the Film headline of the Filmography section.
+    """
+
+    def __init__(self) -> None:
+        self.depth = 0
+        self.captures: List[_Capture] = []
+        self.found: Dict[str, Tag] = {}
+        self.infobox_count = 0
+        self.cast_section_count = 0
+        self.filmography_count = 0
+        # Cast headline state: depth of the open h2, whether it holds the
+        # Cast span, and the depth of the siblings to search for the list
+        self.h2_depth = -1
+        self.h2_has_cast = False
+        self.cast_sibling_depth = -1
+        self.cast_div_depth = -1
+        # Filmography state, same idea with the Film h3 and its table
+        self.filmography_parent_depth = -1
+        self.film_sibling_depth = -1
+        self.h3_depth = -1
+        self.film_spans = 0
+        self.film_span_depth = -1
+        self.film_span_text: List[str] = []
+        self.table_sibling_depth = -1
+
+    def _capture(self, key: str) -> None:
+        if key not in self.found and all(c.key != key for c in self.captures):
+            self.captures.append(_Capture(key, self.depth))
+
+    def start(self, tag: str, attrib: Dict[str, str]) -> None:
+        depth = self.depth
+        if tag == 'table' and _INFOBOX in attrib.get('class', '').split():
+            self.infobox_count += 1
+            self._capture(_INFOBOX)
+        elif tag == 'h2' and self.h2_depth < 0:
+            self.h2_depth = depth
+            self.h2_has_cast = False
+        elif tag == 'span':
+            span_id = attrib.get('id')
+            if span_id == 'Cast' and self.h2_depth >= 0:
+                self.h2_has_cast = True
+            elif span_id == 'Filmography':
+                self.filmography_count += 1
+                if self.filmography_count == 1:
+                    # Siblings of the headline holding the span
+                    self.filmography_parent_depth = depth - 1
+            elif span_id == 'Film' and self.h3_depth >= 0:
+                self.film_spans += 1
+                self.film_span_depth = depth
+                self.film_span_text = []
+
+        if depth == self.cast_sibling_depth:
+            if tag == 'ul':
+                self.cast_sibling_depth = -1
+                self._capture(_CAST_LIST)
+            elif tag == 'div':
+                self.cast_div_depth = depth
+        elif self.cast_div_depth >= 0 and tag == 'ul':
+            self.cast_div_depth = -1
+            self.cast_sibling_depth = -1
+            self._capture(_CAST_LIST)
+
+        if depth == self.film_sibling_depth and tag == 'h3':
+            self.h3_depth = depth
+            self.film_spans = 0
+        if depth == self.table_sibling_depth and tag == 'table':
+            self.table_sibling_depth = -1
+            self._capture(_FILM_TABLE)
+
+        for capture in self.captures:
+            capture.start(tag, attrib)
+        self.depth += 1
+
+    def end(self, tag: str) -> None:
+        self.depth -= 1
+        depth = self.depth
+        for capture in list(self.captures):
+            capture.end()
+            if capture.depth == depth and capture.root is not None:
+                self.captures.remove(capture)
+                self.found[capture.key] = capture.root
+
+        if depth == self.h2_depth:
+            self.h2_depth = -1
+            if self.h2_has_cast:
+                self.cast_section_count += 1
+                if self.cast_section_count == 1:
+                    self.cast_sibling_depth = depth
+        elif depth == self.cast_div_depth:
+            self.cast_div_depth = -1
+        elif depth < self.cast_sibling_depth:
+            # Ran out of siblings
+            self.cast_sibling_depth = -1
+
+        if depth == self.film_span_depth:
+            self.film_span_depth = -1
+        if depth == self.filmography_parent_depth:
+            self.filmography_parent_depth = -1
+            self.film_sibling_depth = depth
+        elif depth == self.h3_depth:
+            self.h3_depth = -1
+            text = ''.join(self.film_span_text).lower()
+            if self.film_spans == 1 and 'film' in text:
+                self.film_sibling_depth = -1
+                self.table_sibling_depth = depth
+        elif depth < self.film_sibling_depth:
+            self.film_sibling_depth = -1
+        elif depth < self.table_sibling_depth:
+            self.table_sibling_depth = -1
+
+    def data(self, data: str) -> None:
+        if self.film_span_depth >= 0:
+            self.film_span_text.append(data)
+        for capture in self.captures:
+            capture.data(data)
+
+    def close(self) -> 'PageRegions':
+        regions = PageRegions(infobox_count=self.infobox_count,
+                              cast_section_count=self.cast_section_count,
+                              filmography_count=self.filmography_count)
+        regions.infobox = self.found.get(_INFOBOX)
+        regions.cast_list = self.found.get(_CAST_LIST)
+        regions.film_table = self.found.get(_FILM_TABLE)
+        return regions
+
+
+def extract_regions(content: bytes) -> PageRegions:
+    """
+    Pull the infobox, cast list and film table out of a page in one pass
+    Args:
+        content: The raw html
+
+    Returns:
+        The regions found
+    """
+    target = _RegionTarget()
+    parser = etree.HTMLParser(target=target)
+    parser.feed(content.decode('utf-8', errors='replace'))
+    return cast(PageRegions, parser.close())
+
+
+def stream_extract_page(url: Url, content: bytes) -> PageRecord:
+    """
+    Same result as extract_page without building the whole document
+    Args:
+        url: The url of the page
+        content: The raw html
+
+    Returns:
+        The extracted record
+    """
+    start = time.perf_counter()
+    regions = extract_regions(content)
+    parsed = time.perf_counter()
+    record = _extract_regions(url, regions)
+    record.timings = {'html': parsed - start,
+                      'infobox': time.perf_counter() - parsed}
+    return record
+
+
+def _extract_regions(url: Url, regions: PageRegions) -> PageRecord:
+    if regions.infobox_count != 1 or regions.infobox is None:
+        return PageRecord(url=url, page_type=PageType.OTHER)
+    infobox = parse_infobox(regions.infobox)
+    page_type = parse_page_type(infobox)
+    if page_type == PageType.MOVIE:
+        movie_parser = MovieParser(url)
+        if regions.cast_section_count == 1:
+            casts = movie_parser.parse_cast_list(regions.cast_list)
+        else:
+            logger.log(logging.WARN, '%d cast section found for %s' % (
+                regions.cast_section_count, url))
+            casts = []
+        return movie_record(movie_parser, infobox, casts)
+    if page_type == PageType.ACTOR:
+        actor_parser = ActorParser(url)
+        if regions.filmography_count == 1:
+            movies = actor_parser.parse_filmography_table(regions.film_table)
+        else:
+            logger.log(logging.WARN,
+                       'Filmography section not found for actor %s' % url)
+            movies = []
+        return actor_record(actor_parser, infobox, movies)
+    return PageRecord(url=url, page_type=PageType.OTHER)
+
+
+EXTRACTORS = {'soup': extract_page, 'stream': stream_extract_page}
@@ -62,6 +62,29 @@ def parse_infobox(infobox: Tag) -> Dict[str, Tag]:
     return entry_dict
 
 
+def parse_page_type(infobox_dict: Dict[str, Tag]) -> PageType:
+    """
+    Find the type of page from its parsed infobox
+    Args:
+        infobox_dict: The infobox dictionary
+
+    Returns:
+        The type of the page
+    """
+    # Check if movie
+    image_caption = infobox_dict.get('_image_caption', '')
+    if 'theatrical release poster' in image_caption.lower():
+        return PageType.MOVIE
+
+    # Check if actor
+    if 'Occupation' in infobox_dict:
+        occupation = infobox_dict['Occupation']
+        if occupation(text=re.compile('(Actor|actor|Actress|actress)')):
+            return PageType.ACTOR
+
+    return PageType.OTHER
+
+
 def parse_page_type_get_infobox(
         html: Tag) -> Tuple[PageType, Optional[Dict[str, Tag]]]:
     """
@@ -75,15 +98,8 @@ def parse_page_type_get_infobox(
     infoboxes = html.find_all('table', class_='infobox')
     if len(infoboxes) == 1:
         infobox_dict = parse_infobox(infoboxes[0])
-        # Check if movie
-        image_caption = infobox_dict.get('_image_caption', '')
-        if 'theatrical release poster' in image_caption.lower():
-            return PageType.MOVIE, infobox_dict
-
-        # Check if actor
-        if 'Occupation' in infobox_dict:
-            occupation = infobox_dict['Occupation']
-            if occupation(text=re.compile('(Actor|actor|Actress|actress)')):
-                return PageType.ACTOR, infobox_dict
+        page_type = parse_page_type(infobox_dict)
+        if page_type != PageType.OTHER:
+            return page_type, infobox_dict
 
     return PageType.OTHER, None
@@ -0,0 +1,74 @@
+import pytest
+
+from scraper.graph.analytics import GraphAnalytics
+from scraper.graph.compact import CompactGraph
+from scraper.graph.entity_type import EntityType
+from scraper.graph.graph import Graph
+from scraper.graph.shell import ShellRunner
+from scraper.graph.snapshot import SnapshotGraph
+from scraper.graph.stream import save_graph
+from test.conftest import make_elements
+
+
+@pytest.fixture(params=['objects', 'compact', 'snapshot'])
+def graph(request, tmp_path):
+    if request.param == 'objects':
+        yield make_elements(Graph)[0]
+    elif request.param == 'compact':
+        yield make_elements(CompactGraph)[0]
+    else:
+        path = str(tmp_path / 'out.snap')
+        save_graph(make_elements(Graph)[0], path)
+        yield SnapshotGraph(path)
+
+
+def test_actor_grossing(graph):
+    analytics = GraphAnalytics(graph)
+    grossing = analytics.actor_grossing()
+    for node in graph.nodes:
+        if node.type == EntityType.ACTOR:
+            assert pytest.approx(node.grossing) == grossing[node.node_id]
+        else:
+            assert 0 == grossing[node.node_id]
+    assert [(1, pytest.approx(130)), (0, pytest.approx(10))] == (
+        analytics.top_actors(5))
+
+
+def test_year_totals(graph):
+    assert [(2018, 2, 600), (2019, 1, 100)] == (
+        GraphAnalytics(graph).year_totals())
+
+
+def test_degree_distribution(graph):
+    analytics = GraphAnalytics(graph)
+    assert [(1, 1), (2, 1)] == analytics.degree_distribution(
+        EntityType.ACTOR)
+    assert [(0, 1), (1, 1), (2, 1)] == analytics.degree_distribution(
+        EntityType.MOVIE)
+
+
+def test_to_scipy(graph):
+    pytest.importorskip('scipy')
+    analytics = GraphAnalytics(graph)
+    matrix = analytics.to_scipy()
+    assert (5, 5) == matrix.shape
+    assert pytest.approx(list(matrix @ analytics.grossing)) == list(
+        analytics.matvec(analytics.grossing))
+
+
+def test_compact_graph_grows():
+    graph = make_elements(CompactGraph)[0]
+    GraphAnalytics(graph)
+    assert graph.add_relationship(3, 0) is not None
+
+
+def test_shell_reports(capsys):
+    shell = ShellRunner(make_elements(Graph)[0])
+    shell.year_totals()
+    shell.degree_distribution('ACTOR')
+    shell.degree_distribution('Director')
+    assert ['2018: 2 movies, total grossing of 600.00',
+            '2019: 1 movies, total grossing of 100.00',
+            '1 with 1 edges', '1 with 2 edges',
+            'Invalid node type: Director'] == (
+        capsys.readouterr().out.splitlines())
@@ -0,0 +1,121 @@
+import gzip
+import os
+
+import pytest
+
+from scraper.spider.archive import (DirectoryWriter, RecordingFetcher,
+                                    WarcWriter, open_source,
+                                    parse_http_response, url_to_path)
+from scraper.spider.fetcher import FetchError, FetchResult
+from scraper.spider.page_cache import PageCache
+from scraper.spider.spider_runner import SpiderRunner
+from test.conftest import BASE_URL, PAGES, START_URL, FakeFetcher
+
+# The actor page is only served under the url it redirects to
+REDIRECT_PAGES = dict(PAGES, **{'/wiki/Jay_B': 'actor3.html'})
+del REDIRECT_PAGES['/wiki/Jay_Baruchel']
+
+REDIRECTS = {'/wiki/Jay_Baruchel': '/wiki/Jay_B'}
+
+
+def redirecting_fetcher():
+    return FakeFetcher(pages=REDIRECT_PAGES, redirects=REDIRECTS)
+
+
+def graph_summary(graph, redirects=None):
+    redirects = redirects or {}
+    return (sorted(redirects.get(node.url, node.url) for node in graph.nodes),
+            sorted((e.ends[0].url, redirects.get(e.ends[1].url,
+                                                 e.ends[1].url), e.weight)
+                   for e in graph.edges))
+
+
+@pytest.mark.parametrize('name, actor_url', [
+    ('pages.warc', '/wiki/Jay_B'),
+    ('pages.warc.gz', '/wiki/Jay_B'),
+    # A mirror does not know about redirects
+    ('mirror', '/wiki/Jay_Baruchel'),
+])
+def test_record_and_replay(tmp_path, name, actor_url):
+    path = str(tmp_path / name)
+    writer = (DirectoryWriter(path) if name == 'mirror'
+              else WarcWriter(path))
+    live = SpiderRunner(START_URL,
+                        fetcher=RecordingFetcher(redirecting_fetcher(), writer))
+    live.run()
+    live.fetcher.close()
+
+    source = open_source(path)
+    offline = SpiderRunner(START_URL, fetcher=source)
+    offline.run()
+    redirects = {actor_url: '/wiki/Jay_B'}
+    assert (graph_summary(live.graph)
+            == graph_summary(offline.graph, redirects))
+    assert live.pages_fetched == offline.pages_fetched
+    assert actor_url in [node.url for node in offline.graph.nodes]
+    source.close()
+
+
+def test_warc_gz_members(tmp_path):
+    path = str(tmp_path / 'pages.warc.gz')
+    writer = WarcWriter(path)
+    for i in range(3):
+        writer.write('%s/wiki/%d' % (BASE_URL, i),
+                     FetchResult(url='%s/wiki/%d' % (BASE_URL, i),
+                                 status=200, body=os.urandom(100000)))
+    writer.close()
+    with gzip.open(path, 'rb') as f:
+        assert 3 == f.read().count(b'WARC-Type: response')
+    source = open_source(path)
+    assert 3 == len(source)
+    assert 100000 == len(source.fetch(BASE_URL + '/wiki/2').body)
+    with pytest.raises(FetchError) as e:
+        source.fetch(BASE_URL + '/wiki/3')
+    assert 404 == e.value.status
+    source.close()
+
+
+def test_parse_http_response():
+    body = gzip.compress(b'<html>page</html>')
+    chunked = b'%x\r\n%s\r\n0\r\n\r\n' % (len(body), body)
+    status, headers, decoded = parse_http_response(
+        b'HTTP/1.1 200 OK\r\nContent-Encoding: gzip\r\n'
+        b'Transfer-Encoding: chunked\r\n\r\n' + chunked)
+    assert 200 == status
+    assert 'gzip' == headers['content-encoding']
+    assert b'<html>page</html>' == decoded
+
+
+def test_directory_outside_mirror(tmp_path):
+    source = open_source(str(tmp_path))
+    with pytest.raises(FetchError):
+        source.fetch(BASE_URL + '/wiki/../../../etc/passwd')
+
+
+def test_slash_in_title(tmp_path):
+    writer = DirectoryWriter(str(tmp_path))
+    for title in ('Face%2FOff', 'Face/Off'):
+        url = '%s/wiki/%s' % (BASE_URL, title)
+        writer.write(url, FetchResult(url=url, status=200,
+                                      body=title.encode('utf-8')))
+    assert url_to_path(str(tmp_path), BASE_URL + '/wiki/Face%2FOff').endswith(
+        os.path.join('wiki', 'Face%2FOff'))
+    source = open_source(str(tmp_path))
+    assert b'Face%2FOff' == source.fetch(BASE_URL + '/wiki/Face%2FOff').body
+    assert b'Face/Off' == source.fetch(BASE_URL + '/wiki/Face/Off').body
+    assert [] == [name for name in os.listdir(str(tmp_path / 'en.wikipedia.org'
+                                                  / 'wiki'))
+                  if name.endswith('.tmp')]
+
+
+def test_record_cache_hits(tmp_path):
+    cache = PageCache(str(tmp_path / 'cache'))
+    SpiderRunner(START_URL, fetcher=FakeFetcher(), cache=cache).run()
+    fetcher = FakeFetcher()
+    spider = SpiderRunner(START_URL, fetcher=fetcher, cache=cache,
+                          archive=WarcWriter(str(tmp_path / 'pages.warc')))
+    spider.run()
+    spider.fetcher.close()
+    assert [] == fetcher.fetched
+    assert spider.pages_fetched == len(open_source(
+        str(tmp_path / 'pages.warc')))
@@ -0,0 +1,32 @@
+import pytest
+
+from scraper.graph.entity_type import EntityType
+from scraper.spider.async_runner import AsyncSpiderRunner
+from scraper.spider.spider_runner import SpiderRunner
+from test.conftest import START_URL
+
+pytestmark = pytest.mark.usefixtures('fake_fetcher')
+
+
+@pytest.mark.parametrize('concurrency, parse_workers',
+                         [(1, 0), (4, 0), (16, 0), (4, 2)])
+def test_async_same_graph_shape(concurrency, parse_workers):
+    spider = SpiderRunner(START_URL)
+    spider.run()
+    async_spider = AsyncSpiderRunner(START_URL, concurrency=concurrency,
+                                     per_host=2, parse_workers=parse_workers)
+    async_spider.run()
+    for node_type in EntityType:
+        assert (spider.graph.num_node(node_type)
+                == async_spider.graph.num_node(node_type))
+    assert len(spider.graph.edges) == len(async_spider.graph.edges)
+    urls = sorted(node.url for node in spider.graph.nodes)
+    assert urls == sorted(node.url for node in async_spider.graph.nodes)
+
+
+def test_async_limits():
+    spider = AsyncSpiderRunner(START_URL, actor_limit=1, movie_limit=1,
+                               concurrency=8)
+    spider.run()
+    assert 2 == spider.graph.num_node(EntityType.ACTOR)
+    assert 2 <= spider.graph.num_node(EntityType.MOVIE)
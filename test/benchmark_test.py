@@ -0,0 +1,76 @@
+import json
+from urllib import request
+
+import pytest
+
+from benchmark.run import main, percentiles, run_benchmark
+from benchmark.server import WikiServer
+from benchmark.site import SyntheticSite
+from scraper.spider.extract import extract_page
+from scraper.spider.stream_extract import stream_extract_page
+from scraper.spider.utils import PageType
+
+
+@pytest.fixture
+def site():
+    return SyntheticSite(num_movies=10, num_actors=20, cast_size=4,
+                         page_size=5000)
+
+
+def test_percentiles():
+    values = [i / 1000 for i in range(1, 101)]
+    assert {'p50': 50, 'p95': 95, 'p99': 99} == percentiles(values)
+    assert {'p50': 0} == percentiles([], (50,))
+
+
+@pytest.mark.parametrize('extractor', [extract_page, stream_extract_page])
+def test_site_pages_parse(site, extractor):
+    movie = extractor(site.movie_url(3), site.page(site.movie_url(3)))
+    assert PageType.MOVIE == movie.page_type
+    assert [site.actor_url(i) for i in site.casts[3]] == movie.related
+    assert movie.attributes['year'] is not None
+    actor_url = movie.related[0]
+    actor = extractor(actor_url, site.page(actor_url))
+    assert PageType.ACTOR == actor.page_type
+    assert site.movie_url(3) in actor.related
+    assert site.page('/wiki/Synthetic_Film_10') is None
+    assert site.page(site.start_url) == SyntheticSite(
+        10, 20, 4, page_size=5000).page(site.start_url)
+
+
+def test_server_errors(site):
+    with WikiServer(site, error_rate=1.0) as server:
+        with pytest.raises(IOError) as e:
+            request.urlopen(server.base_url + site.start_url)
+        assert 503 == e.value.code
+    with WikiServer(site) as server:
+        with request.urlopen(server.base_url + site.start_url) as response:
+            assert site.page(site.start_url) == response.read()
+
+
+def test_run_benchmark(site):
+    report = run_benchmark(site, [0, 4], error_rate=0.05)
+    json.dumps(report)
+    assert [0, 4] == [run['concurrency'] for run in report['runs']]
+    for run in report['runs']:
+        assert 10 == run['movies']
+        assert run['pages_per_sec'] > 0
+        assert run['peak_rss_mb'] > 0
+        assert run['server_requests'] == run['requests']
+        assert set(run['parse_latency_ms']) == {'p50', 'p95', 'p99'}
+
+
+def test_failed_runs(site):
+    report = run_benchmark(site, [0], extractor='missing')
+    assert [{'concurrency': 0, 'error': 'exit code 1'}] == report['runs']
+    report = run_benchmark(site, [0], latency=0.5, timeout=0.1)
+    assert 'timed out' in report['runs'][0]['error']
+
+
+def test_main(site, tmp_path):
+    out = tmp_path / 'report.json'
+    main(['--movies', '5', '--actors', '10', '--cast-size', '3',
+          '--page-size', '2000', '--latency', '0', '--jitter', '0',
+          '-c', '2', '-o', str(out)])
+    report = json.loads(out.read_text())
+    assert 5 == report['runs'][0]['movies']
@@ -0,0 +1,134 @@
+import json
+
+import pytest
+
+from scraper.graph.actor import Actor
+from scraper.graph.compact import CompactGraph
+from scraper.graph.graph import Graph
+from scraper.graph.movie import Movie
+from scraper.spider.checkpoint import Checkpointer
+from scraper.spider.frontier import expected_page_type
+from scraper.spider.spider_runner import SpiderRunner
+from scraper.spider.utils import PageType
+from test.conftest import START_URL, FakeFetcher
+
+
+class Crash(Exception):
+    pass
+
+
+class CrashingFetcher(FakeFetcher):
+    def __init__(self, crash_after):
+        super().__init__()
+        self.crash_after = crash_after
+
+    def fetch(self, url, headers=None):
+        if len(self.fetched) >= self.crash_after:
+            raise Crash()
+        return super().fetch(url, headers)
+
+
+def graph_summary(graph):
+    urls = {node.node_id: node.url for node in graph.nodes}
+    return (sorted(urls.values()),
+            sorted((urls[e.ends[0].node_id], urls[e.ends[1].node_id],
+                    e.weight) for e in graph.edges))
+
+
+@pytest.mark.parametrize('graph_type', [Graph, CompactGraph])
+def test_resume_matches_full_crawl(tmp_path, graph_type):
+    full = SpiderRunner(START_URL, fetcher=FakeFetcher())
+    full.run()
+
+    spider = SpiderRunner(START_URL, fetcher=CrashingFetcher(20),
+                          graph=graph_type(),
+                          checkpointer=Checkpointer(str(tmp_path), 5))
+    with pytest.raises(Crash):
+        spider.run()
+
+    checkpointer = Checkpointer(str(tmp_path), 5)
+    resumed = SpiderRunner(START_URL, fetcher=FakeFetcher(),
+                           graph=graph_type(), checkpointer=checkpointer)
+    assert checkpointer.restore(resumed)
+    assert 20 == resumed.pages_fetched
+    assert 20 == len(resumed.seen)
+    resumed.run()
+    assert isinstance(resumed.graph, graph_type)
+    assert graph_summary(full.graph) == graph_summary(resumed.graph)
+    assert full.pages_fetched == resumed.pages_fetched
+
+
+def test_resume_keeps_pages_in_flight(tmp_path, runner):
+    full = runner(START_URL, fetcher=FakeFetcher())
+    full.run()
+
+    spider = runner(START_URL, fetcher=CrashingFetcher(12),
+                    checkpointer=Checkpointer(str(tmp_path), 1))
+    with pytest.raises(Crash):
+        spider.run()
+
+    checkpointer = Checkpointer(str(tmp_path), 1)
+    resumed = runner(START_URL, fetcher=FakeFetcher(),
+                     checkpointer=checkpointer)
+    assert checkpointer.restore(resumed)
+    resumed.run()
+    assert graph_summary(full.graph) == graph_summary(resumed.graph)
+
+
+def test_incomplete_checkpoint_ignored(tmp_path):
+    spider = SpiderRunner(START_URL, fetcher=CrashingFetcher(7),
+                          checkpointer=Checkpointer(str(tmp_path), 3))
+    with pytest.raises(Crash):
+        spider.run()
+    # A checkpoint that died before committing state.json
+    for log in ('nodes', 'edges', 'seen', 'frontier'):
+        with open(str(tmp_path / (log + '.jsonl')), 'a') as f:
+            f.write('{"half written')
+
+    resumed = SpiderRunner(START_URL)
+    assert Checkpointer(str(tmp_path)).restore(resumed)
+    assert 6 == resumed.pages_fetched
+    assert 6 == len(resumed.seen)
+
+
+def test_checkpoints_are_incremental(tmp_path):
+    spider = SpiderRunner(START_URL, fetcher=FakeFetcher(),
+                          checkpointer=Checkpointer(str(tmp_path), 1))
+    spider.run()
+    with open(str(tmp_path / 'nodes.jsonl')) as f:
+        assert len(spider.graph.nodes) == len(f.readlines())
+    with open(str(tmp_path / 'frontier.jsonl')) as f:
+        deltas = [json.loads(line) for line in f]
+    assert spider.pages_fetched + 1 == len(deltas)
+    # Each page only queues its links and is done with one entry
+    assert all(len(delta['put']) <= 40 for delta in deltas)
+    assert all(len(delta['done']) <= 2 for delta in deltas)
+
+
+def test_no_checkpoint(tmp_path):
+    assert not Checkpointer(str(tmp_path)).restore(SpiderRunner(START_URL))
+
+
+def test_closed_entries_done(tmp_path):
+    checkpointer = Checkpointer(str(tmp_path))
+    spider = SpiderRunner(START_URL, actor_limit=1,
+                          checkpointer=checkpointer)
+    movie = Movie(url='/wiki/M')
+    spider.graph.add_node(movie)
+    for i in range(5):
+        spider._put(('/wiki/A%d' % i, movie, 0.5, 1))
+    spider._put(('/wiki/M2', None, 0.0, 1))
+    checkpointer.save(spider)
+    spider.graph.add_node(Actor(url='/wiki/A'))
+    spider.graph.add_node(Actor(url='/wiki/B'))
+    spider._apply_budget()
+    assert PageType.ACTOR in spider.frontier.closed
+    checkpointer.save(spider)
+
+    checkpointer = Checkpointer(str(tmp_path))
+    resumed = SpiderRunner(START_URL, actor_limit=1,
+                           checkpointer=checkpointer)
+    assert checkpointer.restore(resumed)
+    assert ([PageType.MOVIE, PageType.MOVIE]
+            == [expected_page_type(entry)
+                for entry in resumed.frontier.entries()])
@@ -0,0 +1,101 @@
+import os
+
+import pytest
+
+from scraper.graph.actor import Actor
+from scraper.graph.movie import Movie
+from scraper.spider.async_runner import AsyncSpiderRunner
+from scraper.spider.fetcher import FetchError, FetchResult, Fetcher
+from scraper.spider.spider_runner import SpiderRunner
+
+BASE_URL = 'https://en.wikipedia.org'
+
+START_URL = '/wiki/How_to_Train_Your_Dragon:_The_Hidden_World'
+
+# Pages served by FakeFetcher, from test/test_files
+PAGES = {START_URL: 'movie1.html',
+         '/wiki/Jay_Baruchel': 'actor3.html',
+         '/wiki/Cate_Blanchett': 'actor4.html',
+         '/wiki/Running_Home': 'movie3.html',
+         '/wiki/Almost_Famous': 'movie4.html'}
+
+EMPTY_PAGE = b'<html><body></body></html>'
+
+
+def make_elements(graph_type):
+    graph = graph_type()
+    actor1 = Actor(name='Actor 1', url='http://actor1.com', age=10)
+    actor2 = Actor(name='Actor 2', url='http://actor2.com', age=12)
+    movie1 = Movie(name='Movie 1', url='http://movie1.com', total_grossing=100,
+                   year=2019)
+    movie2 = Movie(name='Movie 2', url='http://movie2.com', total_grossing=500,
+                   year=2018)
+    movie3 = Movie(name='Movie 3', url='http://movie3.com', total_grossing=100,
+                   year=2018)
+    graph.add_node(actor1)
+    graph.add_node(actor2)
+    graph.add_node(movie1)
+    graph.add_node(movie2)
+    graph.add_node(movie3)
+    graph.add_relationship(movie1.node_id, actor1.node_id).weight = 0.1
+    graph.add_relationship(movie2.node_id, actor2.node_id).weight = 0.2
+    graph.add_relationship(movie1.node_id, actor2.node_id).weight = 0.3
+    return graph, actor1, actor2, movie1, movie2, movie3
+
+
+def read_page(path, pages=PAGES):
+    if path not in pages:
+        return EMPTY_PAGE
+    with open(os.path.join('test/test_files', pages[path]), 'rb') as f:
+        return f.read()
+
+
+class FakeFetcher(Fetcher):
+    """
+    Serves the pages of test/test_files under BASE_URL, and an empty page
+    for other urls
+    """
+
+    def __init__(self, pages=PAGES, redirects=None, failing=None):
+        """
+        Args:
+            pages: Files of the pages served, by path
+            redirects: Path a requested path is redirected to
+            failing: Times the fetch of a path fails with a 503 before it
+                succeeds
+        """
+        super().__init__()
+        self.pages = pages
+        self.redirects = redirects or {}
+        self.failing = dict(failing or {})
+        # Paths requested, in order
+        self.fetched = []
+
+    def fetch(self, url, headers=None):
+        path = url[len(BASE_URL):] if url.startswith(BASE_URL) else url
+        self.fetched.append(path)
+        if self.failing.get(path):
+            self.failing[path] -= 1
+            raise FetchError(url, 503, 'Service Unavailable')
+        path = self.redirects.get(path, path)
+        result = FetchResult(url=BASE_URL + path, status=200,
+                             body=read_page(path, self.pages),
+                             headers={'Content-Type': 'text/html'})
+        self.stats.record(result)
+        return result
+
+
+@pytest.fixture
+def fake_fetcher(monkeypatch):
+    """
+    Make every runner download from a FakeFetcher rather than the network
+    """
+    fetcher = FakeFetcher()
+    monkeypatch.setattr(SpiderRunner, '_fetch',
+                        lambda self, url: fetcher.fetch(url))
+    return fetcher
+
+
+@pytest.fixture(params=[SpiderRunner, AsyncSpiderRunner])
+def runner(request):
+    return request.param
@@ -0,0 +1,66 @@
+from collections import Counter
+
+import pytest
+
+from scraper.spider.dedup import BloomSeenSet, SeenSet, UrlCanonicalizer
+from scraper.spider.frontier import StackFrontier
+from scraper.spider.spider_runner import SpiderRunner
+from test.conftest import BASE_URL, START_URL
+
+REDIRECTS = {'/wiki/HTTYD3': START_URL}
+
+
+@pytest.mark.parametrize('url, canonical', [
+    ('/wiki/Jay_Baruchel', '/wiki/Jay_Baruchel'),
+    ('/wiki/Jay_Baruchel#Career', '/wiki/Jay_Baruchel'),
+    ('/wiki/Jay Baruchel', '/wiki/Jay_Baruchel'),
+    ('https://en.wikipedia.org/wiki/Jay_Baruchel', '/wiki/Jay_Baruchel'),
+    ('/wiki/Titanic_%281997_film%29', '/wiki/Titanic_(1997_film)'),
+    ('/wiki/Am%c3%a9lie', '/wiki/Am%C3%A9lie'),
+    ('/wiki/Amélie', '/wiki/Am%C3%A9lie'),
+    ('https://example.org/a#b', 'https://example.org/a'),
+])
+def test_canonicalize(url, canonical):
+    assert canonical == UrlCanonicalizer(BASE_URL).canonicalize(url)
+
+
+def test_learn_redirect():
+    canonicalizer = UrlCanonicalizer(BASE_URL)
+    final = canonicalizer.learn_redirect(
+        '/wiki/Leo_DiCaprio',
+        'https://en.wikipedia.org/wiki/Leonardo_DiCaprio')
+    assert '/wiki/Leonardo_DiCaprio' == final
+    assert final == canonicalizer.canonicalize('/wiki/Leo_DiCaprio#x')
+
+
+@pytest.mark.parametrize('seen', [SeenSet(), BloomSeenSet(1000)])
+def test_seen_sets(seen):
+    urls = ['/wiki/%d' % i for i in range(1000)]
+    seen.update(urls)
+    assert all(url in seen for url in urls)
+    assert 1000 == len(seen)
+
+
+def test_bloom_error_rate():
+    seen = BloomSeenSet(10000, error_rate=0.01)
+    seen.update('/wiki/a%d' % i for i in range(10000))
+    false_positives = sum('/wiki/b%d' % i in seen for i in range(10000))
+    assert false_positives < 300
+
+
+def test_crawl_fetches_each_page_once(fake_fetcher):
+    fake_fetcher.redirects = REDIRECTS
+    spider = SpiderRunner('/wiki/HTTYD3', frontier=StackFrontier())
+    # Same movie under its real name and with a fragment
+    spider.frontier.put((START_URL + '#Cast', None, 0, 0))
+    spider.frontier.put((START_URL, None, 0, 0))
+    spider.run()
+    fetched = Counter(fake_fetcher.fetched)
+    assert 1 == max(fetched.values())
+    urls = [node.url for node in spider.graph.nodes]
+    assert 1 == urls.count(START_URL)
+    assert START_URL in spider.seen
+    # The redirect is fetched, but resolves to a page already crawled
+    assert 1 == fetched['/wiki/HTTYD3']
+    assert '/wiki/HTTYD3' in spider.seen
+    assert '/wiki/HTTYD3' not in urls
@@ -0,0 +1,40 @@
+import os
+import pickle
+
+import pytest
+
+from scraper.graph.actor import Actor
+from scraper.graph.movie import Movie
+from scraper.spider.extract import extract_page
+from scraper.spider.utils import PageType
+
+
+def read_page(name):
+    with open(os.path.join('test/test_files', name), 'rb') as f:
+        return f.read()
+
+
+@pytest.mark.parametrize('file_name, page_type, num_related',
+                         [('movie3.html', PageType.MOVIE, 10),
+                          ('movie6.html', PageType.MOVIE, 13),
+                          ('actor3.html', PageType.ACTOR, 36),
+                          ('tv1.html', PageType.OTHER, 0)])
+def test_extract_page(file_name, page_type, num_related):
+    record = extract_page('/wiki/Test', read_page(file_name))
+    assert page_type == record.page_type
+    assert num_related == len(record.related)
+    assert record == pickle.loads(pickle.dumps(record))
+
+
+def test_record_to_node():
+    movie = extract_page('/wiki/Titanic_(1997_film)',
+                         read_page('movie6.html')).to_node()
+    assert isinstance(movie, Movie)
+    assert 1997 == movie.year
+    assert 2.187 * 1e9 == movie.total_grossing
+    actor = extract_page('/wiki/Jay_Baruchel',
+                         read_page('actor3.html')).to_node()
+    assert isinstance(actor, Actor)
+    assert 'Jay Baruchel' == actor.name
+    assert 36 == actor.age
+    assert extract_page('/wiki/x', read_page('tv1.html')).to_node() is None
@@ -0,0 +1,135 @@
+import gzip
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from scraper.graph.entity_type import EntityType
+from scraper.spider.fetcher import (FetchError, Fetcher, PooledFetcher,
+                                    UrllibFetcher)
+from scraper.spider.spider_runner import SpiderRunner
+from test.conftest import EMPTY_PAGE, PAGES, START_URL, read_page
+
+
+class WikiHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    connections = 0
+    requests = []
+
+    def setup(self):
+        super().setup()
+        WikiHandler.connections += 1
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        WikiHandler.requests.append(self.path)
+        if self.path == '/redirect':
+            self.send_response(301)
+            self.send_header('Location', '/wiki/Jay_Baruchel')
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+        if self.path == '/corrupt':
+            body = gzip.compress(EMPTY_PAGE)[:-12] + b'garbage'
+            self.send_response(200)
+            self.send_header('Content-Encoding', 'gzip')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+            return
+        if self.path in PAGES:
+            body = read_page(self.path)
+        elif self.path.startswith('/wiki/'):
+            body = EMPTY_PAGE
+        else:
+            self.send_error(404)
+            return
+        self.send_response(200)
+        if 'gzip' in self.headers.get('Accept-Encoding', ''):
+            body = gzip.compress(body)
+            self.send_header('Content-Encoding', 'gzip')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+@pytest.fixture
+def server():
+    WikiHandler.connections = 0
+    WikiHandler.requests = []
+    httpd = ThreadingHTTPServer(('127.0.0.1', 0), WikiHandler)
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield 'http://127.0.0.1:%d' % httpd.server_address[1]
+    httpd.shutdown()
+    httpd.server_close()
+
+
+@pytest.mark.parametrize('fetcher_cls', [UrllibFetcher, PooledFetcher])
+def test_fetch_body(server, fetcher_cls):
+    fetcher = fetcher_cls(timeout=5)
+    result = fetcher.fetch(server + '/wiki/Jay_Baruchel')
+    assert 200 == result.status
+    assert read_page('/wiki/Jay_Baruchel') == result.body
+    assert 1 == fetcher.stats.requests
+    assert len(result.body) == fetcher.stats.body_bytes
+    fetcher.close()
+
+
+def test_fetch_required():
+    class NoFetch(Fetcher):
+        pass
+
+    with pytest.raises(TypeError):
+        NoFetch()
+
+
+def test_pooled_keep_alive_and_gzip(server):
+    fetcher = PooledFetcher(timeout=5)
+    for _ in range(5):
+        fetcher.fetch(server + '/wiki/Cate_Blanchett')
+    assert 1 == WikiHandler.connections
+    assert 5 == fetcher.stats.requests
+    assert fetcher.stats.wire_bytes < fetcher.stats.body_bytes
+    assert 5 == len(fetcher.stats.latencies)
+    fetcher.close()
+
+
+def test_pooled_redirect(server):
+    fetcher = PooledFetcher(timeout=5)
+    result = fetcher.fetch(server + '/redirect')
+    assert result.url == server + '/wiki/Jay_Baruchel'
+    assert read_page('/wiki/Jay_Baruchel') == result.body
+    fetcher.close()
+
+
+@pytest.mark.parametrize('fetcher_cls', [UrllibFetcher, PooledFetcher])
+def test_fetch_error(server, fetcher_cls):
+    fetcher = fetcher_cls(timeout=5)
+    with pytest.raises(FetchError) as info:
+        fetcher.fetch(server + '/missing')
+    assert 404 == info.value.status
+    assert 1 == fetcher.stats.errors
+
+
+def test_pooled_corrupt_body(server):
+    fetcher = PooledFetcher(timeout=5)
+    with pytest.raises(FetchError):
+        fetcher.fetch(server + '/corrupt')
+    assert 1 == fetcher.stats.errors
+    # The connection is not reused
+    fetcher.fetch(server + '/wiki/Cate_Blanchett')
+    assert 2 == WikiHandler.connections
+    fetcher.close()
+
+
+def test_spider_with_pooled_fetcher(server):
+    fetcher = PooledFetcher(timeout=5)
+    spider = SpiderRunner(START_URL, fetcher=fetcher, base_url=server)
+    spider.run()
+    assert 2 == spider.graph.num_node(EntityType.MOVIE)
+    assert 2 == spider.graph.num_node(EntityType.ACTOR)
+    assert fetcher.stats.requests == len(WikiHandler.requests)
+    fetcher.close()
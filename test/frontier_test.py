@@ -0,0 +1,155 @@
+import os
+from queue import LifoQueue, Queue
+
+import pytest
+
+from scraper.graph.entity_type import EntityType
+from scraper.graph.movie import Movie
+from scraper.graph.graph import Graph
+from scraper.spider.frontier import (Frontier, PriorityFrontier,
+                                     QueueFrontier, SpillingFrontier,
+                                     StackFrontier)
+from scraper.spider.spider_runner import SpiderRunner
+from scraper.spider.utils import PageType
+from test.conftest import START_URL
+
+MOVIE = Movie('Movie', '/wiki/Movie')
+
+
+@pytest.fixture
+def fetched(fake_fetcher):
+    return fake_fetcher.fetched
+
+
+def test_priority_order():
+    frontier = PriorityFrontier()
+    entries = [('/wiki/a', MOVIE, 0.1, 1), ('/wiki/b', None, 0, 2),
+               ('/wiki/c', MOVIE, 0.5, 1), ('/wiki/d', None, 0, 0),
+               ('/wiki/e', MOVIE, 0.1, 1)]
+    for entry in entries:
+        assert frontier.put(entry)
+    assert entries == frontier.entries()
+    order = [frontier.get()[0] for _ in range(len(entries))]
+    assert ['/wiki/d', '/wiki/c', '/wiki/a', '/wiki/e', '/wiki/b'] == order
+    assert frontier.empty()
+
+
+def test_abstract_frontier():
+    with pytest.raises(TypeError):
+        Frontier()
+
+
+def test_queue_classes(fetched):
+    SpiderRunner(START_URL, frontier=StackFrontier()).run()
+    depth_first = list(fetched)
+    del fetched[:]
+    # The queue class of the runners before frontiers, still the default
+    spider = SpiderRunner(START_URL, -1, -1, LifoQueue)
+    assert isinstance(spider.frontier, QueueFrontier)
+    spider.run()
+    assert depth_first == fetched
+    del fetched[:]
+    SpiderRunner(START_URL).run()
+    assert depth_first == fetched
+
+
+@pytest.mark.parametrize('make_frontier', [
+    PriorityFrontier, StackFrontier, lambda: QueueFrontier(Queue()),
+    lambda: SpillingFrontier(window=1, segment_size=1)])
+def test_close(make_frontier):
+    frontier = make_frontier()
+    frontier.bind(lambda node_id: MOVIE)
+    frontier.put(('/wiki/a', MOVIE, 0.1, 1))
+    frontier.put(('/wiki/b', None, 0, 2))
+    frontier.close(PageType.ACTOR)
+    assert not frontier.put(('/wiki/c', MOVIE, 0.5, 1))
+    assert frontier.put(('/wiki/d', None, 0, 2))
+    assert ['/wiki/b', '/wiki/d'] == [
+        entry[0] for entry in frontier.entries()]
+    assert 2 == len(frontier)
+
+
+@pytest.mark.parametrize('make_frontier', [
+    PriorityFrontier, StackFrontier, lambda: QueueFrontier(LifoQueue()),
+    lambda: QueueFrontier(Queue()),
+    lambda: SpillingFrontier(window=2, segment_size=1)])
+def test_requeue_behind_peers(make_frontier):
+    frontier = make_frontier()
+    for url in ('/wiki/a', '/wiki/b'):
+        frontier.put((url, None, 0, 1))
+    first = frontier.get()
+    assert frontier.requeue(first)
+    assert first != frontier.get()
+    assert first == frontier.get()
+    assert frontier.empty()
+
+
+def test_stack_order():
+    frontier = StackFrontier()
+    for url in ('/wiki/a', '/wiki/b', '/wiki/c'):
+        frontier.put((url, None, 0, 0))
+    assert '/wiki/c' == frontier.get()[0]
+
+
+def test_top_billed_first(fetched):
+    SpiderRunner(START_URL, queue=PriorityFrontier).run()
+    # Cast of the start movie in billing order, before anything deeper
+    assert START_URL == fetched[0]
+    assert ['/wiki/Jay_Baruchel', '/wiki/America_Ferrera'] == fetched[1:3]
+
+
+def test_budget_drops_actor_urls(fetched):
+    SpiderRunner(START_URL, movie_limit=2).run()
+    without_budget = len(fetched)
+    del fetched[:]
+    spider = SpiderRunner(START_URL, actor_limit=1, movie_limit=2)
+    spider.run()
+    assert 2 == spider.graph.num_node(EntityType.ACTOR)
+    assert PageType.ACTOR in spider.frontier.closed
+    # Cast links left once the actor budget ran out are never fetched
+    assert len(fetched) < without_budget
+
+
+def test_spill(tmp_path):
+    graph = Graph()
+    movie = Movie('Movie', '/wiki/Movie')
+    graph.add_node(movie)
+    frontier = SpillingFrontier(str(tmp_path), window=2, segment_size=2)
+    frontier.bind(graph.get_node_by_id)
+    entries = [('/wiki/a', movie, 0.1, 1), ('/wiki/b', movie, 0.5, 1),
+               ('/wiki/c', None, 0, 2), ('/wiki/d', movie, 0.9, 1),
+               ('/wiki/e', None, 0, 0)]
+    for entry in entries:
+        frontier.put(entry)
+    assert 5 == len(frontier)
+    assert 2 == len(os.listdir(tmp_path))
+    assert entries == frontier.entries()
+    # The window in priority order, then windows of spilled entries in
+    # the order they were queued
+    order = [frontier.get() for _ in range(3)]
+    assert ['/wiki/b', '/wiki/a', '/wiki/d'] == [e[0] for e in order]
+    assert movie is order[2][1]
+    frontier.put(('/wiki/f', None, 0, 0))
+    order = [frontier.get() for _ in range(3)]
+    assert ['/wiki/c', '/wiki/e', '/wiki/f'] == [e[0] for e in order]
+    assert frontier.empty()
+    assert [] == os.listdir(tmp_path)
+
+
+def test_spilling_crawl(fetched):
+    spider = SpiderRunner(START_URL)
+    spider.run()
+    expected = list(fetched)
+    del fetched[:]
+    spilling = SpiderRunner(
+        START_URL, frontier=SpillingFrontier(window=3, segment_size=2))
+    spilling.run()
+    assert sorted(expected) == sorted(fetched)
+    assert ({(e.ends[0].url, e.ends[1].url) for e in spider.graph.edges}
+            == {(e.ends[0].url, e.ends[1].url)
+                for e in spilling.graph.edges})
+    del fetched[:]
+    spilling = SpiderRunner(START_URL, queue=SpillingFrontier)
+    assert isinstance(spilling.frontier, SpillingFrontier)
+    spilling.run()
+    assert sorted(expected) == sorted(fetched)
@@ -1,33 +1,20 @@
 import json
+import tracemalloc
 
 import pytest
 
 from scraper.graph.actor import Actor
+from scraper.graph.base_objects import Edge
+from scraper.graph.compact import CompactGraph
 from scraper.graph.entity_type import EntityType
 from scraper.graph.graph import Graph
 from scraper.graph.movie import Movie
+from test.conftest import make_elements
 
 
-@pytest.fixture
-def elements():
-    graph = Graph()
-    actor1 = Actor(name='Actor 1', url='http://actor1.com', age=10)
-    actor2 = Actor(name='Actor 2', url='http://actor2.com', age=12)
-    movie1 = Movie(name='Movie 1', url='http://movie1.com', total_grossing=100,
-                   year=2019)
-    movie2 = Movie(name='Movie 2', url='http://movie2.com', total_grossing=500,
-                   year=2018)
-    movie3 = Movie(name='Movie 3', url='http://movie3.com', total_grossing=100,
-                   year=2018)
-    graph.add_node(actor1)
-    graph.add_node(actor2)
-    graph.add_node(movie1)
-    graph.add_node(movie2)
-    graph.add_node(movie3)
-    graph.add_relationship(movie1.node_id, actor1.node_id).weight = 0.1
-    graph.add_relationship(movie2.node_id, actor2.node_id).weight = 0.2
-    graph.add_relationship(movie1.node_id, actor2.node_id).weight = 0.3
-    return graph, actor1, actor2, movie1, movie2, movie3
+@pytest.fixture(params=[Graph, CompactGraph])
+def elements(request):
+    return make_elements(request.param)
 
 
 def test_graph_size(elements):
@@ -60,6 +47,32 @@ def test_grossing(elements):
     assert 130 == actor2.grossing
 
 
+def test_grossing_updates(elements):
+    graph, actor1, actor2, movie1, movie2, movie3 = elements
+    graph.add_relationship(movie3.node_id, actor1.node_id).weight = 0.5
+    movie1.total_grossing = 300
+    graph.get_edge(movie2.node_id, actor2.node_id).weight = 0.4
+    assert pytest.approx(30 + 50) == actor1.grossing
+    assert pytest.approx(200 + 90) == actor2.grossing
+    for actor in (actor1, actor2):
+        assert pytest.approx(actor.grossing) == sum(
+            movie.total_grossing * edge.weight
+            for edge in actor.get_edges() for movie in edge.ends
+            if movie != actor)
+
+
+def test_ranked(elements):
+    graph, actor1, actor2, movie1, movie2, movie3 = elements
+    assert [actor2, actor1] == graph.top_nodes('grossing', 5)
+    assert [actor2] == graph.top_nodes('age', 1)
+    assert [movie2, movie3] == graph.bottom_nodes('year', 2)
+    assert [movie1, movie3] == graph.nodes_between('total_grossing', 0, 100)
+    movie1.total_grossing = 1000
+    graph.get_edge(movie1.node_id, actor1.node_id).weight = 0.5
+    assert [actor1, actor2] == graph.top_nodes('grossing', 2)
+    assert [movie1] == graph.top_nodes('total_grossing', 1)
+
+
 def test_add_duplicate_node(elements):
     graph = elements[0]
     movie = Movie(name='Movie n', url='http://movie1.com', total_grossing=100,
@@ -87,16 +100,40 @@ def test_query_nodes(elements):
     assert actor2 in actors
 
 
+def test_query_indexed_name(elements):
+    graph, actor1, actor2, movie1, movie2, movie3 = elements
+    assert [movie2] == graph.query_nodes({'type': EntityType.MOVIE,
+                                          'name': 'Movie 2'})
+    assert [] == graph.query_nodes({'type': EntityType.ACTOR,
+                                    'name': 'Movie 2'})
+    assert [] == graph.query_nodes({'name': 'Movie 4'})
+    assert [movie1] == graph.query_nodes({'year': 2019,
+                                          'total_grossing': 100})
+
+
+def test_num_node(elements):
+    graph = elements[0]
+    assert 2 == graph.num_node(EntityType.ACTOR)
+    assert 3 == graph.num_node(EntityType.MOVIE)
+    graph.add_node(Actor(name='Actor 3', url='http://actor3.com', age=30))
+    assert 3 == graph.num_node(EntityType.ACTOR)
+    assert 0 == type(graph)().num_node(EntityType.MOVIE)
+
+
 def test_serialize(elements):
     graph, actor1, actor2, movie1, movie2, movie3 = elements
     json_str = graph.serialize()
     json_dict = json.loads(json_str)
     assert 'nodes' in json_dict
     assert 'edges' in json_dict
-    graph_loaded = Graph()
+    graph_loaded = type(graph)()
     graph_loaded.deserialize(json_str)
     assert graph_loaded.serialize() == graph.serialize()
     assert actor1 in graph_loaded.query_nodes({'type': EntityType.ACTOR})
+    assert ([movie2.node_id, movie3.node_id]
+            == [node.node_id for node in graph_loaded.query_nodes(
+                {'year': 2018, 'type': EntityType.MOVIE})])
+    assert 3 == graph_loaded.num_node(EntityType.MOVIE)
 
 
 def test_serialize_failed(elements):
@@ -104,10 +141,10 @@ def test_serialize_failed(elements):
     json_str = graph.serialize()
     json_dict = json.loads(json_str)
     json_dict['nodes'][0]['doesn\'t exist'] = 1
-    graph_loaded = Graph()
+    graph_loaded = type(graph)()
     assert not graph_loaded.deserialize(json.dumps(json_dict))
 
-    graph_loaded = Graph()
+    graph_loaded = type(graph)()
     json_str = graph.serialize()
     json_dict = json.loads(json_str)
     # Invalid id
@@ -115,9 +152,92 @@ def test_serialize_failed(elements):
         node['node_id'] = 0
     assert not graph_loaded.deserialize(json.dumps(json_dict))
 
-    graph_loaded = Graph()
+    graph_loaded = type(graph)()
     json_str = graph.serialize()
     json_dict = json.loads(json_str)
     # Duplicate edge
     json_dict['edges'].append({'ends': [3, 1], 'weight': 0.1})
     assert not graph_loaded.deserialize(json.dumps(json_dict))
+
+
+def test_compact_views():
+    graph, actor1, actor2, movie1, movie2, movie3 = make_elements(
+        CompactGraph)
+    # Nodes added are views over the columns of the graph
+    assert {} == {attr: value for attr, value in vars(movie1).items()
+                  if not attr.endswith('_')}
+    movie1.total_grossing = 300
+    assert 30 == actor1.grossing
+    assert isinstance(graph.get_node('http://movie1.com'), Movie)
+    assert 'Actor 2' == graph.get_node_by_id(actor2.node_id).name
+    with pytest.raises(TypeError):
+        graph.add_node(Edge(weight=0, ends=(movie1, actor1)))
+
+
+def build_graph(graph_type):
+    graph = graph_type()
+    for i in range(500):
+        graph.add_node(Movie(name='Movie %d' % i, url='/wiki/Movie_%d' % i,
+                             year=2000 + i % 20, total_grossing=1e6))
+        graph.add_node(Actor(name='Actor %d' % i, url='/wiki/Actor_%d' % i,
+                             age=20 + i % 50))
+    for i in range(500):
+        for j in range(10):
+            edge = graph.add_relationship(2 * i, 2 * ((i + 7 * j) % 500) + 1)
+            edge.weight = 0.1
+    return graph
+
+
+def test_compact_memory():
+    sizes = []
+    for graph_type in (Graph, CompactGraph):
+        tracemalloc.start()
+        graph = build_graph(graph_type)
+        sizes.append(tracemalloc.get_traced_memory()[0])
+        tracemalloc.stop()
+        assert 5000 == len(graph.edges)
+    assert sizes[1] * 3 < sizes[0]
+
+
+def test_deserialize_bulk_loads(elements, monkeypatch):
+    graph = elements[0]
+    json_str = graph.serialize()
+
+    def add_relationship(self, node_id_1, node_id_2):
+        raise AssertionError('Edges are loaded one by one')
+
+    monkeypatch.setattr(Graph, 'add_relationship', add_relationship)
+    monkeypatch.setattr(type(graph), 'add_relationship', add_relationship)
+    graph_loaded = type(graph)()
+    assert graph_loaded.deserialize(json_str)
+    assert json_str == graph_loaded.serialize()
+
+
+@pytest.mark.parametrize('node_ids, edges', [
+    ([0, 1, 1], []),
+    ([0, 1, 3], []),
+    ([2, 0, 1], [(0, 1, 0.5), (1, 0, 0.5)]),
+    ([2, 0, 1], [(0, 3, 0.5)]),
+    ([2, 0, 1], [(-1, 0, 0.5)]),
+])
+def test_bulk_load_invalid(node_ids, edges):
+    for graph_type in (Graph, CompactGraph):
+        nodes = [Movie(node_id=node_id, url='/wiki/%d' % i)
+                 for i, node_id in enumerate(node_ids)]
+        graph = graph_type()
+        assert not graph.bulk_load(nodes, edges)
+        assert () == graph.nodes
+        assert () == graph.edges
+
+
+@pytest.mark.parametrize('graph_type', [Graph, CompactGraph])
+def test_bulk_load_dense(graph_type):
+    movie = Movie(node_id=2000, name='Movie', url='/wiki/Movie')
+    actors = [Actor(node_id=i, url='/wiki/Actor_%d' % i) for i in range(2000)]
+    graph = graph_type()
+    assert graph.bulk_load([movie] + actors,
+                           [(2000, i, 1 / (i + 1)) for i in range(2000)])
+    movie = graph.get_node('/wiki/Movie')
+    assert 2000 == len(movie.get_edges())
+    assert 0.5 == graph.get_node('/wiki/Actor_1').get_edges()[0].weight
+    assert movie.has_peer(graph.get_node_by_id(1999))
@@ -0,0 +1,185 @@
+import datetime
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib import parse
+
+import pytest
+
+from scraper.graph.entity_type import EntityType
+from scraper.spider.async_runner import AsyncSpiderRunner
+from scraper.spider.extract import extract_page
+from scraper.spider.fetcher import FetchError, PooledFetcher
+from scraper.spider.mediawiki import (MediaWikiFetcher, WikitextRenderer,
+                                      render_page)
+from scraper.spider.utils import PageType
+
+START_URL = '/wiki/How_to_Train_Your_Dragon:_The_Hidden_World'
+
+MOVIE = '''{{Infobox film
+| name = %s
+| caption = Theatrical release poster
+| starring = {{ubl|[[Jay Baruchel]]|[[Kate Hudson]]}}
+| released = {{Film date|2000|9|13}}
+| gross = {{US$|47.4 million}}
+}}
+'''
+
+ACTRESS = '''{{Infobox person
+| birth_date = {{birth date and age|1979|4|19}}
+| occupation = Actress
+}}
+'''
+
+
+def wikitext(name):
+    with open('test/test_files/%s' % name) as f:
+        return f.read()
+
+
+PAGES = {'How to Train Your Dragon: The Hidden World':
+         wikitext('movie1.wiki'),
+         'Jay Baruchel': wikitext('actor3.wiki'),
+         'Kate Hudson': ACTRESS,
+         'Running Home': MOVIE % 'Running Home',
+         'Almost Famous': MOVIE % 'Almost Famous'}
+
+REDIRECTS = {'HTTYD3': 'How to Train Your Dragon: The Hidden World'}
+
+
+class StubApi:
+    """
+    Answers action=query&prop=revisions like api.php
+    """
+
+    def __init__(self):
+        self.batches = []
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                query = parse.parse_qs(parse.urlsplit(self.path).query)
+                titles = query['titles'][0].split('|')
+                stub.batches.append(titles)
+                if 'Broken' in titles:
+                    self.send_response(503)
+                    self.send_header('Content-Length', '0')
+                    self.end_headers()
+                    return
+                body = json.dumps(stub.answer(titles)).encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        threading.Thread(target=self.server.serve_forever,
+                         daemon=True).start()
+        self.base_url = 'http://127.0.0.1:%d' % self.server.server_address[1]
+
+    @staticmethod
+    def answer(titles):
+        query = {'normalized': [], 'redirects': [], 'pages': []}
+        for title in titles:
+            normalized = title[:1].upper() + title[1:]
+            if normalized != title:
+                query['normalized'].append({'from': title,
+                                            'to': normalized})
+            if normalized in REDIRECTS:
+                query['redirects'].append({'from': normalized,
+                                           'to': REDIRECTS[normalized]})
+                normalized = REDIRECTS[normalized]
+            if normalized not in PAGES:
+                query['pages'].append({'ns': 0, 'title': normalized,
+                                       'missing': True})
+                continue
+            query['pages'].append({'ns': 0, 'title': normalized,
+                                   'revisions': [{'slots': {'main': {
+                                       'content': PAGES[normalized]}}}]})
+        return {'batchcomplete': True, 'query': query}
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+@pytest.fixture
+def api():
+    api = StubApi()
+    yield api
+    api.close()
+
+
+@pytest.mark.parametrize('text, html', [
+    ('{{Birth date and age|1982|4|9}}', 'April 9, 1982 (age 37)'),
+    ('{{death date and age|2010|05|01|1930|06|02}}', 'May 1, 2010 (aged 79)'),
+    ('{{Film date|2019|01|03|Australia}}', 'January 3, 2019'),
+    ('$519.8 million<ref name="BOM">{{cite web|url=x}}</ref>',
+     '$519.8 million'),
+    ("''[[Almost Famous]]''",
+     '<a href="/wiki/Almost_Famous">Almost Famous</a>'),
+    ('[[Random Acts of Violence (film)|Random Acts]]',
+     '<a href="/wiki/Random_Acts_of_Violence_(film)">Random Acts</a>'),
+    ('{{hlist|Actor|[[comedian]]}}',
+     '<ul><li>Actor</li><li><a href="/wiki/Comedian">comedian</a></li></ul>'),
+    ('[[File:Poster.jpg|thumb]][[Category:Films]]<!-- note -->', ''),
+])
+def test_render_inline(text, html):
+    renderer = WikitextRenderer(today=datetime.date(2019, 6, 1))
+    assert html == renderer.inline(text)
+
+
+def test_render_page():
+    body, links = render_page('Jay Baruchel', PAGES['Jay Baruchel'],
+                              today=datetime.date(2019, 6, 1))
+    record = extract_page('/wiki/Jay_Baruchel', body)
+    assert PageType.ACTOR == record.page_type
+    assert 37 == record.attributes['age']
+    assert START_URL in record.related
+    assert record.related == links
+    body, links = render_page('Running Home', PAGES['Running Home'])
+    record = extract_page('/wiki/Running_Home', body)
+    assert PageType.MOVIE == record.page_type
+    assert 2000 == record.attributes['year']
+    assert 47.4e6 == pytest.approx(record.attributes['total_grossing'])
+    assert ['/wiki/Jay_Baruchel', '/wiki/Kate_Hudson'] == record.related
+
+
+def test_redirects_and_missing(api):
+    fetcher = MediaWikiFetcher(prefetch=False)
+    result = fetcher.fetch(api.base_url + '/wiki/HTTYD3')
+    assert api.base_url + START_URL == result.url
+    with pytest.raises(FetchError) as e:
+        fetcher.fetch(api.base_url + '/wiki/No_such_page')
+    assert 404 == e.value.status
+    with pytest.raises(FetchError) as e:
+        fetcher.fetch(api.base_url + '/wiki/Broken')
+    assert e.value.retryable
+    fetcher.close()
+
+
+def test_crawl(api, runner):
+    fetcher = MediaWikiFetcher(transport=PooledFetcher())
+    spider = runner(START_URL, fetcher=fetcher, base_url=api.base_url)
+    spider.run()
+    spider.fetcher.close()
+    assert 3 == spider.graph.num_node(EntityType.MOVIE)
+    assert 2 == spider.graph.num_node(EntityType.ACTOR)
+    assert ({'/wiki/Jay_Baruchel', '/wiki/Kate_Hudson'}
+            == {e.ends[1].url for e in spider.graph.edges})
+    # Pages linked to were downloaded along with the page linking them
+    assert len(api.batches) < sum(len(batch) for batch in api.batches) / 2
+    assert fetcher.stats.requests == len(api.batches)
+
+
+def test_concurrent_fetches_batched(api):
+    fetcher = MediaWikiFetcher(prefetch=False, workers=1)
+    spider = AsyncSpiderRunner(START_URL, fetcher=fetcher,
+                               base_url=api.base_url, concurrency=16)
+    spider.run()
+    fetcher.close()
+    assert max(len(batch) for batch in api.batches) > 1
@@ -0,0 +1,83 @@
+import json
+from urllib import request
+
+import pytest
+
+from scraper.spider.metrics import (CrawlMetrics, JsonDumper,
+                                    MetricsRegistry, MetricsServer)
+from scraper.spider.spider_runner import SpiderRunner
+from test.conftest import START_URL, FakeFetcher
+
+
+def test_prometheus_text():
+    registry = MetricsRegistry()
+    counter = registry.counter('skipped_total', 'Skipped urls', ('reason',))
+    counter.inc(reason='seen')
+    counter.inc(2, reason='seen')
+    histogram = registry.histogram('fetch_seconds', 'Fetch time',
+                                   buckets=(0.1, 1))
+    histogram.observe(0.05)
+    histogram.observe(0.5)
+    histogram.observe(5)
+    assert (registry.render()
+            == '# HELP skipped_total Skipped urls\n'
+               '# TYPE skipped_total counter\n'
+               'skipped_total{reason="seen"} 3\n'
+               '# HELP fetch_seconds Fetch time\n'
+               '# TYPE fetch_seconds histogram\n'
+               'fetch_seconds_bucket{le="0.1"} 1\n'
+               'fetch_seconds_bucket{le="1"} 2\n'
+               'fetch_seconds_bucket{le="+Inf"} 3\n'
+               'fetch_seconds_sum 5.55\n'
+               'fetch_seconds_count 3\n')
+    with pytest.raises(ValueError):
+        counter.inc(cause='seen')
+    with pytest.raises(ValueError):
+        registry.counter('skipped_total', 'Again')
+
+
+def test_crawl_metrics(runner):
+    spider = runner(START_URL, fetcher=FakeFetcher())
+    spider.run()
+    metrics = spider.metrics
+    assert spider.pages_fetched == metrics.fetch_seconds.count()
+    assert metrics.downloaded_bytes.value() > 500000
+    assert 2 == metrics.pages.value(type='movie')
+    assert 2 == metrics.pages.value(type='actor')
+    assert spider.pages_fetched == metrics.html_parse_seconds.count()
+    assert spider.pages_fetched == metrics.graph_insert_seconds.count()
+    assert metrics.infobox_parse_seconds.total() > 0
+    assert metrics.skipped.value(reason='seen') > 0
+    assert 0 == metrics.queue_depth.value()
+
+
+def test_failure_reasons():
+    fetcher = FakeFetcher(failing={'/wiki/Jay_Baruchel': 3})
+    spider = SpiderRunner(START_URL, max_requeues=2, fetcher=fetcher)
+    spider.run()
+    assert 2 == spider.metrics.failed.value(reason='503', action='requeued')
+    assert 1 == spider.metrics.failed.value(reason='503', action='gave_up')
+
+
+def test_exporters(tmp_path):
+    metrics = CrawlMetrics()
+    metrics.skipped.inc(reason='over_budget')
+    metrics.fetch_seconds.observe(0.2)
+    server = MetricsServer(metrics.registry, port=0).start()
+    try:
+        url = 'http://127.0.0.1:%d/metrics' % server.port
+        with request.urlopen(url) as response:
+            text = response.read().decode('utf-8')
+    finally:
+        server.stop()
+    assert 'spider_skipped_total{reason="over_budget"} 1' in text
+    assert 'spider_fetch_seconds_count 1' in text
+
+    path = str(tmp_path / 'metrics.json')
+    dumper = JsonDumper(metrics.registry, path, interval=60).start()
+    dumper.stop()
+    with open(path) as f:
+        dump = json.load(f)['metrics']
+    assert 1 == dump['spider_fetch_seconds']['values'][0]['count']
+    assert ([{'labels': {'reason': 'over_budget'}, 'value': 1}]
+            == dump['spider_skipped_total']['values'])
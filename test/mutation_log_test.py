@@ -0,0 +1,117 @@
+import json
+
+import pytest
+
+from scraper.graph.actor import Actor
+from scraper.graph.compact import CompactGraph
+from scraper.graph.graph import Graph
+from scraper.graph.mutation_log import MutationLog, compact, replay
+from scraper.graph.stream import load_graph, save_graph
+from scraper.spider.spider_runner import SpiderRunner
+from test.conftest import START_URL, FakeFetcher, make_elements
+
+
+def summary(graph):
+    return json.loads(graph.serialize())
+
+
+@pytest.fixture(params=[Graph, CompactGraph])
+def graph_type(request):
+    return request.param
+
+
+@pytest.fixture
+def log_path(tmp_path):
+    return str(tmp_path / 'graph.log')
+
+
+def logged(graph_type, log_path):
+    def make():
+        graph = graph_type()
+        graph.log = MutationLog(log_path)
+        return graph
+    return make
+
+
+def test_replay(graph_type, log_path):
+    graph = make_elements(logged(graph_type, log_path))[0]
+    graph.log.flush()
+    with open(log_path) as f:
+        assert 5 + 3 + 3 == len(f.readlines())
+    replayed = graph_type()
+    assert replay(replayed, log_path)
+    assert summary(graph) == summary(replayed)
+    assert 0.3 == replayed.get_edge(2, 1).weight
+    assert replayed.get_edge(3, 0) is None
+
+
+def test_compact(graph_type, log_path, tmp_path):
+    graph = make_elements(logged(graph_type, log_path))[0]
+    out = str(tmp_path / 'out.jsonl')
+    compact(graph, out)
+    with open(log_path) as f:
+        assert '' == f.read()
+    actor = Actor(name='Actor 3', url='http://actor3.com', age=30)
+    graph.add_node(actor)
+    graph.add_relationship(2, actor.node_id).weight = 0.4
+    graph.get_edge(2, 0).weight = 0.5
+    graph.get_node_by_id(2).total_grossing = 200
+    graph.log.flush()
+    with open(log_path) as f:
+        assert 5 == len(f.readlines())
+    loaded = graph_type()
+    assert load_graph(loaded, out)
+    assert replay(loaded, log_path)
+    assert summary(graph) == summary(loaded)
+    assert (pytest.approx(actor.grossing)
+            == loaded.get_node_by_id(actor.node_id).grossing)
+
+
+def test_replay_onto_save(graph_type, log_path, tmp_path):
+    graph, actor1 = make_elements(logged(graph_type, log_path))[:2]
+    graph.log.flush()
+    # A crash after the save of compact, before the log is emptied
+    out = str(tmp_path / 'out.jsonl.gz')
+    save_graph(graph, out)
+    assert ['graph.log', 'out.jsonl.gz'] == sorted(
+        path.name for path in tmp_path.iterdir())
+    loaded = graph_type()
+    assert load_graph(loaded, out)
+    for _ in range(2):
+        assert replay(loaded, log_path)
+        assert summary(graph) == summary(loaded)
+        assert 10 == loaded.get_node_by_id(actor1.node_id).grossing
+
+
+def test_replay_invalid(graph_type, log_path):
+    with open(log_path, 'w') as f:
+        f.write('["edge", 0, 1]\n')
+    assert not replay(graph_type(), log_path)
+
+
+def test_replay_partial_write(log_path):
+    graph = make_elements(logged(Graph, log_path))[0]
+    graph.log.close()
+    with open(log_path, 'a') as f:
+        f.write('["weight", 2, 0')
+    replayed = Graph()
+    assert replay(replayed, log_path)
+    assert summary(graph) == summary(replayed)
+
+
+def test_crawl(graph_type, log_path, tmp_path):
+    graph = graph_type()
+    graph.log = MutationLog(log_path)
+    runner = SpiderRunner(START_URL, fetcher=FakeFetcher(), graph=graph)
+    runner.run()
+    # Progress is on disk before the graph is saved
+    replayed = graph_type()
+    assert replay(replayed, log_path)
+    assert summary(graph) == summary(replayed)
+    out = str(tmp_path / 'out.json')
+    runner.save(out)
+    with open(log_path) as f:
+        assert '' == f.read()
+    loaded = graph_type()
+    assert load_graph(loaded, out)
+    assert summary(graph) == summary(loaded)
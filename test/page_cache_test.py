@@ -0,0 +1,133 @@
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from scraper.spider.fetcher import UrllibFetcher
+from scraper.spider.page_cache import (CachingFetcher, PageCache,
+                                       canonical_cache_key)
+from scraper.spider.spider_runner import SpiderRunner
+from test.conftest import PAGES, START_URL, FakeFetcher
+
+
+class EtagHandler(BaseHTTPRequestHandler):
+    hits = 0
+    not_modified = 0
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        EtagHandler.hits += 1
+        etag = '"%s"' % self.path
+        if self.headers.get('If-None-Match') == etag:
+            EtagHandler.not_modified += 1
+            self.send_response(304)
+            self.end_headers()
+            return
+        body = ('<html><body>%s</body></html>' % self.path).encode()
+        self.send_response(200)
+        self.send_header('ETag', etag)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+@pytest.fixture
+def server():
+    EtagHandler.hits = 0
+    EtagHandler.not_modified = 0
+    httpd = ThreadingHTTPServer(('127.0.0.1', 0), EtagHandler)
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield 'http://127.0.0.1:%d' % httpd.server_address[1]
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def test_canonical_key():
+    assert (canonical_cache_key('HTTP://En.Wikipedia.org/wiki/Caf%C3%A9#x')
+            == canonical_cache_key('http://en.wikipedia.org/wiki/Café'))
+    assert (canonical_cache_key('http://a.org/wiki/A_(film)')
+            == canonical_cache_key('http://a.org/wiki/A_%28film%29'))
+    assert (canonical_cache_key('http://a.org/wiki/Face%2FOff')
+            != canonical_cache_key('http://a.org/wiki/Face/Off'))
+
+
+def test_put_get(tmp_path):
+    cache = PageCache(str(tmp_path))
+    assert cache.get('http://a.org/x') is None
+    cache.put('http://a.org/x', b'page', {'ETag': '"1"'})
+    entry = cache.get('http://a.org/x')
+    assert b'page' == entry.body
+    assert '"1"' == entry.etag
+    assert entry.fresh
+    # Same content is stored once
+    cache.put('http://a.org/y', b'page')
+    assert 1 == len(list((tmp_path / 'objects').glob('*/*.gz')))
+
+
+def test_put_redirect(tmp_path):
+    cache = PageCache(str(tmp_path))
+    cache.put('http://a.org/x', b'page', final_url='http://a.org/y')
+    assert 'http://a.org/y' == cache.get('http://a.org/x').url
+    assert b'page' == cache.get('http://a.org/y').body
+    assert cache.get('http://a.org/y').url is None
+
+
+def test_shared_between_instances(tmp_path):
+    PageCache(str(tmp_path)).put('http://a.org/x', b'page')
+    assert b'page' == PageCache(str(tmp_path)).get('http://a.org/x').body
+
+
+def test_lru_eviction(tmp_path):
+    # Random bytes do not compress, so each page takes about 1000 bytes
+    cache = PageCache(str(tmp_path), max_bytes=2500)
+    cache.put('http://a.org/1', os.urandom(1000))
+    cache.put('http://a.org/2', os.urandom(1000))
+    time.sleep(0.01)
+    cache.get('http://a.org/1')
+    cache.put('http://a.org/3', os.urandom(1000))
+    assert cache.size <= 2500
+    assert cache.get('http://a.org/2') is None
+    assert cache.get('http://a.org/1') is not None
+    assert cache.get('http://a.org/3') is not None
+
+
+def test_warm_fetch_skips_network(tmp_path, server):
+    fetcher = CachingFetcher(UrllibFetcher(), PageCache(str(tmp_path)))
+    first = fetcher.fetch(server + '/wiki/A')
+    second = fetcher.fetch(server + '/wiki/A')
+    assert first.body == second.body
+    assert 1 == EtagHandler.hits
+    assert 1 == fetcher.stats.cache_hits
+
+
+def test_stale_entry_revalidated(tmp_path, server):
+    fetcher = CachingFetcher(UrllibFetcher(),
+                             PageCache(str(tmp_path), ttl=0))
+    first = fetcher.fetch(server + '/wiki/A')
+    second = fetcher.fetch(server + '/wiki/A')
+    assert 200 == second.status
+    assert first.body == second.body
+    assert 2 == EtagHandler.hits
+    assert 1 == EtagHandler.not_modified
+    assert 1 == fetcher.stats.revalidations
+
+
+def test_warm_crawl_redirects(tmp_path):
+    pages = dict(PAGES, **{'/wiki/Jay_B': 'actor3.html'})
+    del pages['/wiki/Jay_Baruchel']
+    redirects = {'/wiki/Jay_Baruchel': '/wiki/Jay_B'}
+    cache = PageCache(str(tmp_path))
+    graphs = []
+    for _ in range(2):
+        fetcher = FakeFetcher(pages=pages, redirects=redirects)
+        spider = SpiderRunner(START_URL, fetcher=fetcher, cache=cache)
+        spider.run()
+        graphs.append(sorted(node.url for node in spider.graph.nodes))
+    assert [] == fetcher.fetched
+    assert graphs[0] == graphs[1]
+    assert '/wiki/Jay_Baruchel' not in graphs[1]
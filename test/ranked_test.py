@@ -0,0 +1,50 @@
+import random
+
+import pytest
+
+from scraper.graph.ranked import RankedIndex
+
+
+@pytest.mark.parametrize('size', [0, 10, 5000])
+def test_ranked_index(size):
+    random.seed(size)
+    values = {node_id: random.randrange(100) for node_id in range(size)}
+    index = RankedIndex((value, node_id) for node_id, value
+                        in list(values.items())[:size // 2])
+    for node_id, value in list(values.items())[size // 2:]:
+        index.add(value, node_id)
+    for node_id in range(0, size, 3):
+        index.remove(values[node_id], node_id)
+        values[node_id] = random.randrange(100)
+        index.add(values[node_id], node_id)
+    entries = sorted((value, node_id) for node_id, value in values.items())
+    assert size == len(index)
+    assert [node_id for _, node_id in entries[:7]] == index.smallest(7)
+    largest = sorted(entries, key=lambda entry: entry[0], reverse=True)
+    assert [node_id for _, node_id in largest[:7]] == index.largest(7)
+    assert ([node_id for value, node_id in entries if 20 <= value <= 30]
+            == index.between(20, 30))
+    assert [] == index.between(200, 300)
+
+
+def test_remove_missing():
+    index = RankedIndex([(1, 0), (2, 1)])
+    with pytest.raises(KeyError):
+        index.remove(2, 0)
+    with pytest.raises(KeyError):
+        index.remove(3, 1)
+
+
+def test_largest_ties():
+    index = RankedIndex([(1, 0), (2, 3), (2, 1), (3, 4), (2, 2)])
+    assert [4, 1, 2] == index.largest(3)
+    assert [4, 1, 2, 3, 0] == index.largest(10)
+    assert [] == index.largest(0)
+
+
+def test_largest_ties_across_lists(monkeypatch):
+    monkeypatch.setattr(RankedIndex, '_LOAD', 2)
+    index = RankedIndex([(0, node_id) for node_id in range(20, 0, -1)]
+                        + [(1, 0)])
+    assert [0, 1, 2, 3] == index.largest(4)
+    assert [0] + list(range(1, 21)) == index.largest(30)
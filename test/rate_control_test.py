@@ -0,0 +1,134 @@
+import pytest
+
+from scraper.graph.entity_type import EntityType
+from scraper.spider.fetcher import FetchError, FetchResult, Fetcher
+from scraper.spider.frontier import StackFrontier
+from scraper.spider.rate_control import (CircuitBreaker, RateController,
+                                         ThrottledFetcher, TokenBucket,
+                                         retry_after)
+from scraper.spider.spider_runner import SpiderRunner
+from test.conftest import BASE_URL, START_URL
+
+URL = BASE_URL + '/wiki/Test'
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 100.0
+
+    def __call__(self):
+        return self.now
+
+
+class FlakyFetcher(Fetcher):
+    def __init__(self, statuses):
+        super().__init__()
+        self.statuses = list(statuses)
+        self.calls = 0
+
+    def fetch(self, url, headers=None):
+        self.calls += 1
+        status = self.statuses.pop(0) if self.statuses else 200
+        if status != 200:
+            raise FetchError(url, status, 'error', {'Retry-After': '0'})
+        return FetchResult(url=url, status=200, body=b'ok', elapsed=0.01)
+
+
+def test_token_bucket():
+    clock = FakeClock()
+    bucket = TokenBucket(rate=2, burst=2, clock=clock)
+    assert [0, 0, 0.5, 1.0] == [bucket.reserve() for _ in range(4)]
+    clock.now += 2
+    assert 0 == bucket.reserve()
+    bucket.pause(3)
+    assert 3.5 == bucket.reserve()
+
+
+def test_circuit_breaker():
+    breaker = CircuitBreaker(failure_threshold=2, cooldown=10)
+    breaker.failure(0)
+    assert 0 == breaker.wait_time(0)
+    breaker.failure(0)
+    assert CircuitBreaker.OPEN == breaker.state
+    assert 4 == breaker.wait_time(6)
+    # A single probe once the cooldown is over
+    assert 0 == breaker.wait_time(10)
+    assert breaker.wait_time(10) is None
+    breaker.failure(11)
+    assert 20 == breaker.wait_time(11)
+    assert 0 == breaker.wait_time(31)
+    breaker.success()
+    assert CircuitBreaker.CLOSED == breaker.state
+    assert 0 == breaker.wait_time(31)
+
+
+def test_rate_adapts():
+    controller = RateController(rate=4, concurrency=4, target_latency=1)
+    for _ in range(10):
+        controller.acquire(URL)
+        controller.release(URL, 0.1)
+    assert 5 == pytest.approx(controller.rate(URL))
+    assert controller.concurrency(URL) > 4
+    controller.acquire(URL)
+    controller.release(URL, 0.1, FetchError(URL, 429))
+    assert 2.5 == pytest.approx(controller.rate(URL))
+    controller.acquire(URL)
+    controller.release(URL, 0.1, FetchError(URL, 404))
+    assert 2.6 == pytest.approx(controller.rate(URL))
+    # Other hosts are not affected
+    assert 4 == controller.rate('https://example.org/')
+
+
+@pytest.mark.parametrize('headers, delay', [
+    ({'Retry-After': '120'}, 120), ({'retry-after': ' 3 '}, 3),
+    ({}, None), ({'Retry-After': 'soon'}, None),
+    ({'Retry-After': 'Wed, 21 Oct 2015 07:28:00 GMT'}, 0)])
+def test_retry_after(headers, delay):
+    assert delay == retry_after(headers)
+
+
+def test_retries():
+    inner = FlakyFetcher([503, 500])
+    fetcher = ThrottledFetcher(inner, RateController(rate=1000),
+                               base_delay=0.001)
+    assert b'ok' == fetcher.fetch(URL).body
+    assert 3 == inner.calls
+    assert 2 == fetcher.stats.retries
+
+
+@pytest.mark.parametrize('statuses, calls', [([404], 1),
+                                             ([503, 503, 503], 3)])
+def test_retries_give_up(statuses, calls):
+    inner = FlakyFetcher(statuses)
+    fetcher = ThrottledFetcher(inner, RateController(rate=1000),
+                               max_retries=2, base_delay=0.001)
+    with pytest.raises(FetchError):
+        fetcher.fetch(URL)
+    assert calls == inner.calls
+
+
+class BrokenFetcher(Fetcher):
+    def fetch(self, url, headers=None):
+        raise ValueError('broken')
+
+
+def test_slot_released_on_any_error():
+    controller = RateController(rate=1000, concurrency=1)
+    fetcher = ThrottledFetcher(BrokenFetcher(), controller)
+    for _ in range(2):
+        with pytest.raises(ValueError):
+            fetcher.fetch(URL)
+    assert 0 == controller._host(URL).in_flight
+
+
+def test_failed_urls_queued_again(fake_fetcher):
+    fake_fetcher.failing = {'/wiki/Jay_Baruchel': 2,
+                            '/wiki/Cate_Blanchett': 10}
+    fetched = fake_fetcher.fetched
+    spider = SpiderRunner(START_URL, frontier=StackFrontier(),
+                          max_requeues=3)
+    spider.run()
+    assert 1 == spider.graph.num_node(EntityType.ACTOR)
+    assert 3 == fetched.count('/wiki/Jay_Baruchel')
+    assert 4 == fetched.count('/wiki/Cate_Blanchett')
+    assert 1 == fetched.count('/wiki/America_Ferrera')
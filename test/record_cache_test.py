@@ -0,0 +1,62 @@
+import pytest
+
+from scraper.spider.extract import extract_page
+from scraper.spider.record_cache import (RecordCache, parser_version,
+                                         record_key)
+from scraper.spider.stream_extract import stream_extract_page
+from test.conftest import START_URL, FakeFetcher, read_page
+
+
+def graph_summary(graph):
+    return (sorted((n.url, n.name, getattr(n, 'year', None)) for n in
+                   graph.nodes),
+            sorted((e.ends[0].url, e.ends[1].url, e.weight)
+                   for e in graph.edges))
+
+
+@pytest.fixture
+def cache(tmp_path):
+    cache = RecordCache(str(tmp_path / 'records.sqlite'))
+    yield cache
+    cache.close()
+
+
+def test_record_round_trip(cache):
+    content = read_page(START_URL)
+    record = extract_page(START_URL, content)
+    version = parser_version(extract_page)
+    key = record_key(version, START_URL, content)
+    assert cache.get(key) is None
+    cache.put(key, version, record)
+    assert record == cache.get(key)
+    # Same html under another url, or changed html, is parsed again
+    assert cache.get(record_key(version, '/wiki/Other', content)) is None
+    assert cache.get(record_key(version, START_URL, content + b' ')) is None
+    assert 1 == cache.hits
+    assert 0 == cache.prune(version)
+    assert 1 == cache.prune('older')
+    assert 0 == len(cache)
+
+
+def test_parser_version():
+    assert parser_version(extract_page) == parser_version(extract_page)
+    assert (parser_version(extract_page)
+            != parser_version(stream_extract_page))
+
+
+def test_recrawl_skips_parsing(cache, runner):
+    first = runner(START_URL, fetcher=FakeFetcher(), record_cache=cache)
+    first.run()
+    assert 0 == first.metrics.record_cache.value(result='hit')
+    assert len(cache) == first.pages_fetched
+    # A smaller budget rebuilds the graph from cached records only
+    second = runner(START_URL, fetcher=FakeFetcher(), record_cache=cache,
+                    actor_limit=1, movie_limit=1)
+    second.run()
+    assert 0 == second.metrics.html_parse_seconds.count()
+    # Downloads cancelled once the budget is spent are never looked up
+    assert 0 == second.metrics.record_cache.value(result='miss')
+    assert 0 < second.metrics.record_cache.value(result='hit')
+    third = runner(START_URL, fetcher=FakeFetcher(), record_cache=cache)
+    third.run()
+    assert graph_summary(first.graph) == graph_summary(third.graph)
@@ -0,0 +1,101 @@
+import json
+
+import pytest
+
+from scraper.graph.actor import Actor
+from scraper.graph.entity_type import EntityType
+from scraper.graph.graph import Graph
+from scraper.graph.movie import Movie
+from scraper.spider.sharded import (ShardStore, SharedFrontier,
+                                    merge_shards, run_sharded, shard_of)
+from scraper.spider.spider_runner import SpiderRunner
+from test.conftest import START_URL
+
+pytestmark = pytest.mark.usefixtures('fake_fetcher')
+
+
+def graph_summary(graph):
+    return (sorted(node.url for node in graph.nodes),
+            sorted((e.ends[0].url, e.ends[1].url, e.weight)
+                   for e in graph.edges))
+
+
+def test_shard_of():
+    shards = [shard_of('/wiki/%d' % i, 4) for i in range(1000)]
+    assert {0, 1, 2, 3} == set(shards)
+    assert shards == [shard_of('/wiki/%d' % i, 4) for i in range(1000)]
+
+
+@pytest.mark.parametrize('num_workers', [1, 3])
+def test_sharded_same_graph(tmp_path, num_workers):
+    spider = SpiderRunner(START_URL)
+    spider.run()
+    graph = run_sharded(START_URL, str(tmp_path), num_workers)
+    assert graph_summary(spider.graph) == graph_summary(graph)
+    assert (sorted(node.node_id for node in graph.nodes)
+            == list(range(len(graph.nodes))))
+
+
+def test_sharded_limits(tmp_path):
+    graph = run_sharded(START_URL, str(tmp_path), 3, actor_limit=1,
+                        movie_limit=1)
+    assert 2 == graph.num_node(EntityType.ACTOR)
+    assert 2 == graph.num_node(EntityType.MOVIE)
+
+
+def write_partial(path, nodes, links):
+    graph = Graph()
+    for node in nodes:
+        graph.add_node(node)
+    partial = json.loads(graph.serialize())
+    partial['links'] = links
+    with open(path, 'w') as f:
+        json.dump(partial, f)
+    return path
+
+
+def test_merge_by_url(tmp_path):
+    first = write_partial(
+        str(tmp_path / 'a.json'),
+        [Movie(name='Movie 1', url='/wiki/m1'),
+         Actor(name='Actor 1', url='/wiki/a1')],
+        [('/wiki/m2', '/wiki/a1', 0.5)])
+    second = write_partial(
+        str(tmp_path / 'b.json'),
+        [Movie(name='Movie 2', url='/wiki/m2'),
+         Actor(name='Actor 1', url='/wiki/a1'),
+         Actor(name='Actor 2', url='/wiki/a2'),
+         Actor(name='Actor 3', url='/wiki/a3')],
+        [('/wiki/m1', '/wiki/a2', 0.25), ('/wiki/m3', '/wiki/a2', 1),
+         ('/wiki/m2', '/wiki/a3', 0.5)])
+    graph = merge_shards([first, second])
+    assert 3 == graph.num_node(EntityType.ACTOR)
+    assert [0, 1, 2, 3, 4] == [node.node_id for node in graph.nodes]
+    assert graph_summary(graph)[1] == [('/wiki/m1', '/wiki/a2', 0.25),
+                                       ('/wiki/m2', '/wiki/a1', 0.5),
+                                       ('/wiki/m2', '/wiki/a3', 0.5)]
+    assert 1 == len(graph.get_node('/wiki/a1').get_edges())
+
+    # Limits are exceeded by at most one node, as in a single crawl
+    graph = merge_shards([first, second], actor_limit=1)
+    assert 2 == graph.num_node(EntityType.ACTOR)
+    assert graph.get_node('/wiki/a3') is None
+    assert 2 == len(graph.edges)
+
+
+def test_shared_frontier(tmp_path):
+    store = ShardStore(str(tmp_path / 'store.db'), 1)
+    frontier = SharedFrontier(store, 0)
+    frontier.put(('/wiki/m1', None, 1, 0))
+    frontier.put(('/wiki/m2', None, 1, 0))
+    # Asking does not claim anything
+    assert not frontier.empty()
+    assert not frontier.empty()
+    assert 2 == len(frontier)
+    assert '/wiki/m1' == frontier.get()[0]
+    assert 1 == len(frontier)
+    assert store.busy()
+    assert '/wiki/m2' == frontier.get()[0]
+    frontier.finish()
+    assert frontier.empty()
+    store.close()
@@ -0,0 +1,107 @@
+import json
+
+import pytest
+
+from scraper.graph.actor import Actor
+from scraper.graph.compact import CompactGraph
+from scraper.graph.entity_type import EntityType
+from scraper.graph.graph import Graph
+from scraper.graph.snapshot import SnapshotGraph, write_snapshot
+from scraper.graph.stream import load_graph, save_graph
+from test.conftest import make_elements
+
+
+@pytest.fixture(params=[Graph, CompactGraph])
+def snapshot(request, tmp_path):
+    graph = make_elements(request.param)[0]
+    path = str(tmp_path / 'out.snap')
+    save_graph(graph, path)
+    snapshot = SnapshotGraph(path)
+    yield graph, snapshot
+    snapshot.close()
+
+
+def test_roundtrip(snapshot):
+    graph, loaded = snapshot
+    assert json.loads(graph.serialize()) == json.loads(loaded.serialize())
+    assert 3 == loaded.num_node(EntityType.MOVIE)
+    assert 2 == loaded.num_node(EntityType.ACTOR)
+
+
+def test_queries(snapshot):
+    _, graph = snapshot
+    movie1 = graph.get_node('http://movie1.com')
+    actor2 = graph.get_node('http://actor2.com')
+    assert 'Movie 1' == movie1.name
+    assert 2019 == movie1.year
+    assert graph.get_node('http://movie4.com') is None
+    assert movie1.has_peer(actor2)
+    assert not graph.get_node('http://movie3.com').has_peer(actor2)
+    assert [0.2, 0.3] == [edge.weight for edge in actor2.get_edges()]
+    assert isinstance(actor2, Actor)
+    assert pytest.approx(130) == actor2.grossing
+    assert ['Movie 2', 'Movie 3'] == [
+        node.name for node in graph.query_nodes({'year': 2018})]
+    assert ['Actor 2'] == [node.name for node in graph.query_nodes(
+        {'type': EntityType.ACTOR, 'name': 'Actor 2'})]
+    assert [] == graph.query_nodes({'type': EntityType.ACTOR, 'year': 2018})
+    assert [] == graph.query_nodes({'name': 'Actor 3'})
+    assert 1 == len(graph.query_nodes({'age': 10}))
+
+
+@pytest.mark.parametrize('index', [0, 1])
+def test_ranked(snapshot, index):
+    graph = snapshot[index]
+    assert ['Actor 2', 'Actor 1'] == [
+        node.name for node in graph.top_nodes('grossing', 5)]
+    # Ties in id order
+    assert ['Movie 1', 'Movie 2'] == [
+        node.name for node in graph.top_nodes('year', 2)]
+    assert ['Actor 1'] == [node.name for node in graph.bottom_nodes('age', 1)]
+    assert ['Movie 2', 'Movie 3', 'Movie 1'] == [
+        node.name for node in graph.nodes_between('year', 2000, 2020)]
+    assert [] == graph.nodes_between('total_grossing', 200, 400)
+
+
+def test_read_only(snapshot):
+    _, graph = snapshot
+    with pytest.raises(TypeError):
+        graph.add_node(Actor(name='Actor 3', url='http://actor3.com'))
+    with pytest.raises(TypeError):
+        graph.add_relationship(0, 4)
+    with pytest.raises(TypeError):
+        graph.get_node('http://actor1.com').age = 11
+
+
+def test_empty(tmp_path):
+    path = str(tmp_path / 'out.snap')
+    save_graph(Graph(), path)
+    graph = SnapshotGraph(path)
+    assert () == graph.nodes
+    assert graph.get_node('http://movie1.com') is None
+    assert 0 == graph.num_node(EntityType.MOVIE)
+    graph.close()
+
+
+@pytest.mark.parametrize('content', [b'', b'{"nodes": [], "edges": []}',
+                                     b'MVGRAPH\0\2\0\0\0\0\0\0\0'])
+def test_invalid(tmp_path, content):
+    path = tmp_path / 'out.snap'
+    path.write_bytes(content)
+    with pytest.raises(ValueError):
+        SnapshotGraph(str(path))
+    with pytest.raises(ValueError):
+        load_graph(Graph(), str(path))
+
+
+def test_other_byte_order(tmp_path):
+    path = tmp_path / 'out.snap'
+    write_snapshot(make_elements(Graph)[0], str(path))
+    assert ['out.snap'] == [p.name for p in tmp_path.iterdir()]
+    content = bytearray(path.read_bytes())
+    # The byte order field follows the magic and the version
+    content[12] ^= 1
+    path.write_bytes(bytes(content))
+    with pytest.raises(ValueError) as e:
+        SnapshotGraph(str(path))
+    assert 'byte order' in str(e.value)
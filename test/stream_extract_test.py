@@ -0,0 +1,87 @@
+import os
+
+import pytest
+
+from scraper.spider.actor_parser import ActorParser
+from scraper.spider.extract import extract_page
+from scraper.spider.movie_parser import MovieParser
+from scraper.spider.stream_extract import (extract_regions,
+                                           stream_extract_page)
+from scraper.spider.utils import PageType, parse_infobox, parse_page_type
+
+
+def read_page(name):
+    with open(os.path.join('test/test_files', name), 'rb') as f:
+        return f.read()
+
+
+@pytest.mark.parametrize('file_name', sorted(os.listdir('test/test_files')))
+def test_same_record_as_soup(file_name):
+    content = read_page(file_name)
+    assert (extract_page('/wiki/Test', content)
+            == stream_extract_page('/wiki/Test', content))
+
+
+@pytest.mark.parametrize('file_name, page_type',
+                         [('movie1.html', PageType.MOVIE),
+                          ('movie2.html', PageType.MOVIE),
+                          ('actor2.html', PageType.ACTOR),
+                          ('tv1.html', PageType.OTHER),
+                          ('other.html', PageType.OTHER)])
+def test_page_type(file_name, page_type):
+    assert page_type == stream_extract_page(
+        '/wiki/Test', read_page(file_name)).page_type
+
+
+@pytest.mark.parametrize('file_name, name, year, grossing',
+                         [('movie3.html', 'Uncle Buck', 1989, 79.2 * 1e6),
+                          ('movie2.html', 'The Wandering Earth', 2019,
+                           650 * 1e6),
+                          ('movie5.html', 'Making Mr. Right', 1987, 1584970),
+                          ('movie6.html', 'Titanic (1997 film)', 1997,
+                           2.187 * 1e9)])
+def test_movie_infobox(file_name, name, year, grossing):
+    regions = extract_regions(read_page(file_name))
+    url = 'test/%s' % (name.replace(' ', '_'))
+    movie = MovieParser(url).parse_movie_object(
+        parse_infobox(regions.infobox))
+    assert name == movie.name
+    assert year == movie.year
+    assert grossing == movie.total_grossing
+
+
+@pytest.mark.parametrize('file_name, num_casting',
+                         [('movie3.html', 10), ('movie1.html', 16),
+                          ('movie2.html', 5), ('movie4.html', 34),
+                          ('movie5.html', 0), ('movie6.html', 10)])
+def test_movie_casting(file_name, num_casting):
+    regions = extract_regions(read_page(file_name))
+    casts = MovieParser('test').parse_cast_list(regions.cast_list)
+    assert num_casting == len(casts)
+
+
+@pytest.mark.parametrize('file_name, num_films',
+                         [('actor3.html', 36), ('actor5.html', 26),
+                          ('actor6.html', 33)])
+def test_actor_movies(file_name, num_films):
+    regions = extract_regions(read_page(file_name))
+    assert 1 == regions.filmography_count
+    movies = ActorParser('test').parse_filmography_table(regions.film_table)
+    assert num_films == len(movies)
+
+
+@pytest.mark.parametrize('file_name, age',
+                         [('actor3.html', 36), ('actor2.html', 80),
+                          ('actor4.html', 49)])
+def test_actor_age(file_name, age):
+    record = stream_extract_page('/wiki/Test', read_page(file_name))
+    assert PageType.ACTOR == record.page_type
+    assert age == record.attributes['age']
+
+
+def test_other_page_regions():
+    regions = extract_regions(read_page('other.html'))
+    infobox = parse_infobox(regions.infobox) if regions.infobox else {}
+    assert PageType.OTHER == parse_page_type(infobox)
+    assert regions.cast_list is None
+    assert regions.film_table is None
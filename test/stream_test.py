@@ -0,0 +1,68 @@
+import gzip
+import json
+
+import pytest
+
+from scraper.graph.compact import CompactGraph
+from scraper.graph.graph import Graph
+from scraper.graph.stream import is_jsonl, load_graph, open_text, save_graph
+from test.conftest import make_elements
+
+
+@pytest.mark.parametrize('graph_type', [Graph, CompactGraph])
+@pytest.mark.parametrize('name', ['out.json', 'out.json.gz', 'out.jsonl',
+                                  'out.jsonl.gz'])
+def test_roundtrip(tmp_path, graph_type, name):
+    graph = make_elements(graph_type)[0]
+    path = str(tmp_path / name)
+    save_graph(graph, path)
+    loaded = graph_type()
+    assert load_graph(loaded, path)
+    assert json.loads(graph.serialize()) == json.loads(loaded.serialize())
+    if name.endswith('.gz'):
+        with gzip.open(path, 'rt') as f:
+            assert f.readline()
+
+
+def test_jsonl_streams(tmp_path, monkeypatch):
+    graph = make_elements(Graph)[0]
+    path = str(tmp_path / 'out.jsonl')
+    monkeypatch.setattr(Graph, 'serialize', None)
+    monkeypatch.setattr(Graph, 'deserialize', None)
+    save_graph(graph, path)
+    with open(path) as f:
+        lines = f.read().splitlines()
+    assert 1 + 5 + 3 == len(lines)
+    assert [2, 0, 0.1] == json.loads(lines[6])
+    assert load_graph(Graph(), path)
+
+
+@pytest.mark.parametrize('content', ['', '{"format": "other"}\n',
+                                     '{"format": "movie-graph", '
+                                     '"version": 2}\n'])
+def test_invalid_header(tmp_path, content):
+    path = tmp_path / 'out.jsonl'
+    path.write_text(content)
+    assert not load_graph(Graph(), str(path))
+
+
+def test_is_jsonl():
+    assert is_jsonl('out.jsonl')
+    assert is_jsonl('out.jsonl.gz')
+    assert is_jsonl('out.jsonl.zst')
+    assert not is_jsonl('out.json.gz')
+
+
+def test_zstd(tmp_path):
+    path = str(tmp_path / 'out.jsonl.zst')
+    try:
+        import zstandard  # noqa: F401
+    except ImportError:
+        with pytest.raises(ValueError):
+            open_text(path, 'w')
+        return
+    graph = make_elements(Graph)[0]
+    save_graph(graph, path)
+    loaded = Graph()
+    assert load_graph(loaded, path)
+    assert json.loads(graph.serialize()) == json.loads(loaded.serialize())